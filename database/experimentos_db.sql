@@ -142,6 +142,25 @@ AUTO_INCREMENT = 45971
 DEFAULT CHARACTER SET = utf8;
 
 
+-- -----------------------------------------------------
+-- Table `experimentos`.`interpsec_summary`
+-- Statistics of the interpsec measurements of each (data, parameters,
+-- instance type), updated by every new measurement (Welford's algorithm)
+-- -----------------------------------------------------
+CREATE TABLE IF NOT EXISTS `experimentos`.`interpsec_summary` (
+  `data_iddata` INT(11) NOT NULL,
+  `parameters_idparameters` INT(11) NOT NULL,
+  `instance_name` VARCHAR(45) NOT NULL,
+  `count` BIGINT NOT NULL DEFAULT 0,
+  `mean` DOUBLE NOT NULL DEFAULT 0,
+  `m2` DOUBLE NOT NULL DEFAULT 0,
+  `min` DOUBLE NULL DEFAULT NULL,
+  `max` DOUBLE NULL DEFAULT NULL,
+  PRIMARY KEY (`data_iddata`, `parameters_idparameters`, `instance_name`))
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8;
+
+
 SET SQL_MODE=@OLD_SQL_MODE;
 SET FOREIGN_KEY_CHECKS=@OLD_FOREIGN_KEY_CHECKS;
 SET UNIQUE_CHECKS=@OLD_UNIQUE_CHECKS;
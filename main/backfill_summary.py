@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2019 Nicholas Torres Okita <nicholas.okita@ggaunicamp.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+# This file builds the interpsec_summary table (see rds_operations.py) from
+# all the performance measurements stored in the interpsec table. The summary
+# of a data set and parameters is rebuilt when it is first read and does not
+# match the measurements (see rds_operations.check_interpsec_summary), this
+# script rebuilds every one at once, and can be executed again at any time:
+#
+# python backfill_summary.py
+
+import rds_operations
+
+# function main
+#
+# Recomputes interpsec_summary in the database configured in rds_config.py
+def main():
+    conn = rds_operations.rds_connect()
+    rds_operations.rebuild_interpsec_summary(conn)
+    rows = rds_operations.execute(conn, "select count(*), sum(`count`) from experimentos.interpsec_summary;")
+    print("interpsec_summary: " + str(rows[0][0]) + " experiments, " + str(rows[0][1]) + " measurements")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2019 Nicholas Torres Okita <nicholas.okita@ggaunicamp.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+# This file benchmarks the control loop of the Job Manager (to_execute.py) at
+# fleet scale without AWS. The real job_manager and instance_operations run
+# against the emulated EC2 and CloudWatch clients of emulator.py, on its
+# virtual clock that advances one interval per tick:
+#
+# - the spot price of each (type, az) follows a geometric random walk, one
+# step per tick, and Spot instances are interrupted when it goes above their
+# bid
+# - each worker reports the performance of its type (see make_types)
+# - a SQLite database (see rds_sqlite.py) has the performance of each type
+#
+# For each fleet size the ticks are timed and the results (tick latency
+# percentiles, API calls per tick as counted by instrumentation.attach_boto3,
+# database queries per tick and memory per worker) are written to a JSON
+# file. Given the file of a previous version (baseline), the change of the
+# latency of each fleet size is printed, so regressions in the hot path show
+# up between versions:
+#
+# python benchmark.py fleet=10,100,1000,5000 types=20 volatility=0.05 ticks=20 output=benchmark.json
+# python benchmark.py ... baseline=benchmark_old.json
+
+import contextlib
+import gc
+import io
+import json
+import logging
+import math
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import boto3
+import numpy as np
+import emulator
+import pseudo_instance_operations
+import rds_operations
+from instance_operations import instance_operations
+from instrumentation import instrumentation
+from to_execute import ALL_ZONES
+from to_execute import job_manager
+
+# Percentiles of the tick latency reported
+PERCENTILES = (50, 90, 95, 99)
+
+# Start of the virtual clock
+CLOCK_START = datetime(2020, 1, 1)
+
+# function make_types
+# \param count: number of instance types
+# \param rng: random.Random object
+# \return {instance_type: (interpsec, base price)}
+def make_types(count, rng):
+    types = {}
+    for i in range(count):
+        perf = rng.uniform(20, 200)
+        types["bench{}.xlarge".format(i)] = (perf, perf * rng.uniform(0.0005, 0.002))
+
+    return types
+
+# function make_prices
+# \param types: {instance_type: (interpsec, base price)}
+# \param volatility: standard deviation of the relative change of each spot
+# price per step
+# \param steps: number of prices of each (type, az)
+# \param step_seconds: time between two prices
+# \param rng: random.Random object
+# \return prices of every (type, az) in the format of
+# pseudo_instance_operations.load_prices
+def make_prices(types, volatility, steps, step_seconds, rng):
+    start = pseudo_instance_operations.to_epoch(CLOCK_START)
+    times = [start + step * step_seconds for step in range(steps)]
+    series = {}
+    for instance_type, (perf, price) in types.items():
+        for az in ALL_ZONES:
+            prices = [price]
+            for step in range(1, steps):
+                prices.append(prices[-1] * math.exp(rng.gauss(0, volatility)))
+            series[(instance_type, az)] = (times, prices)
+
+    return series
+
+# function make_database
+# \param path: SQLite database file
+# \param types: {instance_type: (interpsec, base price)}
+# \param target_tasks: number of tasks of the experiment
+# \param rng: random.Random object
+# \return (connection, data hash)
+def make_database(path, types, target_tasks, rng):
+    conn = rds_operations.sqlite_connect(path)
+    data_hash = "benchmark"
+    rds_operations.execute(conn, "insert into experimentos.data(`name`,`hash`) values(%s,%s);",
+                           ("benchmark", data_hash), write=True)
+    iddata = rds_operations.get_iddata(conn, data_hash)
+    idparameters = rds_operations.get_idparameters(conn, 1, 1, 1, 1, 1)
+    rds_operations.insert_interpols(conn, idparameters, iddata, target_tasks)
+
+    measurements = []
+    for instance_type, (perf, price) in types.items():
+        rds_operations.execute(conn, "insert into experimentos.instance(`name`) values(%s);", (instance_type,),
+                               write=True)
+        idexperiment = rds_operations.get_idexperiment(conn, iddata, idparameters, instance_type)
+        measurements.extend((idexperiment, perf * (1 + rng.gauss(0, 0.05))) for i in range(20))
+    rds_operations.insert_interpsec_many(conn, measurements)
+
+    return conn, data_hash, idparameters
+
+# function emulated_manager
+# \param workers: fleet size (nodes)
+# \param config: benchmark configuration (see main)
+# \param path: SQLite database file
+# \return (job_manager, emulated_world, instrumentation)
+#
+# Context manager that installs the emulated clients and clock (see
+# emulator.installed) while the job manager is used.
+@contextlib.contextmanager
+def emulated_manager(workers, config, path):
+    rng = random.Random(config["seed"])
+    types = make_types(config["types"], rng)
+    interval = config["interval"] * 60
+    clock = emulator.virtual_clock(CLOCK_START)
+    series = make_prices(types, config["volatility"], config["ticks"] + 1, interval, rng)
+    world = emulator.emulated_world(clock, series, {instance_type: (perf, perf * 0.05)
+                                                    for instance_type, (perf, price) in types.items()},
+                                    boot_time=0, fulfil_delay=0, rng=rng)
+
+    # Budget such that the target ratio is a fraction (pressure) of the
+    # median interpolations per dollar, so that some types are replaced
+    target_tasks = 1e12
+    value = np.median([perf / (price / 3600) for perf, price in types.values()])
+    budget = target_tasks / (config["pressure"] * value)
+
+    # (get_idexperiment prints every experiment created)
+    with contextlib.redirect_stdout(io.StringIO()):
+        conn, data_hash, idparameters = make_database(path, types, target_tasks, rng)
+
+    logger = logging.getLogger("benchmark")
+    logger.setLevel(logging.ERROR)
+
+    instruments = instrumentation()
+    instruments.attach_boto3(world)
+    instruments.attach_database()
+    with emulator.installed(world):
+        ops = instance_operations(logger, interval)
+        manager = job_manager(logger, ops, boto3.client('cloudwatch'), conn, data_hash, budget, workers,
+                              config["interval"], config["valid_count"], monitor_workers=config["monitor_workers"],
+                              instruments=instruments, now=clock.now, idparameters=idparameters)
+        try:
+            yield manager, world, instruments
+        finally:
+            manager.monitor.executor.shutdown()
+
+# function run_ticks
+# \param manager: job_manager object
+# \param world: emulated_world object
+# \param ticks: number of ticks
+# \return list with the time of each tick in seconds
+def run_ticks(manager, world, ticks):
+    latencies = []
+    for i in range(ticks):
+        start = time.perf_counter()
+        manager.tick()
+        latencies.append(time.perf_counter() - start)
+
+        world.clock.sleep(manager.interval * 60)
+
+    return latencies
+
+# function measure_memory
+# \param workers: fleet size
+# \param config: benchmark configuration
+# \param path: SQLite database file
+# \return bytes allocated by the job manager (to_execute.py and
+# fleet_state.py) still alive after the ticks, per worker
+def measure_memory(workers, config, path):
+    tracemalloc.start()
+    try:
+        with emulated_manager(workers, config, path) as (manager, world, instruments):
+            run_ticks(manager, world, 2)
+            gc.collect()
+            snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(True, "*to_execute.py"),
+                                                                  tracemalloc.Filter(True, "*fleet_state.py")])
+            size = sum(stat.size for stat in snapshot.statistics("filename"))
+            fleet_size = max(1, len(manager.fleet))
+    finally:
+        tracemalloc.stop()
+
+    return size / float(fleet_size)
+
+# function run_scenario
+# \param workers: fleet size
+# \param config: benchmark configuration
+# \return dictionary with the results of the fleet size
+def run_scenario(workers, config):
+    directory = tempfile.mkdtemp(prefix="cloudpits_bench_")
+    try:
+        with emulated_manager(workers, config, os.path.join(directory, "timing.db")) as \
+                (manager, world, instruments):
+            latencies = run_ticks(manager, world, config["ticks"])
+
+        ticks = float(config["ticks"])
+        api_calls = {service + "." + operation: count for (service, operation), count in instruments.api_calls.items()}
+        steady = np.asarray(latencies[1:] if len(latencies) > 1 else latencies)
+        result = {"workers": workers,
+                  "fleet": len(manager.fleet),
+                  "ticks": config["ticks"],
+                  "first_tick_seconds": latencies[0],
+                  "tick_seconds": {"p" + str(p): float(np.percentile(steady, p)) for p in PERCENTILES},
+                  "tick_seconds_mean": float(steady.mean()),
+                  "api_calls_per_tick": {name: count / ticks for name, count in sorted(api_calls.items())},
+                  "api_calls_per_tick_total": sum(api_calls.values()) / ticks,
+                  "db_queries_per_tick": {kind: count / ticks for kind, count in sorted(instruments.db_queries.items())},
+                  "phase_seconds_per_tick": {phase: seconds / ticks
+                                             for phase, seconds in sorted(instruments.phase_seconds.items())},
+                  "memory_bytes_per_worker": measure_memory(workers, config, os.path.join(directory, "memory.db"))}
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return result
+
+# function compare
+# \param results: results of this run
+# \param baseline: results of a previous run (same format)
+# Prints the change of the tick latency (p50 and p95) of each fleet size
+def compare(results, baseline):
+    previous = {result["workers"]: result for result in baseline["results"]}
+    print("WORKERS\tP50(old)\tP50(new)\tCHANGE\tP95(old)\tP95(new)\tCHANGE")
+    for result in results["results"]:
+        old = previous.get(result["workers"])
+        if old is None:
+            continue
+        line = [str(result["workers"])]
+        for p in ("p50", "p95"):
+            before, after = old["tick_seconds"][p], result["tick_seconds"][p]
+            line += ["{:.6f}".format(before), "{:.6f}".format(after), "{:+.1f}%".format(100 * (after / before - 1))]
+        print("\t".join(line))
+
+# function get_from_input
+#
+# \param _string: String to be searched from input
+# \param input_dict: Input dictionary of pairs key=value
+# \return Value stored for _string or -1 if it does not exist
+def get_from_input(_string, input_dict):
+    if _string in input_dict:
+        return input_dict[_string]
+    else:
+        return -1
+
+# function main
+# \param (command line input) fleet : comma separated fleet sizes (default 10,100,1000,5000)
+# \param (command line input) types : number of instance types (default 20)
+# \param (command line input) volatility : standard deviation of the relative change of the spot prices per tick
+# (default 0.05)
+# \param (command line input) pressure : target ratio as a fraction of the median interpolations per dollar
+# (default 0.8)
+# \param (command line input) ticks : number of ticks for each fleet size (default 20)
+# \param (command line input) interval : interval of the control loop in minutes (default 1)
+# \param (command line input) valid_count : validity counter of the instances (default 1)
+# \param (command line input) monitor_workers : concurrent monitoring requests (default 16)
+# \param (command line input) seed : random seed (default 1)
+# \param (command line input) output : JSON file with the results (default benchmark.json)
+# \param (command line input) baseline : optional JSON file of a previous run to compare with
+def main():
+    input_dict = {}
+    for cur in sys.argv:
+        if '=' in cur:
+            key, val = cur.split('=')
+            input_dict.update({key: val})
+
+    defaults = {"fleet": "10,100,1000,5000", "types": 20, "volatility": 0.05, "pressure": 0.8, "ticks": 20,
+                "interval": 1, "valid_count": 1, "monitor_workers": 16, "seed": 1, "output": "benchmark.json"}
+    config = {}
+    for key, default in defaults.items():
+        value = get_from_input(key, input_dict)
+        config[key] = type(default)(value) if value != -1 else default
+    fleet_sizes = [int(workers) for workers in config.pop("fleet").split(",")]
+    output = config.pop("output")
+
+    logging.basicConfig(level=logging.ERROR)
+
+    results = {"created": datetime.utcnow().isoformat(),
+               "python": platform.python_version(),
+               "numpy": np.__version__,
+               "config": config,
+               "results": []}
+    for workers in fleet_sizes:
+        result = run_scenario(workers, config)
+        results["results"].append(result)
+        print("{} workers: p50 {:.4f}s p95 {:.4f}s, {:.1f} API calls/tick, {:.0f} bytes/worker".format(
+            workers, result["tick_seconds"]["p50"], result["tick_seconds"]["p95"],
+            result["api_calls_per_tick_total"], result["memory_bytes_per_worker"]))
+
+    with open(output, "w") as output_f:
+        json.dump(results, output_f, indent=2, sort_keys=True)
+    print("Results written to " + output)
+
+    baseline = get_from_input("baseline", input_dict)
+    if (baseline != -1):
+        with open(baseline) as baseline_f:
+            compare(results, json.load(baseline_f))
+
+if __name__ == "__main__":
+    main()
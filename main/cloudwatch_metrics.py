@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2019 Nicholas Torres Okita <nicholas.okita@ggaunicamp.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+# This file gets the performance metrics reported by the worker instances to
+# CloudWatch (see README.md). Instead of one get_metric_statistics request per
+# instance and metric, the metrics of all instances are requested together
+# with get_metric_data, which accepts up to 500 queries per request.
+
+# Namespace of the metrics reported by the workers
+NAMESPACE = 'Performance'
+
+# Metrics collected for each instance and the statistic used for each one
+METRICS = [('perf_sec', 'Average'),
+           ('tasks_completed', 'Maximum'),
+           ('perf_sec_stdev', 'Average')]
+
+# Maximum number of queries in a single get_metric_data request
+MAX_QUERIES_PER_REQUEST = 500
+
+class metrics_collector:
+
+    # function __init__
+    # \param cloudwatch: CloudWatch client
+    # \param period: period of the datapoints in seconds
+    def __init__(self, cloudwatch, period=60):
+        self.cloudwatch = cloudwatch
+        self.period = period
+
+    # function build_queries
+    # \param instances: list of (instance_id, instance_type) pairs
+    # \return (list of queries, dictionary query id -> (instance_id, metric))
+    #
+    # Creates one query for each instance and metric. Query ids must start
+    # with a lower case letter, so they are numbered instead of using the
+    # instance ids.
+    def build_queries(self, instances):
+        queries = []
+        query_ids = {}
+        for i, (instance_id, instance_type) in enumerate(instances):
+            for j, (metric, statistic) in enumerate(METRICS):
+                query_id = "m{}_{}".format(i, j)
+                query_ids[query_id] = (instance_id, metric)
+                queries.append({'Id': query_id,
+                                'MetricStat': {
+                                    'Metric': {
+                                        'Namespace': NAMESPACE,
+                                        'MetricName': metric,
+                                        'Dimensions': [{'Name': 'Instance Id', 'Value': instance_id},
+                                                       {'Name': 'Type', 'Value': instance_type}]
+                                    },
+                                    'Period': self.period,
+                                    'Stat': statistic
+                                },
+                                'ReturnData': True})
+
+        return queries, query_ids
+
+    # function fetch
+    # \param queries: list of at most MAX_QUERIES_PER_REQUEST queries
+    # \param start_time: datetime of the first datapoint
+    # \param end_time: datetime of the last datapoint
+    # \return list of MetricDataResults of all pages
+    def fetch(self, queries, start_time, end_time):
+        results = []
+        paginator = self.cloudwatch.get_paginator('get_metric_data')
+        pages = paginator.paginate(MetricDataQueries=queries,
+                                   StartTime=start_time,
+                                   EndTime=end_time,
+                                   ScanBy='TimestampDescending')
+        for page in pages:
+            results.extend(page['MetricDataResults'])
+
+        return results
+
+    # function chunks
+    # \param queries: list of queries
+    # \return list of lists with at most MAX_QUERIES_PER_REQUEST queries
+    def chunks(self, queries):
+        return [queries[i:i + MAX_QUERIES_PER_REQUEST] for i in range(0, len(queries), MAX_QUERIES_PER_REQUEST)]
+
+    # function merge
+    # \param results: list of MetricDataResults
+    # \param query_ids: dictionary query id -> (instance_id, metric)
+    # \param series: dictionary where the time series are stored
+    # \return series, as {instance_id: {metric: [(timestamp, value), ...]}},
+    # most recent datapoint first
+    def merge(self, results, query_ids, series):
+        for result in results:
+            if len(result['Values']) == 0:
+                continue
+            instance_id, metric = query_ids[result['Id']]
+            points = series.setdefault(instance_id, {}).setdefault(metric, [])
+            points.extend(zip(result['Timestamps'], result['Values']))
+            points.sort(key=lambda point: point[0], reverse=True)
+
+        return series
+
+    # function collect
+    # \param instances: list of (instance_id, instance_type) pairs
+    # \param start_time: datetime of the first datapoint
+    # \param end_time: datetime of the last datapoint
+    # \return {instance_id: {metric: [(timestamp, value), ...]}}, most recent
+    # datapoint first. Instances without datapoints are not in the result.
+    def collect(self, instances, start_time, end_time):
+        queries, query_ids = self.build_queries(instances)
+        series = {}
+        for chunk in self.chunks(queries):
+            self.merge(self.fetch(chunk, start_time, end_time), query_ids, series)
+
+        return series
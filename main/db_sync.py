@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2019 Nicholas Torres Okita <nicholas.okita@ggaunicamp.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+# This file copies the experimentos database between the MySQL server
+# configured in rds_config.py and a local SQLite file (see rds_sqlite.py):
+#
+# python db_sync.py export experimentos.db   (MySQL -> SQLite)
+# python db_sync.py import experimentos.db   (SQLite -> MySQL)
+#
+# The ids of the two databases are independent (both assign them when a row
+# is inserted), so rows are matched by their content instead: data sets by
+# hash, instance types by name, parameters by their values and experiments by
+# (data set, parameters, instance type). The ones missing in the destination
+# are inserted with new ids, and the measurements (interpols and interpsec)
+# are inserted with the ids of the destination, except the ones it already
+# has. Running the copy again after new measurements were stored only copies
+# the new ones. Everything is written in a single transaction, and the
+# interpsec_summary table is not copied, it is rebuilt in the destination.
+
+import collections
+import sys
+import rds_operations
+
+# Tables of the experimentos database, in an order that respects the foreign
+# keys (referenced tables first), with their id column (None if the id is the
+# natural key), the other columns, the columns that are ids of another table,
+# the columns that identify a row and whether the rows are measurements (that
+# may be repeated)
+TABLES = [("data", "iddata", ["name", "hash"], {}, ["hash"], False),
+          ("instance", None, ["name"], {}, ["name"], False),
+          ("parameters", "idparameters", ["aph", "apm", "window", "np", "gens"], {},
+           ["aph", "apm", "window", "np", "gens"], False),
+          ("experiment", "idperformance", ["data_iddata", "parameters_idparameters", "instance_name"],
+           {"data_iddata": "data", "parameters_idparameters": "parameters"},
+           ["data_iddata", "parameters_idparameters", "instance_name"], False),
+          ("interpols", "idinterpols", ["parameters_idparameters", "data_iddata", "interpols", "datetime"],
+           {"parameters_idparameters": "parameters", "data_iddata": "data"},
+           ["parameters_idparameters", "data_iddata", "interpols", "datetime"], True),
+          ("interpsec", "idinterpsec", ["interpsec", "experiment_idperformance", "creationDate"],
+           {"experiment_idperformance": "experiment"}, ["interpsec", "experiment_idperformance", "creationDate"],
+           True)]
+
+# Number of rows inserted by each executemany
+BATCH_SIZE = 1000
+
+# function natural_key
+# \param values: values of the columns that identify a row
+# \return the values as compared between the databases: floats with 6
+# significant digits (the FLOAT columns of MySQL keep single precision) and
+# dates as strings
+def natural_key(values):
+    key = []
+    for value in values:
+        if isinstance(value, float):
+            value = float("%.6g" % value)
+        elif value is not None and not isinstance(value, (int, str)):
+            value = str(value)
+        key.append(value)
+
+    return tuple(key)
+
+# function read_rows
+# \param conn: Database connection object
+# \param table: table name
+# \param columns: columns read
+# \return every row of the table
+def read_rows(conn, table, columns):
+    return rds_operations.execute(conn, "select {} from experimentos.{};".format(
+        ",".join("`" + column + "`" for column in columns), table))
+
+# function copy_table
+# \param source: connection to the database the rows are read from
+# \param destination: connection to the database the rows are written to
+# \param table: entry of TABLES
+# \param ids: dictionary mapping each table copied before to a dictionary
+# from the ids of the source to the ones of the destination (the ones of this
+# table are added)
+# \return (number of rows read from the source, number of rows inserted)
+def copy_table(source, destination, table, ids):
+    name, id_column, columns, references, key_columns, measurements = table
+    id_columns = [id_column] if id_column is not None else []
+    key_index = [columns.index(column) for column in key_columns]
+
+    # Rows of the source with the ids of the destination
+    rows = []
+    for row in read_rows(source, name, id_columns + columns):
+        source_id = row[0]
+        values = list(row[len(id_columns):])
+        for column, referenced in references.items():
+            i = columns.index(column)
+            if values[i] not in ids[referenced]:
+                print(name + ": skipping row " + str(source_id) + " (" + column + " " + str(values[i]) +
+                      " does not exist)")
+                break
+            values[i] = ids[referenced][values[i]]
+        else:
+            rows.append((source_id, values))
+
+    insert = "insert into experimentos.{}({}) values({});".format(
+        name, ",".join("`" + column + "`" for column in columns), ",".join(["%s"] * len(columns)))
+    existing = read_rows(destination, name, id_columns + columns)
+
+    if measurements:
+        # Each measurement of the destination matches one of the source
+        present = collections.Counter(natural_key(row[len(id_columns) + i] for i in key_index) for row in existing)
+        new = []
+        for source_id, values in rows:
+            key = natural_key(values[i] for i in key_index)
+            if present[key] > 0:
+                present[key] -= 1
+            else:
+                new.append(values)
+        with destination.cursor() as cur:
+            for i in range(0, len(new), BATCH_SIZE):
+                cur.executemany(insert, new[i:i + BATCH_SIZE])
+        return len(rows), len(new)
+
+    found = {}
+    for row in existing:
+        found.setdefault(natural_key(row[len(id_columns) + i] for i in key_index), row[0])
+    ids[name] = {}
+    inserted = 0
+    for source_id, values in rows:
+        key = natural_key(values[i] for i in key_index)
+        if key not in found:
+            new_id = rds_operations.execute(destination, insert, values, write=True)
+            found[key] = new_id if id_column is not None else values[0]
+            inserted += 1
+        ids[name][source_id] = found[key]
+
+    return len(rows), inserted
+
+# function copy_database
+# \param source: connection to the database the rows are read from
+# \param destination: connection to the database the rows are written to
+def copy_database(source, destination):
+    ids = {}
+    destination.begin()
+    try:
+        for table in TABLES:
+            rows, inserted = copy_table(source, destination, table, ids)
+            print(table[0] + ": " + str(rows) + " rows, " + str(inserted) + " inserted")
+        destination.commit()
+    except:
+        destination.rollback()
+        raise
+    rds_operations.rebuild_interpsec_summary(destination)
+
+# function main
+# \param (command line argument) direction: "export" (MySQL to SQLite) or "import" (SQLite to MySQL)
+# \param (command line argument) path: SQLite database file
+def main():
+    if len(sys.argv) != 3 or sys.argv[1] not in ("export", "import"):
+        print("Usage: python db_sync.py export|import experimentos.db")
+        sys.exit(1)
+
+    mysql = rds_operations.mysql_connect()
+    sqlite = rds_operations.sqlite_connect(sys.argv[2])
+
+    if sys.argv[1] == "export":
+        copy_database(mysql, sqlite)
+    else:
+        copy_database(sqlite, mysql)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2019 Nicholas Torres Okita <nicholas.okita@ggaunicamp.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+# This file contains the scaling policy of the Job Manager, shared by
+# to_execute.py (job_manager) and simulation.py (simulator). The policy has no
+# side effects: it receives the fleet (instance_record objects, see
+# fleet_state.py), the profile of each instance type, the spot prices and the
+# progress of the execution, and returns what should be done (validity
+# counters, instances to terminate, candidates and Spot requests). Querying
+# AWS or the database, terminating and creating instances and logging are left
+# to the drivers, so that the same policy runs in production, in the emulator
+# and in the simulations.
+#
+# Each iteration of the control loop is:
+#
+# 1. target_ratio: interpolations per dollar needed to finish within budget
+# 2. verify: the validity counter of the instances below the target ratio (or
+# without measurements) is decreased, the one of the others is increased (up
+# to valid_count), and the instances whose counter reached zero are
+# terminated
+# 3. select: if there are less than target_nodes instances, the candidates
+# above the target ratio, increasing the budget by 10% until there is one
+# 4. plan_wave: the missing instances are spread over the candidates (best
+# first), wave_size instances each
+
+import selection
+from fleet_state import instance_record
+
+# Number of times the list of candidates is gone through while launching
+# instances in one iteration
+MAX_LAPS = 5
+
+class decision_engine:
+
+    # function __init__
+    # \param zones: list of availability zones (columns of the price matrix)
+    # \param target_nodes: number of instances running
+    # \param valid_count: number of iterations an instance may be below the
+    # target ratio before being terminated
+    # \param excluded: instance types that are never selected
+    # \param overhead: cost added to every spot price (disk)
+    def __init__(self, zones, target_nodes, valid_count=1, excluded=(), overhead=selection.DISK_COST):
+        self.zones = zones
+        self.target_nodes = target_nodes
+        self.valid_count = valid_count
+        self.excluded = frozenset(excluded)
+        self.overhead = overhead
+        self.wave_size = max(1, int(target_nodes/5))
+
+    # function target_ratio
+    # \param target_tasks: tasks left
+    # \param in_budget: budget in dollars
+    # \param spent_sofar: money spent so far
+    # \return tasks left per dollar left
+    def target_ratio(self, target_tasks, in_budget, spent_sofar):
+        return target_tasks / (in_budget - spent_sofar)
+
+    # function verify
+    # \param fleet: running instances (instance_record)
+    # \param target_ratio: tasks left per dollar left
+    # \return (list of (instance_record, new validity counter), list of
+    # instance_record to be terminated)
+    #
+    # Stale instances (no current information) are left for the next
+    # iteration. The records are not changed.
+    def verify(self, fleet, target_ratio):
+        valid = []
+        terminate = []
+        for inst in fleet:
+            if inst.stale:
+                continue
+
+            if (inst.performance_negative/(inst.price/3600) < target_ratio or inst.performance_negative == -1):
+                counter = inst.valid - 1
+            else:
+                counter = min(inst.valid + 1, self.valid_count)
+            valid.append((inst, counter))
+
+            if (counter <= 0):
+                terminate.append(inst)
+
+        return valid, terminate
+
+    # function select
+    # \param at: function (instance_type, az) returning the running instances
+    # (instance_record) of that pair, after terminating the ones returned by
+    # verify (fleet_state.at)
+    # \param profile: (instance types, interpsec, stddev) as returned by
+    # selection.profile_arrays
+    # \param prices: matrix (types x zones) with the spot prices, as returned by
+    # selection.price_matrix
+    # \param target_tasks: tasks left
+    # \param in_budget: budget in dollars
+    # \param spent_sofar: money spent so far
+    # \return (candidates, budget, increases) where the candidates are
+    # instance_record objects, best worst case performance first, and budget is
+    # in_budget increased by 10% increases times, as many as needed to have a
+    # candidate
+    #
+    # The running instances of a (type, az) pair that is a candidate are
+    # candidates themselves (with their measured performance), the pairs
+    # without running instances are "inactive" candidates. If no pair has a
+    # price, there are no candidates and the budget is left unchanged.
+    def select(self, at, profile, prices, target_tasks, in_budget, spent_sofar):
+        instance_types, interpsec, stddev_interpsec = profile
+        allowed = None
+        if self.excluded:
+            allowed = [instance_type not in self.excluded for instance_type in instance_types]
+
+        if len(selection.score_candidates(interpsec, stddev_interpsec, prices, float("-inf"), self.overhead,
+                                          allowed)) == 0:
+            return [], in_budget, 0
+
+        candidates = []
+        increases = 0
+        while len(candidates) == 0:
+            target_ratio = self.target_ratio(target_tasks, in_budget, spent_sofar)
+
+            # Running instances already among the candidates
+            chosen = set()
+            for cand in selection.score_candidates(interpsec, stddev_interpsec, prices, target_ratio, self.overhead,
+                                                   allowed):
+                instance_type = instance_types[cand['type_idx']]
+                az = self.zones[cand['az_idx']]
+
+                temp = at(instance_type, az)
+                if (len(temp) == 0):
+                    candidates.append(instance_record("inactive", instance_type, az, float(cand['price']),
+                                                      float(cand['interpsec'])))
+                else:
+                    for inst in temp:
+                        if (inst.instance_id not in chosen):
+                            chosen.add(inst.instance_id)
+                            candidates.append(inst)
+
+            candidates.sort(key=lambda cand: cand.performance_negative, reverse=True)
+
+            if (len(candidates) == 0):
+                in_budget += in_budget / 10
+                increases += 1
+
+        return candidates, in_budget, increases
+
+    # function plan_wave
+    # \param candidates: candidates returned by select
+    # \param missing: number of instances to be launched
+    # \param position: index of the next candidate (0 in the first wave)
+    # \return (requests, position, laps) where requests is a list of
+    # (instance_type, az, price, count), position the index of the candidate
+    # of the next wave and laps how many times the list of candidates was gone
+    # through
+    #
+    # The drivers launch waves until there are target_nodes instances or the
+    # candidates were gone through MAX_LAPS times.
+    def plan_wave(self, candidates, missing, position=0):
+        requests = {}
+        laps = 0
+        while missing > 0 and len(candidates) > 0:
+            cand = candidates[position]
+            key = (cand.instance_type, cand.instance_az)
+            count = min(missing, self.wave_size)
+            if key not in requests:
+                requests[key] = [cand.price, 0]
+            requests[key][1] += count
+            missing -= count
+
+            position = (position + 1) % len(candidates)
+            if position == 0:
+                laps += 1
+
+        return [(instance_type, az, price, count) for (instance_type, az), (price, count) in requests.items()], \
+            position, laps
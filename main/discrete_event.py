@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2019 Nicholas Torres Okita <nicholas.okita@ggaunicamp.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+# This file contains a minimal discrete event engine used by the simulation.
+# Events are kept in a priority queue ordered by (time, priority, insertion
+# order) and the virtual clock jumps directly from one event to the next, so
+# no time is spent waiting between them.
+
+import heapq
+import itertools
+
+class event_queue:
+
+    # function __init__
+    # \param start: initial value of the virtual clock
+    def __init__(self, start=0):
+        self.now = start
+        self.heap = []
+        self.sequence = itertools.count()
+        self.stopped = False
+
+    # function schedule
+    # \param time: time of the event (events in the past happen now)
+    # \param kind: kind of the event, used to select its handler
+    # \param payload: object given to the handler
+    # \param priority: events at the same time run in increasing priority
+    # \return event object, which can be given to cancel
+    def schedule(self, time, kind, payload=None, priority=0):
+        event = [max(time, self.now), priority, next(self.sequence), kind, payload, True]
+        heapq.heappush(self.heap, event)
+        return event
+
+    # function cancel
+    # \param event: event returned by schedule
+    # Cancels an event that did not happen yet (it is discarded when popped)
+    def cancel(self, event):
+        if event is not None:
+            event[5] = False
+
+    # function pop
+    # \return (time, kind, payload) of the next event, None if there is none.
+    # The virtual clock is moved to the time of the event.
+    def pop(self):
+        while len(self.heap) > 0:
+            event = heapq.heappop(self.heap)
+            if event[5]:
+                self.now = event[0]
+                return event[0], event[3], event[4]
+
+        return None
+
+    # function stop
+    # Makes run return after the current event
+    def stop(self):
+        self.stopped = True
+
+    # function run
+    # \param handlers: dictionary kind -> function(time, payload)
+    # \param until: optional time limit, later events are kept in the queue
+    # \return virtual time when the run stopped
+    #
+    # Pops and handles events until the queue is empty, a handler calls stop
+    # or the next event is after until.
+    def run(self, handlers, until=None):
+        self.stopped = False
+        while not self.stopped:
+            while len(self.heap) > 0 and not self.heap[0][5]:
+                heapq.heappop(self.heap)
+            if len(self.heap) == 0 or (until is not None and self.heap[0][0] > until):
+                break
+            time, kind, payload = self.pop()
+            handlers[kind](time, payload)
+
+        return self.now
@@ -0,0 +1,624 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2019 Nicholas Torres Okita <nicholas.okita@ggaunicamp.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+# This file contains an emulator of the EC2 and CloudWatch requests made by
+# instance_operations.py and to_execute.py, so that the unmodified Job Manager
+# runs on a single machine, without AWS and on a virtual clock:
+#
+# python emulator.py prices=log_prices.trace db=experimentos.db interval=5 budget=10 data_hash=... nodes=10
+#
+# The keys of the emulator (see main) are followed by the ones of to_execute.py.
+# Instead of the AWS clients, boto3.client and boto3.resource return emulated
+# ones, and the clock of to_execute.py and instance_operations.py (datetime,
+# time.sleep and time.monotonic) is a virtual clock that only moves when they
+# sleep. A run of several days is therefore replayed in the time the Job
+# Manager takes to compute its decisions.
+#
+# The emulated world is driven by:
+#
+# - a price log or price trace (as the simulation), giving the spot price of
+# each (type, az) at each time. Spot requests whose bid is below the price
+# are not fulfilled and running instances are interrupted when the price
+# goes above their bid.
+# - a throughput model: each worker gets a performance (interpolations per
+# second) drawn from the profile of its type in the database (mean and
+# standard deviation) and starts working boot_time seconds after launch. The
+# tasks completed reported to CloudWatch are the interpolations done by every
+# worker (and the Job Manager) so far.
+#
+# Emulated requests: describe_instances, describe_spot_price_history,
+# request_spot_instances, describe_spot_instance_requests,
+# cancel_spot_instance_requests, create_tags, terminate_instances (and
+# Instance(...).terminate of the resource), get_metric_data and
+# get_metric_statistics. Each request emits the before-call event of boto3 on
+# world.events, so that instrumentation.attach_boto3(world) counts them as the
+# requests of a real client.
+
+import collections
+import contextlib
+import random
+import sys
+import threading
+import time as real_time
+from datetime import datetime as real_datetime
+from datetime import timedelta
+from datetime import timezone
+import boto3
+from botocore.hooks import HierarchicalEmitter
+import instance_operations
+import monitoring
+import pseudo_instance_operations
+import rds_config
+import rds_operations
+import to_execute
+
+# Default start of the virtual clock (the start of the simulation)
+CLOCK_START = "2019-02-15T00:00:00"
+
+# Instance type of the Job Manager
+JM_TYPE = "c5.4xlarge"
+
+# Instances described by each page of describe_instances
+INSTANCES_PER_PAGE = 1000
+
+class virtual_clock:
+
+    # function __init__
+    # \param start: datetime (UTC, without time zone) where the clock starts
+    def __init__(self, start):
+        self.current = start
+        self.lock = threading.Lock()
+
+    # function now
+    # \return current time (UTC, without time zone)
+    def now(self):
+        with self.lock:
+            return self.current
+
+    # function monotonic
+    # \return current time in seconds (as time.monotonic)
+    def monotonic(self):
+        return (self.now() - real_datetime(1970, 1, 1)).total_seconds()
+
+    # function sleep
+    # \param seconds: time to advance the clock
+    def sleep(self, seconds):
+        with self.lock:
+            self.current += timedelta(seconds=max(0, seconds))
+
+    # function datetime_class
+    # \return subclass of datetime whose now, utcnow and today return the
+    # time of the clock (the local time is UTC)
+    def datetime_class(self):
+        clock = self
+
+        class emulated_datetime(real_datetime):
+            @classmethod
+            def now(cls, tz=None):
+                if tz is not None:
+                    return clock.now().replace(tzinfo=timezone.utc).astimezone(tz)
+                return clock.now()
+
+            @classmethod
+            def utcnow(cls):
+                return clock.now()
+
+            @classmethod
+            def today(cls):
+                return clock.now()
+
+        return emulated_datetime
+
+    # function time_module
+    # \param real_monotonic: whether monotonic is the real one (used to time
+    # the computation, only sleep is emulated)
+    # \return object with the sleep, monotonic and time functions of the clock
+    def time_module(self, real_monotonic=False):
+        clock = self
+
+        class emulated_time:
+            sleep = staticmethod(clock.sleep)
+            monotonic = staticmethod(real_time.monotonic if real_monotonic else clock.monotonic)
+            perf_counter = staticmethod(real_time.perf_counter)
+            time = staticmethod(clock.monotonic)
+
+        return emulated_time
+
+class emulated_world:
+
+    # function __init__
+    # \param clock: virtual_clock object
+    # \param series: prices loaded by pseudo_instance_operations.load_prices
+    # \param profile: {instance_type: (interpsec, stddev)}
+    # \param boot_time: seconds between the launch and the start of the work
+    # \param fulfil_delay: seconds between a Spot request and its instance
+    # \param rng: random.Random object
+    def __init__(self, clock, series, profile, boot_time=120, fulfil_delay=10, rng=None):
+        self.clock = clock
+        self.prices = pseudo_instance_operations.price_index(series)
+        self.profile = profile
+        self.boot_time = boot_time
+        self.fulfil_delay = fulfil_delay
+        self.rng = rng if rng is not None else random.Random()
+        self.lock = threading.RLock()
+
+        self.instances = collections.OrderedDict()
+        self.spot_requests = {}
+        self.next_id = 0
+        self.tasks_completed = 0.0
+        self.updated = clock.now()
+        self.calls = collections.Counter()
+        # Events of the emulated requests, as the ones of a boto3 session
+        # (see instrumentation.attach_boto3)
+        self.events = HierarchicalEmitter()
+        self.launched = 0
+        self.terminated = 0
+        self.interrupted = 0
+
+        # The Job Manager, running since the start of the clock
+        self.add_instance(JM_TYPE, "us-east-1a", None, tags={"Type": "jobmanager-ondemand"}, bid=None)
+
+    # function call
+    # \param service: AWS service (e.g. ec2)
+    # \param operation: API operation (e.g. DescribeInstances)
+    # Counts a request and emits its before-call event, as a boto3 client
+    def call(self, service, operation):
+        self.calls[service + "." + operation] += 1
+        self.events.emit("before-call.{}.{}".format(service, operation))
+
+    # function new_id
+    # \param prefix: prefix of the id (e.g. "i" or "sir")
+    # \return new unique id
+    def new_id(self, prefix):
+        self.next_id += 1
+        return "{}-{:017x}".format(prefix, self.next_id)
+
+    # function price
+    # \param instance_type: type of the instance
+    # \param az: availability zone
+    # \param when: datetime (the clock time if None)
+    # \return spot price, -1 if there is none
+    def price(self, instance_type, az, when=None):
+        when = self.clock.now() if when is None else when
+        return self.prices.price_at(instance_type, az, pseudo_instance_operations.to_epoch(when))
+
+    # function add_instance
+    # \param instance_type: type of the instance
+    # \param az: availability zone
+    # \param spot_request_id: id of the Spot request (None for On-Demand)
+    # \param tags: dictionary with the tags of the instance
+    # \param bid: maximum price of the Spot request (None for On-Demand)
+    # \return id of the new instance
+    def add_instance(self, instance_type, az, spot_request_id, tags=None, bid=None):
+        mean, stddev = self.profile.get(instance_type, (0.0, 0.0))
+        instance_id = self.new_id("i")
+        self.instances[instance_id] = {"InstanceId": instance_id,
+                                       "InstanceType": instance_type,
+                                       "Placement": {"AvailabilityZone": az},
+                                       "LaunchTime": self.clock.now(),
+                                       "State": {"Name": "running"},
+                                       "SpotInstanceRequestId": spot_request_id,
+                                       "Tags": dict(tags or {}),
+                                       "bid": bid,
+                                       "perf": max(mean * 0.01, self.rng.gauss(mean, stddev)),
+                                       "stddev": stddev}
+        return instance_id
+
+    # function working_seconds
+    # \param instance: emulated instance
+    # \param start: datetime
+    # \param end: datetime
+    # \return seconds of [start, end] in which the instance was working
+    # (after booting)
+    def working_seconds(self, instance, start, end):
+        working_from = instance["LaunchTime"] + timedelta(seconds=self.boot_time)
+        if instance["SpotInstanceRequestId"] is None:
+            working_from = instance["LaunchTime"]
+        return max(0.0, (end - max(start, working_from)).total_seconds())
+
+    # function update
+    # Adds the work done since the last update and interrupts the Spot
+    # instances whose bid is below the current price
+    def update(self):
+        with self.lock:
+            now = self.clock.now()
+            if now <= self.updated:
+                return
+            for instance in self.instances.values():
+                if instance["State"]["Name"] != "running":
+                    continue
+                self.tasks_completed += instance["perf"] * self.working_seconds(instance, self.updated, now)
+
+                if instance["bid"] is not None:
+                    price = self.price(instance["InstanceType"], instance["Placement"]["AvailabilityZone"], now)
+                    if price == -1 or price > instance["bid"]:
+                        instance["State"]["Name"] = "terminated"
+                        self.interrupted += 1
+            self.updated = now
+
+    # function terminate
+    # \param instance_ids: ids of the instances
+    def terminate(self, instance_ids):
+        with self.lock:
+            self.update()
+            for instance_id in instance_ids:
+                instance = self.instances.get(instance_id)
+                if instance is not None and instance["State"]["Name"] == "running":
+                    instance["State"]["Name"] = "terminated"
+                    self.terminated += 1
+
+    # function fulfil
+    # Creates the instances of the open Spot requests whose delay passed and
+    # whose bid is above the current price
+    def fulfil(self):
+        now = self.clock.now()
+        for spot_request in self.spot_requests.values():
+            if spot_request["State"] != "open" or now < spot_request["created"] + timedelta(seconds=self.fulfil_delay):
+                continue
+            spec = spot_request["LaunchSpecification"]
+            instance_type, az = spec["InstanceType"], spec["Placement"]["AvailabilityZone"]
+            price = self.price(instance_type, az)
+            if price == -1:
+                spot_request["Status"]["Code"] = "capacity-not-available"
+            elif price > spot_request["bid"]:
+                spot_request["Status"]["Code"] = "price-too-low"
+            else:
+                spot_request["InstanceId"] = self.add_instance(instance_type, az, spot_request["SpotInstanceRequestId"],
+                                                               bid=spot_request["bid"])
+                spot_request["State"] = "active"
+                spot_request["Status"]["Code"] = "fulfilled"
+                self.launched += 1
+
+    # function metric_value
+    # \param instance_id: id of the instance
+    # \param metric: perf_sec, perf_sec_stdev or tasks_completed
+    # \return value reported by the worker, None if it did not report yet
+    # (still booting or not running)
+    def metric_value(self, instance_id, metric):
+        instance = self.instances.get(instance_id)
+        now = self.clock.now()
+        if instance is None or instance["State"]["Name"] != "running" or \
+                self.working_seconds(instance, now - timedelta(seconds=1), now) == 0:
+            return None
+        if metric == "perf_sec":
+            return instance["perf"] * (1 + self.rng.gauss(0, 0.02))
+        if metric == "perf_sec_stdev":
+            return instance["stddev"]
+        return self.tasks_completed
+
+def matches(instance, filters):
+    for f in filters or []:
+        if f["Name"].startswith("tag:"):
+            value = instance["Tags"].get(f["Name"][4:])
+        elif f["Name"] == "instance-state-name":
+            value = instance["State"]["Name"]
+        elif f["Name"] == "instance-type":
+            value = instance["InstanceType"]
+        else:
+            continue
+        if value not in f["Values"]:
+            return False
+    return True
+
+class emulated_paginator:
+
+    # function __init__
+    # \param operation: function of the emulated client
+    def __init__(self, operation):
+        self.operation = operation
+
+    # function paginate
+    # Requests the pages until one has no NextToken, one request each
+    def paginate(self, **kwargs):
+        while True:
+            page = self.operation(**kwargs)
+            yield page
+            if page.get("NextToken") is None:
+                return
+            kwargs = dict(kwargs, NextToken=page["NextToken"])
+
+class emulated_ec2:
+
+    # function __init__
+    # \param world: emulated_world object
+    def __init__(self, world):
+        self.world = world
+
+    def get_paginator(self, operation_name):
+        return emulated_paginator(getattr(self, operation_name))
+
+    def describe_instances(self, Filters=None, MaxResults=INSTANCES_PER_PAGE, NextToken=None, **kwargs):
+        world = self.world
+        with world.lock:
+            world.call("ec2", "DescribeInstances")
+            world.update()
+            instances = [instance for instance in world.instances.values() if matches(instance, Filters)]
+            first = int(NextToken or 0)
+            reservations = []
+            for instance in instances[first:first + MaxResults]:
+                described = {key: value for key, value in instance.items() if key not in ("bid", "perf", "stddev")}
+                described["LaunchTime"] = instance["LaunchTime"].replace(tzinfo=timezone.utc)
+                described["State"] = dict(instance["State"])
+                described["Tags"] = [{"Key": key, "Value": value} for key, value in instance["Tags"].items()]
+                reservations.append({"Instances": [described]})
+
+        if first + MaxResults < len(instances):
+            return {"Reservations": reservations, "NextToken": str(first + MaxResults)}
+        return {"Reservations": reservations}
+
+    def describe_spot_price_history(self, InstanceTypes=(), **kwargs):
+        world = self.world
+        with world.lock:
+            world.call("ec2", "DescribeSpotPriceHistory")
+            timestamp = world.clock.now().replace(tzinfo=timezone.utc)
+            history = []
+            for instance_type in InstanceTypes:
+                for az, price in world.prices.price_at_allaz(instance_type, pseudo_instance_operations.to_epoch(
+                        world.clock.now())).items():
+                    history.append({"InstanceType": instance_type, "AvailabilityZone": az,
+                                    "ProductDescription": "Linux/UNIX", "SpotPrice": str(price),
+                                    "Timestamp": timestamp})
+
+        return {"SpotPriceHistory": history}
+
+    def request_spot_instances(self, SpotPrice, InstanceCount=1, LaunchSpecification=None, **kwargs):
+        world = self.world
+        with world.lock:
+            world.call("ec2", "RequestSpotInstances")
+            requests = []
+            for i in range(InstanceCount):
+                spot_request_id = world.new_id("sir")
+                world.spot_requests[spot_request_id] = {"SpotInstanceRequestId": spot_request_id,
+                                                        "State": "open",
+                                                        "Status": {"Code": "pending-evaluation"},
+                                                        "LaunchSpecification": LaunchSpecification,
+                                                        "bid": float(SpotPrice),
+                                                        "created": world.clock.now()}
+                requests.append({"SpotInstanceRequestId": spot_request_id, "State": "open"})
+
+        return {"SpotInstanceRequests": requests}
+
+    def describe_spot_instance_requests(self, SpotInstanceRequestIds=(), **kwargs):
+        world = self.world
+        with world.lock:
+            world.call("ec2", "DescribeSpotInstanceRequests")
+            world.update()
+            world.fulfil()
+            described = []
+            for spot_request_id in SpotInstanceRequestIds:
+                spot_request = world.spot_requests[spot_request_id]
+                entry = {"SpotInstanceRequestId": spot_request_id,
+                         "State": spot_request["State"],
+                         "Status": dict(spot_request["Status"])}
+                if "InstanceId" in spot_request:
+                    entry["InstanceId"] = spot_request["InstanceId"]
+                described.append(entry)
+
+        return {"SpotInstanceRequests": described}
+
+    def cancel_spot_instance_requests(self, SpotInstanceRequestIds=(), **kwargs):
+        world = self.world
+        with world.lock:
+            world.call("ec2", "CancelSpotInstanceRequests")
+            for spot_request_id in SpotInstanceRequestIds:
+                if world.spot_requests[spot_request_id]["State"] == "open":
+                    world.spot_requests[spot_request_id]["State"] = "cancelled"
+
+        return {"CancelledSpotInstanceRequests": [{"SpotInstanceRequestId": spot_request_id, "State": "cancelled"}
+                                                  for spot_request_id in SpotInstanceRequestIds]}
+
+    def create_tags(self, Resources=(), Tags=(), **kwargs):
+        world = self.world
+        with world.lock:
+            world.call("ec2", "CreateTags")
+            for instance_id in Resources:
+                if instance_id in world.instances:
+                    world.instances[instance_id]["Tags"].update({tag["Key"]: tag["Value"] for tag in Tags})
+
+        return {}
+
+    def terminate_instances(self, InstanceIds=(), **kwargs):
+        self.world.call("ec2", "TerminateInstances")
+        self.world.terminate(InstanceIds)
+
+        return {"TerminatingInstances": [{"InstanceId": instance_id} for instance_id in InstanceIds]}
+
+class emulated_instance:
+
+    # function __init__
+    # \param client: emulated_ec2 object
+    # \param instance_id: id of the instance
+    def __init__(self, client, instance_id):
+        self.client = client
+        self.id = instance_id
+
+    def terminate(self):
+        return self.client.terminate_instances(InstanceIds=[self.id])
+
+class emulated_ec2_resource:
+
+    # function __init__
+    # \param client: emulated_ec2 object
+    def __init__(self, client):
+        self.client = client
+
+    def Instance(self, instance_id):
+        return emulated_instance(self.client, instance_id)
+
+class emulated_cloudwatch:
+
+    # function __init__
+    # \param world: emulated_world object
+    def __init__(self, world):
+        self.world = world
+
+    def get_paginator(self, operation_name):
+        return emulated_paginator(getattr(self, operation_name))
+
+    # function dimension
+    # \param dimensions: Dimensions of a metric
+    # \param name: name of the dimension
+    # \return value of the dimension, None if there is none
+    def dimension(self, dimensions, name):
+        for dimension in dimensions:
+            if dimension["Name"] == name:
+                return dimension["Value"]
+        return None
+
+    def get_metric_data(self, MetricDataQueries=(), **kwargs):
+        world = self.world
+        with world.lock:
+            world.call("cloudwatch", "GetMetricData")
+            world.update()
+            timestamp = world.clock.now().replace(tzinfo=timezone.utc)
+            results = []
+            for query in MetricDataQueries:
+                metric = query["MetricStat"]["Metric"]
+                value = world.metric_value(self.dimension(metric["Dimensions"], "Instance Id"), metric["MetricName"])
+                results.append({"Id": query["Id"],
+                                "Timestamps": [timestamp] if value is not None else [],
+                                "Values": [value] if value is not None else [],
+                                "StatusCode": "Complete"})
+
+        return {"MetricDataResults": results}
+
+    def get_metric_statistics(self, MetricName, Dimensions=(), Statistics=("Average",), **kwargs):
+        world = self.world
+        with world.lock:
+            world.call("cloudwatch", "GetMetricStatistics")
+            world.update()
+            value = world.metric_value(self.dimension(Dimensions, "Instance Id"), MetricName)
+            datapoints = []
+            if value is not None:
+                datapoint = {"Timestamp": world.clock.now().replace(tzinfo=timezone.utc), "Unit": "None"}
+                datapoint.update({statistic: value for statistic in Statistics})
+                datapoints.append(datapoint)
+
+        return {"Label": MetricName, "Datapoints": datapoints}
+
+    def put_metric_data(self, **kwargs):
+        self.world.call("cloudwatch", "PutMetricData")
+        return {}
+
+# function installed
+# \param world: emulated_world object
+#
+# Context manager that replaces the AWS clients (boto3.client and
+# boto3.resource) and the clock of to_execute.py, instance_operations.py and
+# monitoring.py by the emulated ones, and restores them at the end.
+@contextlib.contextmanager
+def installed(world):
+    ec2 = emulated_ec2(world)
+    clients = {"ec2": ec2, "cloudwatch": emulated_cloudwatch(world)}
+    emulated_datetime = world.clock.datetime_class()
+
+    patches = [(boto3, "client", lambda service_name, *args, **kwargs: clients[service_name]),
+               (boto3, "resource", lambda service_name, *args, **kwargs: emulated_ec2_resource(ec2)),
+               (to_execute, "datetime", emulated_datetime),
+               (to_execute, "time", world.clock.time_module(real_monotonic=True)),
+               (instance_operations, "datetime", emulated_datetime),
+               (instance_operations, "time", world.clock.time_module()),
+               (monitoring, "datetime", emulated_datetime)]
+    saved = [(module, name, getattr(module, name)) for module, name, value in patches]
+    for module, name, value in patches:
+        setattr(module, name, value)
+    try:
+        yield world
+    finally:
+        for module, name, value in saved:
+            setattr(module, name, value)
+
+# function load_profile
+# \param data_hash: dataset hash stored in the database
+# \param idparameters: id for the parameters
+# \return {instance_type: (interpsec, stddev)} of the experiment
+def load_profile(data_hash, idparameters=41):
+    conn = rds_operations.rds_connect()
+    iddata = rds_operations.get_iddata(conn, data_hash)
+    return {row[0]: (float(row[1]), float(row[2] or 0))
+            for row in rds_operations.get_interpsec_allinstances(conn, iddata, idparameters)}
+
+# function get_from_input
+#
+# \param _string: String to be searched from input
+# \param input_dict: Input dictionary of pairs key=value
+# \return Value stored for _string or -1 if it does not exist
+def get_from_input(_string, input_dict):
+    if _string in input_dict:
+        return input_dict[_string]
+    else:
+        return -1
+
+# function main
+# \param (command line input) prices : price log or price trace driving the spot prices
+# \param (command line input) db : SQLite database with the performance of the experiment (see db_sync.py)
+# \param (command line input) start : start of the virtual clock (default 2019-02-15T00:00:00)
+# \param (command line input) boot_time : seconds between the launch of a worker and the start of its work
+# (default 120)
+# \param (command line input) fulfil_delay : seconds between a Spot request and its instance (default 10)
+# \param (command line input) seed : random seed (default 1)
+# \param (command line input) interval, budget, data_hash, nodes, ... : inputs of to_execute.py
+def main():
+    input_dict = {}
+    for cur in sys.argv:
+        if '=' in cur:
+            key, val = cur.split('=')
+            input_dict.update({key: val})
+
+    start = get_from_input("start", input_dict)
+    if (start == -1):
+        start = CLOCK_START
+    boot_time = float(get_from_input("boot_time", input_dict))
+    if (boot_time == -1):
+        boot_time = 120
+    fulfil_delay = float(get_from_input("fulfil_delay", input_dict))
+    if (fulfil_delay == -1):
+        fulfil_delay = 10
+    seed = int(get_from_input("seed", input_dict))
+    if (seed == -1):
+        seed = 1
+
+    rds_config.db_backend = "sqlite"
+    rds_config.db_sqlite_path = get_from_input("db", input_dict)
+    rds_config.collector_url = ""
+
+    clock = virtual_clock(real_datetime.strptime(start, "%Y-%m-%dT%H:%M:%S"))
+    series = pseudo_instance_operations.load_prices(get_from_input("prices", input_dict))
+    world = emulated_world(clock, series, load_profile(get_from_input("data_hash", input_dict)), boot_time,
+                           fulfil_delay, random.Random(seed))
+
+    to_execute.logger = to_execute.getLogger("to_execute")
+    real_start = real_time.monotonic()
+    with installed(world):
+        to_execute.main()
+
+    print("Emulated {} of execution in {:.2f} seconds".format(clock.now() - real_datetime.strptime(
+        start, "%Y-%m-%dT%H:%M:%S"), real_time.monotonic() - real_start))
+    print("Instances launched: {}, terminated: {}, interrupted: {}".format(world.launched, world.terminated,
+                                                                          world.interrupted))
+    for name, count in sorted(world.calls.items()):
+        print("{}\t{}".format(name, count))
+
+if __name__ == "__main__":
+    main()
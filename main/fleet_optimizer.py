@@ -0,0 +1,439 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2019 Nicholas Torres Okita <nicholas.okita@ggaunicamp.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+# This file chooses the composition of a heterogeneous fleet, that is, how
+# many instances of each pool (instance type, availability zone) should be
+# running, instead of filling the fleet greedily from the best candidate. Two
+# problems are solved:
+#
+# max_rate: maximize the expected interpolations per second of the fleet
+# with an hourly spend cap
+# min_cost: minimize the hourly cost of a fleet that reaches a target rate
+#
+# Both respect a capacity limit for each pool and a limit on the total number
+# of instances. They are integer programs with two constraints (spend or rate
+# and number of instances), which are solved with a Lagrangian relaxation of
+# the instance limit: the relaxed problem is a fractional knapsack, whose
+# dual gives a bound on the optimum, and its ordering guides a greedy integer
+# solution, which is then improved by moving single instances between pools.
+# Every plan reports the bound and the relative gap between the plan and the
+# bound, so the solution is at most that far from the optimum. For 100 types x
+# 6 zones a plan takes well under a second, far less than a control interval.
+
+import math
+import sys
+from collections import namedtuple
+import numpy as np
+import selection
+
+# Plan returned by max_rate and min_cost. counts is a list of
+# (instance_type, az, count), bound the Lagrangian bound on the objective
+# (rate for max_rate, cost for min_cost) and gap the relative distance between
+# the plan and the bound.
+fleet_plan = namedtuple("fleet_plan", ["counts", "rate", "cost", "nodes", "bound", "gap"])
+
+# Iterations of the golden section search over the Lagrange multiplier
+DUAL_ITERATIONS = 100
+
+# Maximum number of single instance moves made to improve a greedy solution
+IMPROVE_ITERATIONS = 200
+
+# function get_from_input
+#
+# \param _string: String to be searched from input
+# \param input_dict: Input dictionary of pairs key=value
+# \return Value stored for _string or -1 if it does not exist
+def get_from_input(_string, input_dict):
+    if _string in input_dict:
+        return input_dict[_string]
+    else:
+        return -1
+
+# function build_pools
+# \param all_performance: rows returned by rds_operations.get_interpsec_allinstances
+# \param prices: matrix (types x zones) with the spot prices, NaN or a
+# non-positive value where there is no price
+# \param zones: list of availability zones
+# \param capacity: maximum number of instances of each pool, either a number
+# for every pool or a dictionary {(instance_type, az): limit} (pools that are
+# not in it have no limit)
+# \param risk: number of standard deviations subtracted from interpsec (0
+# uses the mean performance, 1 the performance_negative of to_execute.py)
+# \param overhead: cost added to every spot price (disk)
+# \return dictionary of arrays describing the pools with a price: type, az,
+# rate (interpsec), cost (dollars per hour) and cap
+def build_pools(all_performance, prices, zones, capacity=None, risk=0, overhead=selection.DISK_COST):
+    instance_types, interpsec, stddev = selection.profile_arrays(all_performance)
+    prices = np.asarray(prices, dtype=np.float64).reshape(len(instance_types), -1)
+
+    with np.errstate(invalid="ignore"):
+        type_idx, az_idx = np.nonzero(np.isfinite(prices) & (prices > 0))
+    rate = interpsec[type_idx] - risk * stddev[type_idx]
+    usable = rate > 0
+    type_idx = type_idx[usable]
+    az_idx = az_idx[usable]
+
+    pool_types = [instance_types[i] for i in type_idx]
+    pool_zones = [zones[j] for j in az_idx]
+    if capacity is None or isinstance(capacity, dict):
+        limits = capacity or {}
+        cap = np.array([limits.get((t, az), np.inf) for t, az in zip(pool_types, pool_zones)], dtype=np.float64)
+    else:
+        cap = np.full(len(type_idx), float(capacity))
+
+    return {"type": pool_types,
+            "az": pool_zones,
+            "rate": rate[usable],
+            "cost": prices[type_idx, az_idx] + overhead,
+            "cap": cap}
+
+# function fractional_knapsack
+# \param value: value of one unit of each item
+# \param weight: weight (positive) of one unit of each item
+# \param cap: maximum number of units of each item
+# \param limit: maximum total weight
+# \return maximum total value when fractions of units can be taken
+def fractional_knapsack(value, weight, cap, limit):
+    take = np.nonzero(value > 0)[0]
+    order = take[np.argsort(-(value[take] / weight[take]), kind="stable")]
+
+    with np.errstate(invalid="ignore"):
+        used = np.cumsum(weight[order] * cap[order])
+    full = int(np.searchsorted(used, limit, side="right"))
+    total = float(np.dot(value[order[:full]], cap[order[:full]])) if full > 0 else 0.0
+    if full < len(order):
+        left = limit - (used[full - 1] if full > 0 else 0)
+        total += value[order[full]] * left / weight[order[full]]
+
+    return total
+
+# function fractional_cover
+# \param cost: cost of one unit of each item
+# \param value: value (positive) of one unit of each item
+# \param cap: maximum number of units of each item
+# \param target: minimum total value
+# \return minimum total cost when fractions of units can be taken (inf if the
+# target cannot be reached)
+def fractional_cover(cost, value, cap, target):
+    order = np.argsort(cost / value, kind="stable")
+
+    covered = np.cumsum(value[order] * cap[order])
+    full = int(np.searchsorted(covered, target, side="left"))
+    if full >= len(order):
+        return math.inf
+    total = float(np.dot(cost[order[:full]], cap[order[:full]])) if full > 0 else 0.0
+    left = target - (covered[full - 1] if full > 0 else 0)
+    total += cost[order[full]] * left / value[order[full]]
+
+    return total
+
+# function golden_section
+# \param function: unimodal function of one variable
+# \param low: lower end of the interval
+# \param high: higher end of the interval
+# \param maximize: whether the maximum (instead of the minimum) is searched
+# \return (argument, value) of the best point found
+def golden_section(function, low, high, maximize=False):
+    sign = -1 if maximize else 1
+    ratio = (math.sqrt(5) - 1) / 2
+    a, b = low, high
+    c = b - ratio * (b - a)
+    d = a + ratio * (b - a)
+    fc = sign * function(c)
+    fd = sign * function(d)
+    for i in range(DUAL_ITERATIONS):
+        if fc <= fd:
+            b, d, fd = d, c, fc
+            c = b - ratio * (b - a)
+            fc = sign * function(c)
+        else:
+            a, c, fc = c, d, fd
+            d = a + ratio * (b - a)
+            fd = sign * function(d)
+
+    best = [(function(x), x) for x in (low, high, c, d)]
+    if maximize:
+        value, x = max(best)
+    else:
+        value, x = min(best)
+
+    return x, value
+
+# function improve_max_rate
+# \param pools: dictionary returned by build_pools
+# \param counts: number of instances of each pool (changed in place)
+# \param spend: maximum cost per hour in dollars
+# \param max_nodes: maximum number of instances
+# \return counts
+#
+# Adds one instance or moves one instance to another pool while the rate
+# increases and the solution stays within the constraints
+def improve_max_rate(pools, counts, spend, max_nodes):
+    rate, cost, cap = pools["rate"], pools["cost"], pools["cap"]
+    for i in range(IMPROVE_ITERATIONS):
+        slack = spend - float(np.dot(cost, counts))
+        room = counts < cap
+
+        add = room & (cost <= slack + 1e-9)
+        if counts.sum() < max_nodes and add.any():
+            counts[np.argmax(np.where(add, rate, -np.inf))] += 1
+            continue
+
+        feasible = (counts[:, None] > 0) & room[None, :] & (cost[None, :] - cost[:, None] <= slack + 1e-9)
+        gain = np.where(feasible, rate[None, :] - rate[:, None], 0)
+        p, q = np.unravel_index(np.argmax(gain), gain.shape)
+        if gain[p, q] <= 1e-12:
+            break
+        counts[p] -= 1
+        counts[q] += 1
+
+    return counts
+
+# function improve_min_cost
+# \param pools: dictionary returned by build_pools
+# \param counts: number of instances of each pool (changed in place)
+# \param target_rate: interpolations per second to be reached
+# \return counts
+#
+# Removes one instance or moves one instance to another pool while the cost
+# decreases and the target rate is still reached
+def improve_min_cost(pools, counts, target_rate):
+    rate, cost, cap = pools["rate"], pools["cost"], pools["cap"]
+    for i in range(IMPROVE_ITERATIONS):
+        excess = float(np.dot(rate, counts)) - target_rate
+        room = counts < cap
+
+        remove = (counts > 0) & (rate <= excess)
+        if remove.any():
+            counts[np.argmax(np.where(remove, cost, -np.inf))] -= 1
+            continue
+
+        feasible = (counts[:, None] > 0) & room[None, :] & (rate[None, :] - rate[:, None] >= -excess)
+        saving = np.where(feasible, cost[:, None] - cost[None, :], 0)
+        p, q = np.unravel_index(np.argmax(saving), saving.shape)
+        if saving[p, q] <= 1e-12:
+            break
+        counts[p] -= 1
+        counts[q] += 1
+
+    return counts
+
+# function make_plan
+# \param pools: dictionary returned by build_pools
+# \param counts: number of instances of each pool
+# \param bound: bound on the objective
+# \param maximize: whether the objective (rate) is maximized
+# \return fleet_plan
+def make_plan(pools, counts, bound, maximize):
+    rate = float(np.dot(pools["rate"], counts))
+    cost = float(np.dot(pools["cost"], counts))
+    if maximize:
+        gap = (bound - rate) / bound if bound > 0 else 0.0
+    else:
+        gap = (cost - bound) / bound if bound > 0 else 0.0
+
+    chosen = np.nonzero(counts)[0]
+    chosen = chosen[np.argsort(-counts[chosen], kind="stable")]
+    plan_counts = [(pools["type"][p], pools["az"][p], int(counts[p])) for p in chosen]
+
+    return fleet_plan(plan_counts, rate, cost, int(counts.sum()), bound, max(0.0, gap))
+
+# function max_rate
+# \param pools: dictionary returned by build_pools
+# \param spend: maximum cost per hour in dollars
+# \param max_nodes: maximum number of instances (None for no limit)
+# \return fleet_plan with the highest expected rate found
+def max_rate(pools, spend, max_nodes=None):
+    rate, cost, cap = pools["rate"], pools["cost"], pools["cap"]
+    if max_nodes is None:
+        max_nodes = math.inf
+
+    # Lagrangian bound: the instance limit is moved to the objective with a
+    # multiplier, leaving a fractional knapsack over the spend
+    dual = lambda multiplier: (multiplier * max_nodes if multiplier > 0 else 0) + \
+                              fractional_knapsack(rate - multiplier, cost, cap, spend)
+    if math.isinf(max_nodes) or len(rate) == 0:
+        multiplier, bound = 0.0, dual(0.0)
+    else:
+        multiplier, bound = golden_section(dual, 0.0, float(rate.max()))
+
+    # Integer solutions, filling the pools greedily in different orders
+    orders = [np.argsort(-((rate - multiplier) / cost), kind="stable"),
+              np.argsort(-(rate / cost), kind="stable"),
+              np.argsort(-rate, kind="stable")]
+    best = None
+    for order in orders:
+        counts = np.zeros(len(rate), dtype=np.int64)
+        spent = 0.0
+        nodes = 0
+        for p in order:
+            units = min(cap[p], math.floor((spend - spent) / cost[p] + 1e-9), max_nodes - nodes)
+            if units > 0:
+                counts[p] = units
+                spent += units * cost[p]
+                nodes += units
+        improve_max_rate(pools, counts, spend, max_nodes)
+        if best is None or np.dot(rate, counts) > np.dot(rate, best):
+            best = counts
+
+    if best is None:
+        best = np.zeros(0, dtype=np.int64)
+
+    return make_plan(pools, best, bound, True)
+
+# function min_cost
+# \param pools: dictionary returned by build_pools
+# \param target_rate: interpolations per second to be reached
+# \param max_nodes: maximum number of instances (None for no limit)
+# \return fleet_plan with the lowest cost found, None if the target rate
+# cannot be reached
+def min_cost(pools, target_rate, max_nodes=None):
+    rate, cost, cap = pools["rate"], pools["cost"], pools["cap"]
+    if max_nodes is None:
+        max_nodes = math.inf
+
+    # Highest rate possible with max_nodes instances
+    by_rate = np.argsort(-rate, kind="stable")
+    taken = cap[by_rate]
+    if not math.isinf(max_nodes):
+        before = np.concatenate(([0], np.cumsum(taken)[:-1]))
+        taken = np.clip(max_nodes - before, 0, taken)
+    if len(rate) == 0 or float(np.dot(rate[by_rate], taken)) < target_rate:
+        return None
+
+    # Lagrangian bound: the instance limit is moved to the objective with a
+    # multiplier, leaving a fractional covering problem over the rate
+    dual = lambda multiplier: fractional_cover(cost + multiplier, rate, cap, target_rate) - \
+                              (multiplier * max_nodes if multiplier > 0 else 0)
+    if math.isinf(max_nodes):
+        multiplier, bound = 0.0, dual(0.0)
+    else:
+        high = float(cost.max())
+        while dual(2 * high) > dual(high):
+            high *= 2
+        multiplier, bound = golden_section(dual, 0.0, 2 * high, maximize=True)
+
+    orders = [np.argsort((cost + multiplier) / rate, kind="stable"),
+              np.argsort(cost / rate, kind="stable"),
+              by_rate]
+    best = None
+    for order in orders:
+        counts = np.zeros(len(rate), dtype=np.int64)
+        reached = 0.0
+        nodes = 0
+        for p in order:
+            if reached >= target_rate:
+                break
+            units = min(cap[p], math.ceil((target_rate - reached) / rate[p]), max_nodes - nodes)
+            if units > 0:
+                counts[p] = units
+                reached += units * rate[p]
+                nodes += units
+        if reached < target_rate:
+            continue
+
+        improve_min_cost(pools, counts, target_rate)
+        if best is None or np.dot(cost, counts) < np.dot(cost, best):
+            best = counts
+
+    if best is None:
+        return None
+
+    return make_plan(pools, best, bound, False)
+
+# function log_plan
+# \param plan: fleet_plan
+# Outputs a plan to the standard output
+def log_plan(plan):
+    print("INSTANCE_TYPE\tAZ\tCOUNT")
+    for instance_type, az, count in plan.counts:
+        print("{}\t{}\t{}".format(instance_type, az, count))
+    print("RATE(interpsec)\tCOST(dollars/hour)\tNODES\tBOUND\tGAP")
+    print("{}\t{}\t{}\t{}\t{}".format(plan.rate, plan.cost, plan.nodes, plan.bound, plan.gap))
+
+# function main
+#
+# \param (command line input) data_hash : dataset hash stored in the database
+# \param (command line input) spend : maximum cost per hour in dollars (maximizes the rate)
+# \param (command line input) rate : target interpolations per second (minimizes the cost, used if spend is empty)
+# \param (command line input) nodes : maximum number of instances (default no limit)
+# \param (command line input) capacity : maximum number of instances of each pool (default no limit)
+# \param (command line input) risk : standard deviations subtracted from the performance (default 0)
+# \param (command line input) prices : optional price log or price trace, if empty the current Spot prices are used
+# (id parameters is set as default to 41, can be changed in code)
+def main():
+    import rds_operations
+
+    input_dict = {}
+    for cur in sys.argv:
+        if '=' in cur:
+            key, val = cur.split('=')
+            input_dict.update({key: val})
+
+    data_hash = get_from_input("data_hash", input_dict)
+    spend = float(get_from_input("spend", input_dict))
+    target_rate = float(get_from_input("rate", input_dict))
+    max_nodes = int(get_from_input("nodes", input_dict))
+    if (max_nodes == -1):
+        max_nodes = None
+    capacity = float(get_from_input("capacity", input_dict))
+    if (capacity == -1):
+        capacity = None
+    risk = float(get_from_input("risk", input_dict))
+    if (risk == -1):
+        risk = 0
+
+    all_zones = ['us-east-1a', 'us-east-1b', 'us-east-1c', 'us-east-1d', 'us-east-1e', 'us-east-1f']
+
+    idparameters = 41
+
+    conn = rds_operations.rds_connect()
+    iddata = rds_operations.get_iddata(conn, data_hash)
+    all_performance = rds_operations.get_interpsec_allinstances(conn, iddata, idparameters)
+
+    price_file = get_from_input("prices", input_dict)
+    if (price_file == -1):
+        import logging
+        from instance_operations import instance_operations
+        ops = instance_operations(logging.getLogger(__name__))
+    else:
+        from pseudo_instance_operations import pseudo_instance_operations
+        ops = pseudo_instance_operations(price_file)
+
+    instance_types = [result[0] for result in all_performance]
+    ops.prefetch_spot_prices(instance_types)
+    prices = selection.price_matrix(ops, instance_types, all_zones)
+    pools = build_pools(all_performance, prices, all_zones, capacity, risk)
+
+    if (spend != -1):
+        log_plan(max_rate(pools, spend, max_nodes))
+    else:
+        plan = min_cost(pools, target_rate, max_nodes)
+        if plan is None:
+            print("IMPOSSIBLE TO REACH " + str(target_rate) + " INTERPOLATIONS PER SECOND")
+        else:
+            log_plan(plan)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2019 Nicholas Torres Okita <nicholas.okita@ggaunicamp.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+# This file contains the state of the fleet of worker instances kept by the
+# Job Manager (to_execute.py). Each instance is an instance_record (a class
+# with __slots__ instead of a dictionary) and fleet_state keeps, besides the
+# records by instance id, two indexes:
+#
+# - by (instance type, availability zone), used to find the running
+# instances that match a candidate
+# - by validity counter, used to find the instances to be removed
+#
+# so that these lookups do not go through the whole fleet.
+
+class instance_record:
+    __slots__ = ("instance_id", "instance_type", "instance_az", "price", "performance_negative", "init_time",
+                 "cur_time", "valid", "prev_valid", "stale")
+
+    # function __init__
+    # \param instance_id: id of the instance ("inactive" for candidates that
+    # are not running)
+    # \param instance_type: type of the instance
+    # \param instance_az: availability zone of the instance
+    # \param price: price per hour (spot price and disk)
+    # \param performance_negative: performance minus its standard deviation,
+    # -1 if there are no measurements yet
+    # \param init_time: launch time
+    # \param valid: validity counter
+    def __init__(self, instance_id, instance_type, instance_az, price, performance_negative=-1, init_time=None,
+                 valid=0):
+        self.instance_id = instance_id
+        self.instance_type = instance_type
+        self.instance_az = instance_az
+        self.price = price
+        self.performance_negative = performance_negative
+        self.init_time = init_time
+        self.cur_time = init_time
+        self.valid = valid
+        self.prev_valid = valid
+        self.stale = False
+
+    def __repr__(self):
+        return repr({name: getattr(self, name) for name in self.__slots__})
+
+class fleet_state:
+
+    def __init__(self):
+        self.records = {}
+        self.by_location = {}
+        self.by_valid = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, instance_id):
+        return instance_id in self.records
+
+    def __iter__(self):
+        return iter(list(self.records.values()))
+
+    # function get
+    # \param instance_id: id of the instance
+    # \return instance_record of the instance, None if it is not in the fleet
+    def get(self, instance_id):
+        return self.records.get(instance_id)
+
+    # function add
+    # \param record: instance_record of a new instance
+    def add(self, record):
+        if record.instance_id in self.records:
+            self.remove(record.instance_id)
+        self.records[record.instance_id] = record
+        self.by_location.setdefault((record.instance_type, record.instance_az), {})[record.instance_id] = record
+        self.by_valid.setdefault(record.valid, {})[record.instance_id] = record
+
+    # function remove
+    # \param instance_id: id of the instance
+    # \return removed instance_record
+    def remove(self, instance_id):
+        record = self.records.pop(instance_id)
+        self.discard_index(self.by_location, (record.instance_type, record.instance_az), instance_id)
+        self.discard_index(self.by_valid, record.valid, instance_id)
+        return record
+
+    # function discard_index
+    # \param index: by_location or by_valid
+    # \param key: key of the index
+    # \param instance_id: id of the instance removed from it
+    def discard_index(self, index, key, instance_id):
+        bucket = index[key]
+        del bucket[instance_id]
+        if len(bucket) == 0:
+            del index[key]
+
+    # function set_valid
+    # \param record: instance_record of an instance in the fleet
+    # \param valid: new validity counter
+    def set_valid(self, record, valid):
+        if valid == record.valid:
+            return
+        self.discard_index(self.by_valid, record.valid, record.instance_id)
+        record.valid = valid
+        self.by_valid.setdefault(valid, {})[record.instance_id] = record
+
+    # function at
+    # \param instance_type: type of the instances
+    # \param instance_az: availability zone of the instances
+    # \return list of instance_record of the instances of the type in the zone
+    def at(self, instance_type, instance_az):
+        return list(self.by_location.get((instance_type, instance_az), {}).values())
+
+    # function remove_invalid
+    # \return list of instance_record removed (validity counter at most zero)
+    def remove_invalid(self):
+        removed = []
+        for valid in [valid for valid in self.by_valid.keys() if valid <= 0]:
+            for instance_id in list(self.by_valid[valid].keys()):
+                removed.append(self.remove(instance_id))
+
+        return removed
@@ -27,9 +27,14 @@
 import logging
 import sys
 import time
+import threading
 import boto3
 import base64
+from botocore.exceptions import ClientError
 from datetime import datetime
+from datetime import timezone
+from collections import namedtuple
+from instance_provider import instance_provider
 
 # function getLogger
 #
@@ -56,49 +61,156 @@ def getLogger(name):
     logger.addHandler(screenHandler)
     return logger
 
-class instance_operations:
+# Maximum number of instance types asked in a single price history request
+PRICE_TYPES_PER_REQUEST = 100
+
+# function launch_time_to_utc
+# \param launch_time: LaunchTime (datetime with time zone) of an instance
+# \return the same time in UTC, without time zone and microseconds
+def launch_time_to_utc(launch_time):
+    if launch_time.tzinfo is not None:
+        launch_time = launch_time.astimezone(timezone.utc).replace(tzinfo=None)
+    return launch_time.replace(microsecond=0)
+
+# Record of a worker instance, as returned by get_fleet_inventory
+fleet_instance_record = namedtuple('fleet_instance_record',
+                                   ['instance_id', 'instance_type', 'az', 'launch_time', 'state', 'spot_request_id'])
+
+# Spot request states and status codes that mean the request will not be
+# fulfilled (the codes of requests held by capacity or price are included, as
+# the request is cancelled anyway if it is not fulfilled in time)
+SPOT_FAILED_STATES = ['closed', 'cancelled', 'failed']
+SPOT_FAILED_CODES = ['bad-parameters', 'capacity-not-available', 'capacity-oversubscribed',
+                     'constraint-not-fulfillable', 'price-too-low', 'schedule-expired', 'system-error',
+                     'az-group-constraint', 'launch-group-constraint', 'placement-group-constraint']
+
+# Maximum time in seconds between two polls of the Spot requests
+SPOT_POLL_MAX_DELAY = 8
+
+# Maximum number of Spot requests in a single describe request
+SPOT_REQUESTS_PER_DESCRIBE = 100
+
+class spot_price_snapshot:
+
+    # function __init__
+    # \param ec2: ec2 client
+    # \param ttl: time in seconds that a snapshot is considered current
+    # Initialize an empty snapshot. Prices are fetched on the first lookup.
+    def __init__(self, ec2, ttl=60):
+        self.ec2 = ec2
+        self.ttl = ttl
+        self.instance_types = set()
+        self.prices = {}
+        self.fetched = None
+        self.lock = threading.Lock()
+
+    # function _fetch
+    # \param instance_types: list of instance types
+    # \return dictionary {instance_type: {az: price}} with the current prices
+    # Gets the current spot price of the input instance types in all
+    # availability zones, using as few (paginated) requests as possible.
+    def _fetch(self, instance_types):
+        prices = {}
+        latest = {}
+        now = datetime.now().isoformat()
+        paginator = self.ec2.get_paginator('describe_spot_price_history')
+        instance_types = sorted(instance_types)
+        for i in range(0, len(instance_types), PRICE_TYPES_PER_REQUEST):
+            pages = paginator.paginate(StartTime=now,
+                                       EndTime=now,
+                                       ProductDescriptions=['Linux/UNIX'],
+                                       InstanceTypes=instance_types[i:i + PRICE_TYPES_PER_REQUEST])
+            for page in pages:
+                for h in page['SpotPriceHistory']:
+                    key = (h['InstanceType'], h['AvailabilityZone'])
+                    # Keep only the most recent price for each pair
+                    if key not in latest or h['Timestamp'] > latest[key]:
+                        latest[key] = h['Timestamp']
+                        prices.setdefault(h['InstanceType'], {})[h['AvailabilityZone']] = float(h['SpotPrice'])
+
+        return prices
+
+    # function _expired
+    # \return True if the snapshot must be fetched again
+    def _expired(self):
+        return self.fetched is None or time.monotonic() - self.fetched >= self.ttl
+
+    # function refresh
+    # \param instance_types: optional list of instance types to be tracked
+    # Fetches a new snapshot with the prices of all tracked instance types if
+    # the current one expired (or new instance types need to be tracked).
+    def refresh(self, instance_types=()):
+        with self.lock:
+            new_types = set(instance_types) - self.instance_types
+            self.instance_types.update(new_types)
+            if self._expired():
+                self.prices = self._fetch(self.instance_types)
+                self.fetched = time.monotonic()
+            elif len(new_types) > 0:
+                self.prices.update(self._fetch(new_types))
+
+    # function get_allaz
+    # \param instance_type: string containing the instance type
+    # \return dictionary {az: price} from the snapshot
+    def get_allaz(self, instance_type):
+        self.refresh([instance_type])
+        return dict(self.prices.get(instance_type, {}))
+
+    # function get
+    # \param instance_type: string containing the instance type
+    # \param az: availability zone
+    # \return price from the snapshot, -1 if there is none
+    def get(self, instance_type, az):
+        self.refresh([instance_type])
+        return self.prices.get(instance_type, {}).get(az, -1)
+
+    # function peek
+    # \param instance_type: string containing the instance type
+    # \param az: availability zone
+    # \return price from the snapshot, even if it expired, -1 if there is none
+    # Never fetches prices (nor waits for a fetch running in another thread).
+    def peek(self, instance_type, az):
+        return self.prices.get(instance_type, {}).get(az, -1)
+
+class instance_operations(instance_provider):
 
     # function __init__
     # \param logger : logger to output information
+    # \param price_ttl : time in seconds that the spot prices are cached
     # Initialize the class ec2 client and resource
-    def __init__(self, logger):
+    def __init__(self, logger, price_ttl=60):
         self.logger = logger 
         self.ec2 = boto3.client('ec2', region_name='us-east-1')
         self.ec2res = boto3.resource('ec2', region_name='us-east-1')
+        self.price_snapshot = spot_price_snapshot(self.ec2, price_ttl)
+
+    # function prefetch_spot_prices
+    # \param instance_types : list of instance types
+    # Adds the instance types to the price snapshot, so that all of them are
+    # fetched together instead of one request per type
+    def prefetch_spot_prices(self, instance_types):
+        self.price_snapshot.refresh(instance_types)
 
     # function get_current_spot_price_allaz
     # \param instance_type : string containing the instance type
     # Gets current spot price for an input instance type in all availability zones
     def get_current_spot_price_allaz(self, instance_type):
-        dict = {}
-        history = self.ec2.describe_spot_price_history(
-            StartTime=datetime.now().isoformat(),
-            EndTime=datetime.now().isoformat(),
-            ProductDescriptions=['Linux/UNIX'],
-            InstanceTypes=[instance_type])
-
-        for h in history['SpotPriceHistory']:
-            dict[h['AvailabilityZone']] = float(h['SpotPrice'])
-
-        return dict
+        return self.price_snapshot.get_allaz(instance_type)
 
     # function get_current_spot_price_allaz
     # \param instance_type : string containing the instance type
     # \param az : availability zone
     # Gets current spot price for an input instance type in an input availability zones
     def get_current_spot_price(self, instance_type, az):
-        history = self.ec2.describe_spot_price_history(
-            StartTime=datetime.now().isoformat(),
-            EndTime=datetime.now().isoformat(),
-            ProductDescriptions=['Linux/UNIX'],
-            InstanceTypes=[instance_type],
-            AvailabilityZone=az)
-
-        price = -1
-        if (len(history['SpotPriceHistory']) > 0):
-            price = float(history['SpotPriceHistory'][0]['SpotPrice'])
+        return self.price_snapshot.get(instance_type, az)
 
-        return price
+    # function peek_spot_price
+    # \param instance_type : string containing the instance type
+    # \param az : availability zone
+    # Gets the last known spot price for an input instance type in an input
+    # availability zone without making any request
+    def peek_spot_price(self, instance_type, az):
+        return self.price_snapshot.peek(instance_type, az)
 
     # function terminateInstance
     # \param instanceid: string containing the instance id to be terminated
@@ -107,13 +219,11 @@ class instance_operations:
         inst = self.ec2res.Instance(instanceid)
         inst.terminate()
 
-    # function createSpotInstance
-    # \param instance_type_in: string containing the instance type
+    # function launch_specification
+    # \param instance_type: string containing the instance type
     # \param az : availability zone
-    # \param price : instance price
-    # Creates an Spot instance of type instance_type_in, in availability zone az
-    # and priced at max price.
-    def createSpotInstance(self, instance_type_in, az, price):
+    # \return LaunchSpecification used to request Spot instances
+    def launch_specification(self, instance_type, az):
         # To be completed by user defined subnets
         subnets = {
             'us-east-1a': '',
@@ -124,86 +234,131 @@ class instance_operations:
             'us-east-1f': ''
         }
 
-        bestZone = ['', sys.float_info.max]
-
-        zones = self.ec2.describe_availability_zones()
-        zoneNames = []
-        for zone in zones['AvailabilityZones']:
-            if zone['State'] == 'available':
-                zoneNames.append(zone['ZoneName'])
-
-        PRICE = str(price * 1.2)
-        INSTANCE = instance_type_in
-
-        bestZone[0] = az
-        bestZone[1] = price
-        now_str = "[" + datetime.now().isoformat() + "]     "
-        self.logger.info(INSTANCE + "    " + bestZone[0] + "    " + PRICE)
-
         # Variable containing the user script to initialize and execute the program
         user_data = """#!/bin/bash 
         """
 
-        instance_type = INSTANCE
-        response = self.ec2.request_spot_instances(
-            SpotPrice=PRICE,
-            InstanceCount=1,
-            LaunchSpecification={
-                'InstanceType': instance_type,
-                'ImageId': '', # Image AMI id
-                'SecurityGroupIds': [''], # Security group ID to create instances
-                'SubnetId': subnets[bestZone[0]],
-                'UserData': (base64.b64encode(user_data.encode())).decode(),
-                'KeyName': '', # Instance key name
-                'Monitoring': {
-                    'Enabled': True
-                },
-                'Placement': {
-                    'AvailabilityZone': bestZone[0]
-                },
-                'BlockDeviceMappings': [  # This is the root disk, can be
-                                          # reconfigured to what is more
-                                          # convenient
-                    {
-                        'DeviceName': '/dev/sda1',
-                        'VirtualName': 'eth0',
-                        'Ebs': {
-                            'DeleteOnTermination': True,
-                            'VolumeSize': 20,
-                            'VolumeType': 'io1',
-                            'Iops': 1000
-                        },
-                        'NoDevice': ''
+        return {
+            'InstanceType': instance_type,
+            'ImageId': '', # Image AMI id
+            'SecurityGroupIds': [''], # Security group ID to create instances
+            'SubnetId': subnets[az],
+            'UserData': (base64.b64encode(user_data.encode())).decode(),
+            'KeyName': '', # Instance key name
+            'Monitoring': {
+                'Enabled': True
+            },
+            'Placement': {
+                'AvailabilityZone': az
+            },
+            'BlockDeviceMappings': [  # This is the root disk, can be
+                                      # reconfigured to what is more
+                                      # convenient
+                {
+                    'DeviceName': '/dev/sda1',
+                    'VirtualName': 'eth0',
+                    'Ebs': {
+                        'DeleteOnTermination': True,
+                        'VolumeSize': 20,
+                        'VolumeType': 'io1',
+                        'Iops': 1000
                     },
-                ]
-            }
-        )
-
-        spot_request_id = response['SpotInstanceRequests'][0]['SpotInstanceRequestId']
-        time.sleep(30)
-        response = self.ec2.describe_spot_instance_requests(SpotInstanceRequestIds=[spot_request_id])
-        cur_spot = response['SpotInstanceRequests'][0]
-        if ('InstanceId' in cur_spot):
-            now_str = "[" + datetime.now().isoformat() + "] "
-            self.logger.info("SPOTID " + cur_spot['InstanceId'])
-            result = self.ec2.create_tags(Resources=[cur_spot['InstanceId']],
-                                     Tags=[ # Instance tags (default as Type and Name)
-                                         {
-                                             'Key': 'Type',
-                                             'Value': 'worker-spot'
-                                         },
-                                         {
-                                             'Key': 'Name',
-                                             'Value': 'Auto-Generated Spot Worker ' + instance_type_in
-                                         }
-                                     ]
-                                     )
-            return cur_spot['InstanceId']
-        else:
-            now_str = "[" + datetime.now().isoformat() + "] "
-            self.logger.error('Spot Request for ' + instance_type_in + ' failed in zone ' + bestZone[0])
-            self.ec2.cancel_spot_instance_requests(SpotInstanceRequestIds=[spot_request_id])
-            return ''
+                    'NoDevice': ''
+                },
+            ]
+        }
+
+    # function tag_instances
+    # \param instance_ids: list of instance ids
+    # \param instance_type: string containing the instance type
+    # Tags the worker instances (all instances must be of the same type)
+    def tag_instances(self, instance_ids, instance_type):
+        self.ec2.create_tags(Resources=instance_ids,
+                             Tags=[ # Instance tags (default as Type and Name)
+                                 {
+                                     'Key': 'Type',
+                                     'Value': 'worker-spot'
+                                 },
+                                 {
+                                     'Key': 'Name',
+                                     'Value': 'Auto-Generated Spot Worker ' + instance_type
+                                 }
+                             ]
+                             )
+
+    # function createSpotInstances
+    # \param requests : list of (instance_type, az, price, count)
+    # \param timeout : maximum time in seconds waiting for the requests
+    # \return list of (instance_id, instance_type, az, price), one for each
+    # instance created
+    #
+    # Requests count Spot instances of each (instance_type, az) pair, priced at
+    # max price, with one request_spot_instances call per pair. Then all the
+    # outstanding requests are polled together (with exponential backoff) until
+    # every one of them is fulfilled or failed, or the timeout expires. The
+    # requests that were not fulfilled are cancelled.
+    def createSpotInstances(self, requests, timeout=30):
+        pending = {}
+        for instance_type, az, price, count in requests:
+            if count <= 0:
+                continue
+            PRICE = str(price * 1.2)
+            self.logger.info(instance_type + "    " + az + "    " + PRICE + "    x" + str(count))
+            try:
+                response = self.ec2.request_spot_instances(SpotPrice=PRICE,
+                                                           InstanceCount=count,
+                                                           LaunchSpecification=self.launch_specification(instance_type, az))
+            except ClientError as e:
+                self.logger.error('Spot Request for ' + instance_type + ' failed in zone ' + az + ': ' + str(e))
+                continue
+            for spot_request in response['SpotInstanceRequests']:
+                pending[spot_request['SpotInstanceRequestId']] = (instance_type, az, price)
+
+        created = []
+        to_cancel = []
+        delay = 1
+        deadline = time.monotonic() + timeout
+        while len(pending) > 0 and time.monotonic() < deadline:
+            time.sleep(min(delay, max(0, deadline - time.monotonic())))
+            delay = min(delay * 2, SPOT_POLL_MAX_DELAY)
+            spot_requests = []
+            request_ids = list(pending.keys())
+            try:
+                for i in range(0, len(request_ids), SPOT_REQUESTS_PER_DESCRIBE):
+                    response = self.ec2.describe_spot_instance_requests(
+                        SpotInstanceRequestIds=request_ids[i:i + SPOT_REQUESTS_PER_DESCRIBE])
+                    spot_requests.extend(response['SpotInstanceRequests'])
+            except ClientError as e:
+                # Recently created requests may not be visible yet
+                self.logger.debug('Could not describe Spot requests: ' + str(e))
+                continue
+
+            for cur_spot in spot_requests:
+                spot_request_id = cur_spot['SpotInstanceRequestId']
+                instance_type, az, price = pending[spot_request_id]
+                if 'InstanceId' in cur_spot:
+                    self.logger.info("SPOTID " + cur_spot['InstanceId'])
+                    created.append((cur_spot['InstanceId'], instance_type, az, price))
+                    del pending[spot_request_id]
+                elif cur_spot['State'] in SPOT_FAILED_STATES or cur_spot['Status']['Code'] in SPOT_FAILED_CODES:
+                    self.logger.error('Spot Request for ' + instance_type + ' failed in zone ' + az + ' (' +
+                                      cur_spot['Status']['Code'] + ')')
+                    to_cancel.append(spot_request_id)
+                    del pending[spot_request_id]
+
+        for spot_request_id, (instance_type, az, price) in pending.items():
+            self.logger.error('Spot Request for ' + instance_type + ' failed in zone ' + az + ' (timeout)')
+        to_cancel.extend(pending.keys())
+        if len(to_cancel) > 0:
+            self.ec2.cancel_spot_instance_requests(SpotInstanceRequestIds=to_cancel)
+
+        instance_types = {}
+        for instance_id, instance_type, az, price in created:
+            instance_types.setdefault(instance_type, []).append(instance_id)
+        for instance_type, instance_ids in instance_types.items():
+            self.tag_instances(instance_ids, instance_type)
+
+        return created
 
     # function createSpotInstanceThreads
     # \param instance_type_in: string containing the instance type
@@ -215,9 +370,9 @@ class instance_operations:
     def createSpotInstanceThreads(self, instance_type_in, az, price, valid_count, ret_dict):
         ret = self.createSpotInstance(instance_type_in, az, price)
         if ret != '':
-            ec2_instance = self.ec2res.Instance(ret)
-            init_time = datetime.strptime(ec2_instance.launch_time.strftime("%Y-%m-%dT%H:%M:%S"),
-                                          "%Y-%m-%dT%H:%M:%S")
+            # The request was just fulfilled, so the instance launch time is
+            # now (avoids one describe_instances request per instance)
+            init_time = datetime.utcnow().replace(microsecond=0)
 
             instance_dict = {"instance_id": ret,
                              "instance_type": instance_type_in,
@@ -227,7 +382,8 @@ class instance_operations:
                              "init_time": init_time,
                              "cur_time": init_time,
                              "valid": valid_count,
-                             "prev_valid": valid_count}
+                             "prev_valid": valid_count,
+                             "stale": False}
 
             ret_dict[ret] = instance_dict
         else:
@@ -268,6 +424,19 @@ class instance_operations:
 
         self.logger.info('Couldn\'t start new instance')
 
+    # function describe_all_instances
+    # \param filters : filters of the describe_instances request
+    # \return dictionary with the 'Reservations' of all pages
+    # Gets all instance reservations that match the filters, following the
+    # pagination of describe_instances
+    def describe_all_instances(self, filters):
+        reservations = []
+        paginator = self.ec2.get_paginator('describe_instances')
+        for page in paginator.paginate(Filters=filters):
+            reservations.extend(page['Reservations'])
+
+        return {'Reservations': reservations}
+
     # function get_instance_reservations
     # \return list of instance reservations
     # Get instances ids that have tag:Type worker-spot and is
@@ -283,9 +452,30 @@ class instance_operations:
         f2['Values'] = ['running']
         filters.append(f2)
 
-        instance_reservations = self.ec2.describe_instances(Filters=filters)
+        instance_reservations = self.describe_all_instances(filters)
         return instance_reservations
 
+    # function get_fleet_inventory
+    # \param reservations : optional result of get_instance_reservations
+    # \return list of fleet_instance_record, one for each worker instance
+    # Flattens every instance of every reservation of the worker instances
+    # (a single paginated describe_instances, whatever the fleet size)
+    def get_fleet_inventory(self, reservations=None):
+        if reservations is None:
+            reservations = self.get_instance_reservations()
+
+        inventory = []
+        for reservation in reservations['Reservations']:
+            for instance in reservation['Instances']:
+                inventory.append(fleet_instance_record(instance_id=instance['InstanceId'],
+                                                       instance_type=instance['InstanceType'],
+                                                       az=instance['Placement']['AvailabilityZone'],
+                                                       launch_time=launch_time_to_utc(instance['LaunchTime']),
+                                                       state=instance['State']['Name'],
+                                                       spot_request_id=instance.get('SpotInstanceRequestId')))
+
+        return inventory
+
     # function get_jobmanager_reservations
     # \return list of instance reservations
     # Get instances ids that have tag:type jobmanager-ondemand and is
@@ -301,7 +491,7 @@ class instance_operations:
         f2['Values'] = ['running']
         filters.append(f2)
 
-        instance_reservations = self.ec2.describe_instances(Filters=filters)
+        instance_reservations = self.describe_all_instances(filters)
         return instance_reservations
 
     # function get_jobmanager_reservations
@@ -310,9 +500,5 @@ class instance_operations:
     def get_jobmanager_init_time(self):
         jm_res = self.get_jobmanager_reservations()
         instance = jm_res['Reservations'][0]
-        instance_id = instance['Instances'][0]['InstanceId']
-
-        ec2_instance = self.ec2res.Instance(instance_id)
-        init_time = datetime.strptime(ec2_instance.launch_time.strftime("%Y-%m-%dT%H:%M:%S"), "%Y-%m-%dT%H:%M:%S")
 
-        return init_time
+        return launch_time_to_utc(instance['Instances'][0]['LaunchTime'])
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2019 Nicholas Torres Okita <nicholas.okita@ggaunicamp.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+# This file describes the operations that the instance selection needs from a
+# cloud provider: pricing, launching and terminating Spot instances. There
+# are two implementations:
+#
+# instance_operations.py: the actual provider (AWS EC2, through boto3)
+# pseudo_instance_operations.py: an offline provider, which gets the prices
+# from a price file and only pretends to create and terminate instances
+#
+# The methods without a default are abstract, so a provider missing one of
+# them cannot be created.
+
+from abc import ABC
+from abc import abstractmethod
+
+class instance_provider(ABC):
+
+    # function get_current_spot_price_allaz
+    # \param instance_type: string containing the instance type
+    # \return dictionary {az: price} with the current spot price of the
+    # instance type in each availability zone
+    @abstractmethod
+    def get_current_spot_price_allaz(self, instance_type):
+        raise NotImplementedError
+
+    # function get_current_spot_price
+    # \param instance_type: string containing the instance type
+    # \param az: availability zone
+    # \return current spot price of the instance type in the availability
+    # zone, -1 if there is none
+    @abstractmethod
+    def get_current_spot_price(self, instance_type, az):
+        raise NotImplementedError
+
+    # function prefetch_spot_prices
+    # \param instance_types: list of instance types
+    # Hint that the prices of these instance types will be needed soon (does
+    # nothing unless the provider can fetch them together)
+    def prefetch_spot_prices(self, instance_types):
+        pass
+
+    # function createSpotInstances
+    # \param requests: list of (instance_type, az, price, count)
+    # \param timeout: maximum time in seconds waiting for the requests
+    # \return list of (instance_id, instance_type, az, price), one for each
+    # instance created
+    @abstractmethod
+    def createSpotInstances(self, requests, timeout=30):
+        raise NotImplementedError
+
+    # function createSpotInstance
+    # \param instance_type_in: string containing the instance type
+    # \param az: availability zone
+    # \param price: instance price
+    # \return id of the instance created, '' if it failed
+    def createSpotInstance(self, instance_type_in, az, price):
+        created = self.createSpotInstances([(instance_type_in, az, price, 1)])
+        if len(created) > 0:
+            return created[0][0]
+        return ''
+
+    # function terminateInstance
+    # \param instanceid: string containing the instance id to be terminated
+    @abstractmethod
+    def terminateInstance(self, instanceid):
+        raise NotImplementedError
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2019 Nicholas Torres Okita <nicholas.okita@ggaunicamp.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+# This file contains the instrumentation of the Job Manager control loop
+# (to_execute.py). It keeps:
+#
+# - the time spent in each phase of a tick (spans around the inventory fetch,
+# metrics fetch, price fetch, profile query, candidate selection, launches and
+# terminations). Requests made concurrently by the monitoring threads are
+# summed, so a phase can take longer than the tick.
+# - the number of AWS API calls for each service and operation (counted by a
+# boto3 event handler, see attach_boto3)
+# - the number and time of the database queries (see
+# rds_operations.query_observer)
+#
+# At the end of each tick a summary line is logged, with a warning when the
+# tick takes more than WARN_FRACTION of the interval and the slowest phase.
+# The totals are exposed in the Prometheus text format by an HTTP endpoint
+# (serve) and/or a file written after every tick (write_file).
+
+import contextlib
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Fraction of the interval after which a tick is reported as too slow
+WARN_FRACTION = 0.8
+
+# Prefix of the exported metrics
+PREFIX = "cloudpits"
+
+class instrumentation:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ticks = 0
+        self.tick_start = None
+        self.last_tick = 0.0
+        self.tick_phases = {}
+        self.phase_seconds = {}
+        self.phase_count = {}
+        self.api_calls = {}
+        self.db_queries = {}
+        self.db_seconds = {}
+
+    # function add_span
+    # \param phase: name of the phase
+    # \param seconds: time spent in it
+    def add_span(self, phase, seconds):
+        with self.lock:
+            self.tick_phases[phase] = self.tick_phases.get(phase, 0.0) + seconds
+            self.phase_seconds[phase] = self.phase_seconds.get(phase, 0.0) + seconds
+            self.phase_count[phase] = self.phase_count.get(phase, 0) + 1
+
+    # function span
+    # \param phase: name of the phase
+    # Context manager that adds the time spent inside it to the phase
+    @contextlib.contextmanager
+    def span(self, phase):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_span(phase, time.monotonic() - start)
+
+    # function timed
+    # \param phase: name of the phase
+    # \param function: function to be timed
+    # \return function that calls the given one inside a span of the phase
+    # (used for the requests submitted to thread pools)
+    def timed(self, phase, function):
+        def call(*args, **kwargs):
+            with self.span(phase):
+                return function(*args, **kwargs)
+        return call
+
+    # function count_api
+    # \param service: AWS service (e.g. ec2)
+    # \param operation: API operation (e.g. DescribeInstances)
+    def count_api(self, service, operation):
+        key = (service, operation)
+        with self.lock:
+            self.api_calls[key] = self.api_calls.get(key, 0) + 1
+
+    # function count_db
+    # \param kind: "read", "write" or "transaction"
+    # \param seconds: time spent in the query
+    def count_db(self, kind, seconds):
+        with self.lock:
+            self.db_queries[kind] = self.db_queries.get(kind, 0) + 1
+            self.db_seconds[kind] = self.db_seconds.get(kind, 0.0) + seconds
+
+    # function before_call
+    # boto3 handler of the before-call event (event name
+    # before-call.<service>.<operation>)
+    def before_call(self, event_name=None, **kwargs):
+        parts = (event_name or "").split(".")
+        if len(parts) >= 3:
+            self.count_api(parts[1], parts[2])
+
+    # function attach_boto3
+    # \param session: boto3 session (the default one if None), or any object
+    # with its events (e.g. emulator.emulated_world)
+    #
+    # Counts the API calls of the clients created from the session after
+    # this call.
+    def attach_boto3(self, session=None):
+        if session is None:
+            import boto3
+            if boto3.DEFAULT_SESSION is None:
+                boto3.setup_default_session()
+            session = boto3.DEFAULT_SESSION
+        session.events.register('before-call', self.before_call)
+
+    # function attach_database
+    # Counts the queries made by rds_operations
+    def attach_database(self):
+        import rds_operations
+        rds_operations.query_observer = self.count_db
+
+    # function start_tick
+    def start_tick(self):
+        with self.lock:
+            self.tick_start = time.monotonic()
+            self.tick_phases = {}
+
+    # function end_tick
+    # \param logger: logger object
+    # \param interval: interval of the control loop in seconds
+    # \return time spent in the tick in seconds
+    #
+    # Logs the summary of the tick and a warning if it took more than
+    # WARN_FRACTION of the interval.
+    def end_tick(self, logger, interval):
+        with self.lock:
+            self.ticks += 1
+            self.last_tick = time.monotonic() - self.tick_start
+            phases = sorted(self.tick_phases.items(), key=lambda item: item[1], reverse=True)
+            tick = self.last_tick
+
+        logger.info("TICK {} TOOK {:.3f}s: {}".format(
+            self.ticks, tick, " ".join("{}={:.3f}s".format(phase, seconds) for phase, seconds in phases)))
+        if tick > WARN_FRACTION * interval:
+            slowest = "{} ({:.3f}s)".format(*phases[0]) if len(phases) > 0 else "none"
+            logger.warning("TICK {} TOOK {:.0f}% OF THE INTERVAL, SLOWEST PHASE: {}".format(
+                self.ticks, 100 * tick / interval, slowest))
+
+        return tick
+
+    # function render
+    # \return the totals in the Prometheus text format
+    def render(self):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append("# HELP {}_{} {}".format(PREFIX, name, help_text))
+            lines.append("# TYPE {}_{} {}".format(PREFIX, name, kind))
+            for labels, value in samples:
+                label_text = ",".join('{}="{}"'.format(key, val) for key, val in labels)
+                if label_text:
+                    label_text = "{" + label_text + "}"
+                lines.append("{}_{}{} {}".format(PREFIX, name, label_text, repr(float(value))))
+
+        with self.lock:
+            metric("ticks_total", "counter", "Ticks of the control loop.", [((), self.ticks)])
+            metric("tick_seconds", "gauge", "Duration of the last tick.", [((), self.last_tick)])
+            metric("phase_seconds_total", "counter", "Time spent in each phase.",
+                   [((("phase", phase),), seconds) for phase, seconds in sorted(self.phase_seconds.items())])
+            metric("phase_calls_total", "counter", "Spans of each phase.",
+                   [((("phase", phase),), count) for phase, count in sorted(self.phase_count.items())])
+            metric("phase_last_tick_seconds", "gauge", "Time spent in each phase in the current or last tick.",
+                   [((("phase", phase),), seconds) for phase, seconds in sorted(self.tick_phases.items())])
+            metric("api_calls_total", "counter", "AWS API calls.",
+                   [((("service", service), ("operation", operation)), count)
+                    for (service, operation), count in sorted(self.api_calls.items())])
+            metric("db_queries_total", "counter", "Database queries.",
+                   [((("kind", kind),), count) for kind, count in sorted(self.db_queries.items())])
+            metric("db_seconds_total", "counter", "Time spent in database queries.",
+                   [((("kind", kind),), seconds) for kind, seconds in sorted(self.db_seconds.items())])
+
+        return "\n".join(lines) + "\n"
+
+    # function write_file
+    # \param filename: file where the metrics are written (replaced at once,
+    # so a reader never sees it half written)
+    def write_file(self, filename):
+        temp = filename + ".tmp"
+        with open(temp, "w") as metrics_f:
+            metrics_f.write(self.render())
+        os.replace(temp, filename)
+
+    # function serve
+    # \param port: port of the HTTP endpoint (/metrics)
+    # \return HTTP server, running in a background thread
+    def serve(self, port):
+        instruments = self
+
+        class metrics_handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = instruments.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("", port), metrics_handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
@@ -0,0 +1,566 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2019 Nicholas Torres Okita <nicholas.okita@ggaunicamp.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+# This file contains the measurement collector, a small HTTP service that
+# runs on the Job Manager and stores the measurements reported by the workers
+# (performance and number of tasks completed, see save_performance.py and
+# save_interpols.py) in the database:
+#
+# python measurement_collector.py address=0.0.0.0 port=8000 batch_size=500 flush_interval=5
+#
+# Instead of each worker opening its own database connection and looking up
+# the parameters, data and experiment ids for every measurement, the workers
+# post the measurements (JSON lists) to /interpsec and /interpols and the
+# collector keeps them in memory. They are written with executemany when
+# batch_size measurements are waiting or every flush_interval seconds, using
+# a single connection and the ids resolved once for each configuration.
+#
+# A measurement that cannot be written because of its values (e.g. an
+# instance type that is not in the database) is logged and discarded, the
+# others of the batch are written one at a time. If the database cannot be
+# reached, the measurements are kept and written by the next flush, at most
+# MAX_ATTEMPTS times, and at most MAX_WAITING measurements of each kind are
+# kept (the oldest are discarded).
+#
+# The collector only listens on 127.0.0.1 unless another address is given.
+# Since the measurements decide which instance types the Job Manager uses,
+# set rds_config.collector_token when it listens on other addresses: the
+# workers send it with every request and the other requests are rejected.
+#
+# The workers use the collector when rds_config.collector_url is set (e.g.
+# "http://<job manager address>:8000"). If it cannot be reached, the
+# measurements are appended to a local spool file (rds_config.collector_spool,
+# one JSON object per line) and sent with the next report.
+
+import hmac
+import json
+import logging
+import math
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import rds_config
+import rds_operations
+
+# Address and port where the collector listens
+DEFAULT_ADDRESS = "127.0.0.1"
+DEFAULT_PORT = 8000
+
+# HTTP header with rds_config.collector_token
+TOKEN_HEADER = "X-Collector-Token"
+
+# Number of measurements waiting that triggers a write
+BATCH_SIZE = 500
+
+# Maximum time in seconds a measurement waits before being written
+FLUSH_INTERVAL = 5
+
+# Number of flushes that may fail to write a measurement because the
+# database cannot be reached before it is discarded
+MAX_ATTEMPTS = 10
+
+# Maximum number of measurements of each kind waiting to be written
+MAX_WAITING = 100000
+
+# Timeout in seconds of the requests sent to the collector
+CLIENT_TIMEOUT = 5
+
+# Kinds of measurements accepted (URL paths) and the fields of each one
+FIELDS = {"interpsec": ("aph", "apm", "window", "np", "gens", "data_hash", "instance_type", "interpsec"),
+          "interpols": ("aph", "apm", "window", "np", "gens", "data_hash", "interpols")}
+KINDS = tuple(FIELDS.keys())
+
+# Type of the value of each field (the numbers must be JSON numbers and the
+# integers must have no fractional part)
+FIELD_TYPES = {"aph": float, "apm": float, "window": float, "np": int, "gens": int, "data_hash": str,
+               "instance_type": str, "interpsec": float, "interpols": float}
+
+# function convert_record
+# \param kind: "interpsec" or "interpols"
+# \param record: measurement as decoded from JSON
+# \return measurement with only the fields of the kind, each one of its type
+#
+# Raises ValueError if a field is missing or has a value of the wrong type.
+def convert_record(kind, record):
+    if not isinstance(record, dict):
+        raise ValueError("measurement is not an object")
+
+    converted = {}
+    for field in FIELDS[kind]:
+        if field not in record:
+            raise ValueError("missing field " + field)
+        value = record[field]
+        field_type = FIELD_TYPES[field]
+        if field_type is str:
+            if not isinstance(value, str) or value == "":
+                raise ValueError("invalid " + field)
+        else:
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+                raise ValueError("invalid " + field)
+            if field_type is int:
+                if value != int(value):
+                    raise ValueError("invalid " + field)
+                value = int(value)
+            else:
+                value = float(value)
+        converted[field] = value
+
+    return converted
+
+class measurement_collector:
+
+    # function __init__
+    # \param logger: logger object
+    # \param batch_size: number of measurements waiting that triggers a write
+    # \param flush_interval: maximum time in seconds between writes
+    # \param max_attempts: flushes that may fail to write a measurement
+    # \param max_waiting: maximum number of measurements of each kind waiting
+    def __init__(self, logger, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL, max_attempts=MAX_ATTEMPTS,
+                 max_waiting=MAX_WAITING):
+        self.logger = logger
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.max_waiting = max_waiting
+        # Measurements of each kind waiting, as (failed attempts, measurement)
+        self.buffers = {kind: [] for kind in KINDS}
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopped = False
+        self.thread = None
+
+        # Ids already resolved (only used by the writer thread)
+        self.parameters_ids = {}
+        self.data_ids = {}
+        self.experiment_ids = {}
+
+    # function add
+    # \param kind: "interpsec" or "interpols"
+    # \param records: list of measurements (dictionaries)
+    def add(self, kind, records):
+        self.keep(kind, [(0, record) for record in records], first=False)
+
+    # function keep
+    # \param kind: "interpsec" or "interpols"
+    # \param entries: list of (failed attempts, measurement)
+    # \param first: whether they are written before the ones waiting (they
+    # were waiting already)
+    #
+    # Adds the measurements to the ones waiting, discarding the oldest ones
+    # beyond max_waiting.
+    def keep(self, kind, entries, first):
+        with self.lock:
+            if first:
+                self.buffers[kind] = entries + self.buffers[kind]
+            else:
+                self.buffers[kind].extend(entries)
+            excess = len(self.buffers[kind]) - self.max_waiting
+            if excess > 0:
+                del self.buffers[kind][:excess]
+            waiting = sum(len(buffer) for buffer in self.buffers.values())
+
+        if excess > 0:
+            self.logger.error("DISCARDING THE " + str(excess) + " OLDEST " + kind.upper() + " MEASUREMENTS (MORE "
+                              "THAN " + str(self.max_waiting) + " WAITING)")
+        if waiting >= self.batch_size:
+            self.wake.set()
+
+    # function retry
+    # \param kind: "interpsec" or "interpols"
+    # \param entries: list of (failed attempts, measurement) not written
+    # because the database could not be reached
+    # \param error: exception raised
+    #
+    # Keeps the measurements for the next flush, except the ones that already
+    # failed max_attempts times.
+    def retry(self, kind, entries, error):
+        kept = [(attempts + 1, record) for attempts, record in entries if attempts + 1 < self.max_attempts]
+        self.logger.error("COULD NOT WRITE " + kind.upper() + " MEASUREMENTS, KEEPING " + str(len(kept)) +
+                          " FOR THE NEXT FLUSH AND DISCARDING " + str(len(entries) - len(kept)) + " (" +
+                          str(error) + ")")
+        self.keep(kind, kept, first=True)
+
+    # function discard
+    # \param kind: "interpsec" or "interpols"
+    # \param record: measurement that cannot be written
+    # \param error: exception raised by it
+    def discard(self, kind, record, error):
+        self.logger.error("DISCARDING " + kind.upper() + " MEASUREMENT " + repr(record) + " (" + str(error) + ")")
+
+    # function get_idparameters
+    # \param conn: Database connection object
+    # \param record: measurement with aph, apm, window, np and gens
+    # \return idparameters (looked up in the database only once)
+    def get_idparameters(self, conn, record):
+        key = (float(record["aph"]), float(record["apm"]), float(record["window"]), int(record["np"]),
+               int(record["gens"]))
+        if key not in self.parameters_ids:
+            self.parameters_ids[key] = rds_operations.get_idparameters(conn, *key)
+        return self.parameters_ids[key]
+
+    # function get_iddata
+    # \param conn: Database connection object
+    # \param data_hash: md5sum of the data set
+    # \return iddata, -1 if the data set is not in the database (not cached,
+    # so it is found once it is stored)
+    def get_iddata(self, conn, data_hash):
+        if data_hash not in self.data_ids:
+            iddata = rds_operations.get_iddata(conn, data_hash)
+            if iddata == -1:
+                return iddata
+            self.data_ids[data_hash] = iddata
+        return self.data_ids[data_hash]
+
+    # function get_idexperiment
+    # \param conn: Database connection object
+    # \param iddata: id for the data set
+    # \param idparameters: id for the parameters
+    # \param instance_type: string containing the instance type
+    # \return idexperiment (looked up in the database only once)
+    def get_idexperiment(self, conn, iddata, idparameters, instance_type):
+        key = (iddata, idparameters, instance_type)
+        if key not in self.experiment_ids:
+            self.experiment_ids[key] = rds_operations.get_idexperiment(conn, iddata, idparameters, instance_type)
+        return self.experiment_ids[key]
+
+    # function row
+    # \param conn: Database connection object
+    # \param kind: "interpsec" or "interpols"
+    # \param record: measurement of the kind
+    # \return arguments of the measurement for insert_interpsec_many or
+    # insert_interpols_many
+    #
+    # Raises ValueError if the measurement is not valid or its data set is not
+    # in the database.
+    def row(self, conn, kind, record):
+        record = convert_record(kind, record)
+        iddata = self.get_iddata(conn, record["data_hash"])
+        if iddata == -1:
+            raise ValueError("unknown data " + record["data_hash"])
+
+        idparameters = self.get_idparameters(conn, record)
+        if kind == "interpsec":
+            return (self.get_idexperiment(conn, iddata, idparameters, record["instance_type"]), record["interpsec"])
+        return (idparameters, iddata, record["interpols"])
+
+    # function insert
+    # \param conn: Database connection object
+    # \param kind: "interpsec" or "interpols"
+    # \param rows: arguments returned by row
+    def insert(self, conn, kind, rows):
+        if kind == "interpsec":
+            rds_operations.insert_interpsec_many(conn, rows)
+        else:
+            rds_operations.insert_interpols_many(conn, rows)
+
+    # function write
+    # \param kind: "interpsec" or "interpols"
+    # \param entries: list of (failed attempts, measurement)
+    # \return number of measurements written
+    #
+    # The ids of each measurement are resolved on its own, and the ones that
+    # cannot be resolved because of their values are discarded. The others are
+    # written in a single transaction or, if it fails because of the values,
+    # one at a time, discarding the ones that fail. When the database cannot be
+    # reached, the measurements not written yet are kept (see retry).
+    def write(self, kind, entries):
+        try:
+            conn = rds_operations.rds_connect()
+        except SystemExit:
+            # (rds_connect exits when the database cannot be reached)
+            self.retry(kind, entries, "no connection to the database")
+            return 0
+        transient = rds_operations.transient_errors(conn)
+
+        resolved = []
+        for position, (attempts, record) in enumerate(entries):
+            try:
+                resolved.append(((attempts, record), self.row(conn, kind, record)))
+            except transient as e:
+                self.retry(kind, [entry for entry, row in resolved] + entries[position:], e)
+                return 0
+            except Exception as e:
+                self.discard(kind, record, e)
+        if len(resolved) == 0:
+            return 0
+
+        try:
+            self.insert(conn, kind, [row for entry, row in resolved])
+            return len(resolved)
+        except transient as e:
+            self.retry(kind, [entry for entry, row in resolved], e)
+            return 0
+        except Exception as e:
+            self.logger.error("COULD NOT WRITE " + kind.upper() + " MEASUREMENTS TOGETHER, WRITING THEM ONE AT A TIME "
+                              "(" + str(e) + ")")
+
+        written = 0
+        for position, (entry, row) in enumerate(resolved):
+            try:
+                self.insert(conn, kind, [row])
+                written += 1
+            except transient as e:
+                self.retry(kind, [entry for entry, row in resolved[position:]], e)
+                break
+            except Exception as e:
+                self.discard(kind, entry[1], e)
+
+        return written
+
+    # function flush
+    # \return number of measurements written
+    #
+    # Writes every measurement waiting, each kind on its own (see write).
+    def flush(self):
+        with self.lock:
+            buffers = self.buffers
+            self.buffers = {kind: [] for kind in KINDS}
+
+        written = {kind: 0 for kind in KINDS}
+        for kind in KINDS:
+            if len(buffers[kind]) > 0:
+                written[kind] = self.write(kind, buffers[kind])
+
+        if sum(written.values()) > 0:
+            self.logger.debug("WROTE " + str(written["interpsec"]) + " PERFORMANCE AND " +
+                              str(written["interpols"]) + " TASKS MEASUREMENTS")
+        return sum(written.values())
+
+    # function run
+    # Writes the measurements until stop is called (body of the writer thread)
+    def run(self):
+        while not self.stopped:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+        self.flush()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # function stop
+    # Stops the writer thread after writing the measurements still waiting
+    def stop(self):
+        self.stopped = True
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join()
+
+class request_handler(BaseHTTPRequestHandler):
+
+    # function do_POST
+    # Accepts a JSON list of measurements posted to /interpsec or /interpols,
+    # with the token of the server (if it has one)
+    def do_POST(self):
+        token = self.server.token
+        if token and not hmac.compare_digest(self.headers.get(TOKEN_HEADER, "").encode("utf-8"),
+                                             token.encode("utf-8")):
+            self.send_error(403)
+            return
+
+        kind = self.path.strip("/")
+        if kind not in KINDS:
+            self.send_error(404)
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            records = json.loads(self.rfile.read(length).decode("utf-8"))
+            if isinstance(records, dict):
+                records = [records]
+            if not isinstance(records, list):
+                raise ValueError("not a list of measurements")
+            records = [convert_record(kind, record) for record in records]
+        except (ValueError, TypeError):
+            self.send_error(400)
+            return
+
+        self.server.collector.add(kind, records)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        self.server.collector.logger.debug(format % args)
+
+# function read_spool
+# \param path: spool file
+# \param pending: dictionary with the list of measurements of each kind, where
+# the ones in the spool are added
+#
+# Lines that cannot be read (e.g. truncated by a report that was killed) are
+# skipped.
+def read_spool(path, pending):
+    with open(path) as spool_f:
+        for line in spool_f:
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                pending[entry["kind"]].append(entry["record"])
+            except (ValueError, KeyError, TypeError):
+                print("Skipping invalid spool line: " + line.strip())
+
+# function write_spool
+# \param path: spool file
+# \param kind: "interpsec" or "interpols"
+# \param records: measurements appended to the spool
+def write_spool(path, kind, records):
+    with open(path, "a") as spool_f:
+        for record in records:
+            spool_f.write(json.dumps({"kind": kind, "record": record}) + "\n")
+
+# function send
+# \param url: address of the collector (rds_config.collector_url)
+# \param kind: "interpsec" or "interpols"
+# \param record: measurement (dictionary)
+# \param spool: file where the measurements that could not be sent are kept
+#
+# Posts the measurement, together with the ones left in the spool by previous
+# reports, to the collector (with rds_config.collector_token). The ones that
+# cannot be sent are (again) appended to the spool, the ones rejected by the
+# collector as invalid (4xx other than a wrong token) are dropped.
+def send(url, kind, record, spool):
+    import requests
+
+    pending = {name: [] for name in KINDS}
+    pending[kind].append(record)
+
+    # The spool is moved away before being read, so that reports running at
+    # the same time do not send it twice. It is only removed once its
+    # measurements were sent or appended to the spool again.
+    sending = spool + "." + str(os.getpid())
+    try:
+        os.rename(spool, sending)
+    except (IOError, OSError):
+        sending = None
+    if sending is not None:
+        try:
+            read_spool(sending, pending)
+        except (IOError, OSError):
+            pass
+
+    # Invalid measurements would make the collector reject the whole list
+    for name in KINDS:
+        valid = []
+        for entry in pending[name]:
+            try:
+                valid.append(convert_record(name, entry))
+            except ValueError as e:
+                print("Dropping invalid " + name + " measurement " + repr(entry) + " (" + str(e) + ")")
+        pending[name] = valid
+
+    headers = {}
+    if rds_config.collector_token:
+        headers[TOKEN_HEADER] = rds_config.collector_token
+
+    failed = {name: [] for name in KINDS}
+    try:
+        for name in KINDS:
+            if len(pending[name]) == 0:
+                continue
+            try:
+                response = requests.post(url.rstrip("/") + "/" + name, json=pending[name], headers=headers,
+                                         timeout=CLIENT_TIMEOUT)
+                if 400 <= response.status_code < 500 and response.status_code not in (401, 403):
+                    print("Collector rejected " + str(len(pending[name])) + " " + name + " measurements (" +
+                          str(response.status_code) + ")")
+                    continue
+                response.raise_for_status()
+            except requests.RequestException:
+                failed[name] = pending[name]
+    except BaseException:
+        failed = pending
+        raise
+    finally:
+        for name in KINDS:
+            if len(failed[name]) > 0:
+                write_spool(spool, name, failed[name])
+        if sending is not None:
+            os.remove(sending)
+
+# function get_from_input
+#
+# \param _string: String to be searched from input
+# \param input_dict: Input dictionary of pairs key=value
+# \return Value stored for _string or -1 if it does not exist
+def get_from_input(_string, input_dict):
+    if _string in input_dict:
+        return input_dict[_string]
+    else:
+        return -1
+
+# function main
+# \param (command line input) address : address where the collector listens (default 127.0.0.1, 0.0.0.0 for every
+# interface)
+# \param (command line input) port : port where the collector listens (default 8000)
+# \param (command line input) batch_size : number of measurements waiting that triggers a write (default 500)
+# \param (command line input) flush_interval : maximum time in seconds between writes (default 5)
+def main():
+    input_dict = {}
+    for cur in sys.argv:
+        if '=' in cur:
+            key, val = cur.split('=')
+            input_dict.update({key: val})
+
+    address = get_from_input("address", input_dict)
+    if (address == -1):
+        address = DEFAULT_ADDRESS
+
+    port = int(get_from_input("port", input_dict))
+    if (port == -1):
+        port = DEFAULT_PORT
+
+    batch_size = int(get_from_input("batch_size", input_dict))
+    if (batch_size == -1):
+        batch_size = BATCH_SIZE
+
+    flush_interval = float(get_from_input("flush_interval", input_dict))
+    if (flush_interval == -1):
+        flush_interval = FLUSH_INTERVAL
+
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(levelname)-8s %(message)s")
+    logger = logging.getLogger(__name__)
+
+    collector = measurement_collector(logger, batch_size, flush_interval)
+    collector.start()
+
+    server = ThreadingHTTPServer((address, port), request_handler)
+    server.collector = collector
+    server.token = rds_config.collector_token
+    if not server.token and address not in ("127.0.0.1", "localhost"):
+        logger.warning("NO COLLECTOR TOKEN, ANYONE REACHING " + address + ":" + str(port) +
+                       " CAN STORE MEASUREMENTS")
+    logger.info("COLLECTING MEASUREMENTS ON " + address + ":" + str(port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        collector.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2019 Nicholas Torres Okita <nicholas.okita@ggaunicamp.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+# This file contains the monitoring phase of the Job Manager control loop
+# (to_execute.py). After a single (paginated) describe_instances, the requests
+# needed to know the state of every running instance (CloudWatch metrics and
+# spot prices) are made concurrently by a bounded pool of threads, and the
+# phase ends at a deadline even if some of them did not answer yet.
+
+import time
+from datetime import datetime
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from instrumentation import instrumentation
+
+class fleet_monitor:
+
+    # function __init__
+    # \param ops: instance_operations object
+    # \param metrics: cloudwatch_metrics.metrics_collector object
+    # \param logger: logger to output information
+    # \param workers: maximum number of concurrent requests
+    # \param instruments: instrumentation object where the time of the
+    # requests is added (phases inventory, metrics, prices and monitor_wait),
+    # a new one if None
+    def __init__(self, ops, metrics, logger, workers=16, instruments=None):
+        self.ops = ops
+        self.metrics = metrics
+        self.logger = logger
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        if instruments is None:
+            instruments = instrumentation()
+        self.instruments = instruments
+
+    # function gather
+    # \param interval: control loop interval in minutes (the metrics of the
+    # last 2*interval minutes are requested)
+    # \param deadline: maximum time in seconds to wait for the requests
+    # \return list of dictionaries, one for each running instance, with the
+    # keys instance_id, instance_type, instance_az, init_time, price, metrics
+    # ({metric: [(timestamp, value), ...]}, most recent first) and stale
+    #
+    # An instance is marked as stale if any of the requests with its
+    # information missed the deadline, in which case the fields that could not
+    # be gathered are None. Requests that missed the deadline keep running in
+    # the background and their results are simply discarded.
+    def gather(self, interval, deadline):
+        deadline_at = time.monotonic() + deadline
+
+        with self.instruments.span("inventory"):
+            inventory = self.ops.get_fleet_inventory()
+
+        instances = []
+        for record in inventory:
+            instances.append({"instance_id": record.instance_id,
+                              "instance_type": record.instance_type,
+                              "instance_az": record.az,
+                              "init_time": record.launch_time,
+                              "price": None,
+                              "metrics": None,
+                              "stale": False})
+
+        # Spot prices of every type running, refreshed at once
+        price_future = self.executor.submit(self.instruments.timed("prices", self.ops.prefetch_spot_prices),
+                                            set(inst["instance_type"] for inst in instances))
+
+        # CloudWatch metrics, one request for each chunk of queries
+        metrics_end = datetime.today()
+        metrics_start = metrics_end - timedelta(minutes=2*interval)
+        queries, query_ids = self.metrics.build_queries([(inst["instance_id"], inst["instance_type"])
+                                                         for inst in instances])
+        metric_futures = []
+        for chunk in self.metrics.chunks(queries):
+            chunk_ids = set(query_ids[query['Id']][0] for query in chunk)
+            metric_futures.append((chunk_ids, self.executor.submit(self.instruments.timed("metrics", self.metrics.fetch),
+                                                                     chunk, metrics_start, metrics_end)))
+
+        all_futures = [price_future] + [future for _, future in metric_futures]
+        with self.instruments.span("monitor_wait"):
+            wait(all_futures, timeout=max(0, deadline_at - time.monotonic()))
+
+        stale_ids = set()
+        series = {}
+        for chunk_ids, future in metric_futures:
+            if future.done() and future.exception() is None:
+                self.metrics.merge(future.result(), query_ids, series)
+            else:
+                stale_ids.update(chunk_ids)
+
+        for inst in instances:
+            # If the prices were not refreshed in time, use the last ones known
+            inst["price"] = self.ops.peek_spot_price(inst["instance_type"], inst["instance_az"])
+            if inst["price"] == -1 and not (price_future.done() and price_future.exception() is None):
+                stale_ids.add(inst["instance_id"])
+
+            if inst["instance_id"] not in stale_ids:
+                inst["metrics"] = series.get(inst["instance_id"], {})
+            else:
+                inst["stale"] = True
+
+        for future in all_futures:
+            if future.done() and future.exception() is not None:
+                self.logger.error("MONITORING REQUEST FAILED: " + str(future.exception()))
+        if len(stale_ids) > 0:
+            self.logger.info("MONITORING DEADLINE MISSED FOR " + str(len(stale_ids)) + " INSTANCES")
+
+        return instances
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2019 Nicholas Torres Okita <nicholas.okita@ggaunicamp.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+# This file runs many independent replicas of the simulation (simulation.py)
+# for the same scenario, spread over a pool of processes, and returns the
+# distribution of the completion time and money spent. A single simulation is
+# a single random trajectory (failures and performance oscillations are
+# random), so it says little about how the selection behaves.
+#
+# Each replica has its own random number generator, seeded from a seed
+# sequence, so a sweep is reproducible and does not depend on how the
+# replicas are distributed between processes. The prices are loaded once per
+# process (a price trace is memory mapped and shared by all of them).
+#
+# Example:
+#
+# python monte_carlo.py replicas=10000 seed=1 budget=3 nodes=12 time_skip=5 \
+#     failure_create=0.2 failure_exec=0.05 data_hash=... prices=log_prices.trace
+
+import logging
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from pseudo_instance_operations import load_prices
+from pseudo_instance_operations import pseudo_instance_operations
+from simulation import simulator
+
+# Percentiles reported by summarize
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# Prices loaded by each worker process (see init_worker)
+_series = None
+
+# function get_from_input
+#
+# \param _string: String to be searched from input
+# \param input_dict: Input dictionary of pairs key=value
+# \return Value stored for _string or -1 if it does not exist
+def get_from_input(_string, input_dict):
+    if _string in input_dict:
+        return input_dict[_string]
+    else:
+        return -1
+
+# function init_worker
+# \param price_file: price log or price trace used by the replicas
+# Loads the prices once for every replica executed by the process
+def init_worker(price_file):
+    global _series
+    _series = load_prices(price_file)
+
+# function null_logger
+# \return logger that discards everything (thousands of replicas logging every
+# iteration would take longer than the simulation itself)
+def null_logger():
+    logger = logging.getLogger("monte_carlo.replica")
+    if len(logger.handlers) == 0:
+        logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    logger.disabled = True
+    return logger
+
+# function run_replica
+# \param args: (scenario, seed) where scenario is a dictionary as created by
+# make_scenario
+# \return (time, spent, tasks, budget, finished) of the replica
+def run_replica(args):
+    scenario, seed = args
+    if _series is None:
+        init_worker(scenario["price_file"])
+
+    rng = random.Random(seed)
+    provider = pseudo_instance_operations(failure_create=scenario["failure_create"], rng=rng, series=_series)
+    sim = simulator(null_logger(), provider, scenario["profile"], scenario["jm_interpsec"],
+                    scenario["target_tasks"], scenario["budget"], scenario["nodes"], scenario["time_skip"],
+                    scenario["failure_exec"], scenario["zones"], scenario["mode"], scenario["boot_time"], rng,
+                    scenario["valid_count"], scenario["excluded"])
+    result = sim.run(scenario["max_time"])
+
+    return (result["time"], result["spent"], result["tasks"], result["budget"], result["finished"])
+
+# function make_scenario
+# \param price_file: price log or price trace
+# \param profile: (instance types, interpsec, stddev) as returned by
+# selection.profile_arrays
+# \param jm_interpsec: performance row of the Job Manager instance type
+# \param target_tasks: number of tasks to be executed
+# \param budget: budget in dollars to complete the execution
+# \param nodes: number of instances running
+# \param time_skip: time between two iterations of the control loop in minutes
+# \param failure_create: failure rate when creating an instance
+# \param failure_exec: failure rate (per iteration) while instance is running
+# \param zones: list of availability zones
+# \param mode: "step" or "event" (see simulation.simulator.run)
+# \param boot_time: time in minutes until a new instance starts working
+# \param max_time: simulated minutes after which a replica is stopped (None
+# for no limit), such replicas are reported as not finished
+# \param valid_count: number of iterations an instance may be below the
+# target ratio before being terminated
+# \param excluded: instance types that are never launched
+# \return dictionary describing the scenario
+def make_scenario(price_file, profile, jm_interpsec, target_tasks, budget, nodes, time_skip,
+                  failure_create, failure_exec, zones, mode="step", boot_time=0, max_time=None, valid_count=1,
+                  excluded=()):
+    return {"price_file": price_file,
+            "profile": profile,
+            "jm_interpsec": jm_interpsec,
+            "target_tasks": target_tasks,
+            "budget": budget,
+            "nodes": nodes,
+            "time_skip": time_skip,
+            "failure_create": failure_create,
+            "failure_exec": failure_exec,
+            "zones": zones,
+            "mode": mode,
+            "boot_time": boot_time,
+            "max_time": max_time,
+            "valid_count": valid_count,
+            "excluded": list(excluded)}
+
+# function replica_seeds
+# \param replicas: number of replicas
+# \param seed: seed of the whole sweep
+# \return list with one independent seed for each replica
+def replica_seeds(replicas, seed=None):
+    return [int(s) for s in np.random.SeedSequence(seed).generate_state(replicas, dtype=np.uint64)]
+
+# function run
+# \param scenario: dictionary as created by make_scenario
+# \param replicas: number of replicas
+# \param seed: seed of the whole sweep (None for a random one)
+# \param workers: number of processes (defaults to the number of cores)
+# \return dictionary of arrays, one element per replica: time (simulated
+# minutes), spent (dollars), tasks, budget (final budget, after the
+# increases) and finished
+def run(scenario, replicas, seed=None, workers=None):
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    args = [(scenario, s) for s in replica_seeds(replicas, seed)]
+    if workers == 1:
+        results = list(map(run_replica, args))
+    else:
+        chunksize = max(1, replicas // (workers * 8))
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(scenario["price_file"],)) as executor:
+            results = list(executor.map(run_replica, args, chunksize=chunksize))
+
+    columns = list(zip(*results)) if len(results) > 0 else [[]] * 5
+    return {"time": np.array(columns[0], dtype=np.float64),
+            "spent": np.array(columns[1], dtype=np.float64),
+            "tasks": np.array(columns[2], dtype=np.float64),
+            "budget": np.array(columns[3], dtype=np.float64),
+            "finished": np.array(columns[4], dtype=bool)}
+
+# function summarize
+# \param results: dictionary of arrays returned by run
+# \param percentiles: percentiles to be computed
+# \return dictionary {metric: {"mean", "std", "percentiles"}} for the
+# completion time and money spent of the replicas that finished, plus the
+# fraction of replicas that finished
+def summarize(results, percentiles=PERCENTILES):
+    finished = results["finished"]
+    summary = {"replicas": len(finished),
+               "finished": float(finished.mean()) if len(finished) > 0 else 0.0}
+    for metric in ("time", "spent"):
+        values = results[metric][finished]
+        if len(values) == 0:
+            summary[metric] = {"mean": np.nan, "std": np.nan,
+                               "percentiles": np.full(len(percentiles), np.nan)}
+        else:
+            summary[metric] = {"mean": float(values.mean()),
+                               "std": float(values.std()),
+                               "percentiles": np.percentile(values, percentiles)}
+
+    return summary
+
+# function main
+#
+# \param (command line input) replicas : number of replicas (default 1000)
+# \param (command line input) seed : seed of the sweep (default random)
+# \param (command line input) workers : number of processes (default: number of cores)
+# \param (command line input) output : optional .npz file where the arrays of every replica are saved
+# \param (command line input) max_time : simulated minutes after which a replica is stopped
+# \param (command line input) engine : "process" (default) runs simulation.simulator replicas on a process pool,
+# "vector" runs all replicas in this process with vector_simulation.py (step mode only)
+# (the remaining parameters are the same as simulation.py)
+#
+# The performance of the instances and the number of tasks are read from the
+# database once, before the replicas start.
+def main():
+    import rds_operations
+    import selection
+
+    input_dict = {}
+    for cur in sys.argv:
+        if '=' in cur:
+            key, val = cur.split('=')
+            input_dict.update({key: val})
+
+    replicas = int(get_from_input("replicas", input_dict))
+    if (replicas == -1):
+        replicas = 1000
+    seed = int(get_from_input("seed", input_dict))
+    if (seed == -1):
+        seed = None
+    workers = int(get_from_input("workers", input_dict))
+    if (workers == -1):
+        workers = None
+    max_time = float(get_from_input("max_time", input_dict))
+    if (max_time == -1):
+        max_time = None
+
+    time_skip = float(get_from_input("time_skip", input_dict))
+    failure_create = float(get_from_input("failure_create", input_dict))
+    failure_exec = float(get_from_input("failure_exec", input_dict))
+    budget = float(get_from_input("budget", input_dict))
+    data_hash = get_from_input("data_hash", input_dict)
+    target_nodes = int(get_from_input("nodes", input_dict))
+    price_file = get_from_input("prices", input_dict)
+    if (price_file == -1):
+        price_file = "log_prices.csv"
+    mode = get_from_input("mode", input_dict)
+    if (mode == -1):
+        mode = "step"
+    boot_time = float(get_from_input("boot_time", input_dict))
+    if (boot_time == -1):
+        boot_time = 0
+    valid_count = int(get_from_input("valid_count", input_dict))
+    if (valid_count == -1):
+        valid_count = 1
+    excluded = get_from_input("exclude", input_dict)
+    if (excluded == -1):
+        excluded = ""
+    excluded = [instance_type for instance_type in excluded.split(",") if instance_type]
+
+    all_zones = ['us-east-1a', 'us-east-1b', 'us-east-1c', 'us-east-1d', 'us-east-1e', 'us-east-1f']
+
+    idparameters = 41
+
+    conn = rds_operations.rds_connect()
+    iddata = rds_operations.get_iddata(conn, data_hash)
+    target_tasks = float(get_from_input("target_tasks", input_dict))
+    if (target_tasks == -1):
+        target_tasks = rds_operations.get_interpols(conn, idparameters, iddata)
+    jm_interpsec = rds_operations.get_interpsec(conn, iddata, idparameters, "c5.4xlarge")[0]
+    profile = selection.profile_arrays(rds_operations.get_interpsec_allinstances(conn, iddata, idparameters))
+
+    scenario = make_scenario(price_file, profile, jm_interpsec, target_tasks, budget, target_nodes, time_skip,
+                             failure_create, failure_exec, all_zones, mode, boot_time, max_time, valid_count,
+                             excluded)
+    engine = get_from_input("engine", input_dict)
+    if (engine == "vector"):
+        import vector_simulation
+        results = vector_simulation.run(scenario, replicas, seed)
+    else:
+        results = run(scenario, replicas, seed, workers)
+
+    output = get_from_input("output", input_dict)
+    if (output != -1):
+        np.savez(output, **results)
+
+    summary = summarize(results)
+    print("REPLICAS\t" + str(summary["replicas"]) + "\tFINISHED\t" + str(summary["finished"]))
+    print("METRIC\tMEAN\tSTD\t" + "\t".join("P" + str(p) for p in PERCENTILES))
+    for metric in ("time", "spent"):
+        print(metric + "\t" + str(summary[metric]["mean"]) + "\t" + str(summary[metric]["std"]) + "\t" +
+              "\t".join(str(v) for v in summary[metric]["percentiles"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2019 Nicholas Torres Okita <nicholas.okita@ggaunicamp.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+# This file computes the Pareto frontier (time to run x cost) of the possible
+# configurations of an experiment: number of nodes, instance type and
+# availability zone. It uses the same estimate as the pareto function of
+# to_execute.py and simulation.py, that is, a Job Manager c5.4xlarge, disks of
+# 20GB 1000IOPS and a performance penalty of 0.1% for each new instance:
+#
+# time_to_run = target_tasks / (jm_perf + interpsec * n * (1 - (n - 1) / 1000))
+# cost = time_to_run * (n * price + 0.68) / 3600
+#
+# but evaluates the whole grid at once and keeps only the configurations that
+# are not dominated (no other one is both faster and cheaper), so the nodes
+# and budget of a new experiment can be chosen from a single table.
+#
+# Example (prices from a price log instead of the current Spot prices):
+#
+# python pareto_frontier.py data_hash=... nodes=1-64 budgets=5,10,20 prices=log_prices.csv
+
+import csv
+import sys
+import numpy as np
+import selection
+
+# Hourly price of the Job Manager instance (c5.4xlarge On-Demand)
+JM_COST = 0.68
+
+# Instance type of the Job Manager
+JM_TYPE = "c5.4xlarge"
+
+# Record of each configuration
+CONFIG_DTYPE = np.dtype([("nodes", np.int64),
+                         ("instance_type", "U32"),
+                         ("az", "U32"),
+                         ("price", np.float64),
+                         ("interpsec", np.float64),
+                         ("time", np.float64),
+                         ("cost", np.float64)])
+
+# Record of the best configuration for each budget
+BUDGET_DTYPE = np.dtype([("budget", np.float64)] + CONFIG_DTYPE.descr)
+
+# function get_from_input
+#
+# \param _string: String to be searched from input
+# \param input_dict: Input dictionary of pairs key=value
+# \return Value stored for _string or -1 if it does not exist
+def get_from_input(_string, input_dict):
+    if _string in input_dict:
+        return input_dict[_string]
+    else:
+        return -1
+
+# function evaluate_grid
+# \param target_tasks: number of tasks to be executed
+# \param jm_perf: performance (interpsec) of the Job Manager
+# \param instance_types: list of instance types
+# \param interpsec: performance of each instance type
+# \param prices: matrix (types x zones) with the spot prices, NaN or a
+# non-positive value where there is no price
+# \param zones: list of availability zones
+# \param node_counts: list of numbers of nodes
+# \param overhead: cost added to every spot price (disk)
+# \return array of CONFIG_DTYPE records, one for each (nodes, type, az) with
+# a price, time in seconds and cost in dollars
+def evaluate_grid(target_tasks, jm_perf, instance_types, interpsec, prices, zones, node_counts,
+                  overhead=selection.DISK_COST):
+    interpsec = np.asarray(interpsec, dtype=np.float64)
+    prices = np.asarray(prices, dtype=np.float64).reshape(len(interpsec), -1)
+    nodes = np.asarray(node_counts, dtype=np.int64)
+
+    with np.errstate(invalid="ignore"):
+        type_idx, az_idx = np.nonzero(np.isfinite(prices) & (prices > 0))
+    price = prices[type_idx, az_idx] + overhead
+
+    # Configurations as (nodes) x (type, az) matrices
+    n = nodes[:, None].astype(np.float64)
+    rate = jm_perf + interpsec[type_idx][None, :] * n * (1 - ((n - 1) / 1000.0))
+    with np.errstate(divide="ignore"):
+        time_to_run = target_tasks / rate
+    cost = time_to_run * (n * price[None, :] + JM_COST) / 3600
+
+    configs = np.empty(time_to_run.size, dtype=CONFIG_DTYPE)
+    configs["nodes"] = np.repeat(nodes, len(type_idx))
+    configs["instance_type"] = np.tile(np.asarray(instance_types, dtype="U32")[type_idx], len(nodes))
+    configs["az"] = np.tile(np.asarray(zones, dtype="U32")[az_idx], len(nodes))
+    configs["price"] = np.tile(price, len(nodes))
+    configs["interpsec"] = np.tile(interpsec[type_idx], len(nodes))
+    configs["time"] = time_to_run.ravel()
+    configs["cost"] = cost.ravel()
+
+    # Configurations that never finish (no performance at all) are discarded
+    return configs[np.isfinite(configs["time"]) & (configs["time"] > 0)]
+
+# function non_dominated
+# \param configs: array of CONFIG_DTYPE records
+# \return the configurations that are not dominated, from the fastest (and
+# most expensive) to the slowest (and cheapest)
+#
+# After sorting by time (and cost, to break ties), a configuration is on the
+# frontier if it is cheaper than every faster configuration.
+def non_dominated(configs):
+    order = np.lexsort((configs["cost"], configs["time"]))
+    configs = configs[order]
+    if len(configs) == 0:
+        return configs
+
+    cheapest_before = np.minimum.accumulate(configs["cost"])
+    keep = np.empty(len(configs), dtype=bool)
+    keep[0] = True
+    keep[1:] = configs["cost"][1:] < cheapest_before[:-1]
+
+    return configs[keep]
+
+# function best_within_budgets
+# \param frontier: array returned by non_dominated
+# \param budgets: list of budgets in dollars
+# \return array of BUDGET_DTYPE records with the fastest configuration that
+# costs at most each budget (budgets that cannot pay for any configuration are
+# not in the result)
+def best_within_budgets(frontier, budgets):
+    budgets = np.asarray(budgets, dtype=np.float64)
+    # The frontier is sorted by decreasing cost, so the fastest configuration
+    # within a budget is the first one whose cost does not exceed it
+    costs = frontier["cost"][::-1]
+    idx = len(frontier) - np.searchsorted(costs, budgets, side="right")
+    found = idx < len(frontier)
+
+    best = np.empty(int(found.sum()), dtype=BUDGET_DTYPE)
+    best["budget"] = budgets[found]
+    for name in CONFIG_DTYPE.names:
+        best[name] = frontier[name][idx[found]]
+
+    return best
+
+# function compute_frontier
+# \param ops: object that gives the spot prices (instance_operations or
+# pseudo_instance_operations)
+# \param all_performance: rows returned by rds_operations.get_interpsec_allinstances
+# \param target_tasks: number of tasks to be executed
+# \param node_counts: list of numbers of nodes
+# \param zones: list of availability zones
+# \return non dominated configurations (array of CONFIG_DTYPE records)
+def compute_frontier(ops, all_performance, target_tasks, node_counts, zones):
+    instance_types, interpsec, stddev = selection.profile_arrays(all_performance)
+
+    jm_perf = 0
+    for result in all_performance:
+        if result[0] == JM_TYPE:
+            jm_perf = float(result[1])
+
+    ops.prefetch_spot_prices(instance_types)
+    prices = selection.price_matrix(ops, instance_types, zones)
+
+    return non_dominated(evaluate_grid(target_tasks, jm_perf, instance_types, interpsec, prices, zones,
+                                       node_counts))
+
+# function write_table
+# \param records: structured array (CONFIG_DTYPE or BUDGET_DTYPE records)
+# \param filename: output file (tab separated, with a header)
+def write_table(records, filename):
+    with open(filename, "w") as output_f:
+        writer = csv.writer(output_f, delimiter="\t", lineterminator="\n")
+        writer.writerow(records.dtype.names)
+        for record in records:
+            writer.writerow(record.tolist())
+
+# function parse_nodes
+# \param value: "N" (1 to N nodes), "A-B" or "A-B:S" (A to B nodes in steps of S)
+# \return list of numbers of nodes
+def parse_nodes(value):
+    step = 1
+    if ":" in value:
+        value, step = value.split(":")
+        step = int(step)
+    if "-" in value:
+        first, last = value.split("-")
+    else:
+        first, last = 1, value
+
+    return list(range(int(first), int(last) + 1, step))
+
+# function main
+#
+# \param (command line input) data_hash : dataset hash stored in the database
+# \param (command line input) nodes : numbers of nodes evaluated ("N", "A-B" or "A-B:S")
+# \param (command line input) budgets : optional comma separated list of budgets in dollars, for each one the fastest
+# configuration within it is printed
+# \param (command line input) target_tasks : number of tasks to be executed (if empty, gets from database from
+# data_hash)
+# \param (command line input) prices : optional price log or price trace, if empty the current Spot prices are used
+# \param (command line input) output : file where the frontier is written (default pareto_frontier.csv)
+# (id parameters is set as default to 41, can be changed in code)
+def main():
+    import rds_operations
+
+    input_dict = {}
+    for cur in sys.argv:
+        if '=' in cur:
+            key, val = cur.split('=')
+            input_dict.update({key: val})
+
+    data_hash = get_from_input("data_hash", input_dict)
+    node_counts = parse_nodes(get_from_input("nodes", input_dict))
+    output = get_from_input("output", input_dict)
+    if (output == -1):
+        output = "pareto_frontier.csv"
+
+    all_zones = ['us-east-1a', 'us-east-1b', 'us-east-1c', 'us-east-1d', 'us-east-1e', 'us-east-1f']
+
+    idparameters = 41
+
+    conn = rds_operations.rds_connect()
+    iddata = rds_operations.get_iddata(conn, data_hash)
+    target_tasks = float(get_from_input("target_tasks", input_dict))
+    if (target_tasks == -1):
+        target_tasks = rds_operations.get_interpols(conn, idparameters, iddata)
+    all_performance = rds_operations.get_interpsec_allinstances(conn, iddata, idparameters)
+
+    price_file = get_from_input("prices", input_dict)
+    if (price_file == -1):
+        import logging
+        from instance_operations import instance_operations
+        ops = instance_operations(logging.getLogger(__name__))
+    else:
+        from pseudo_instance_operations import pseudo_instance_operations
+        ops = pseudo_instance_operations(price_file)
+
+    frontier = compute_frontier(ops, all_performance, target_tasks, node_counts, all_zones)
+    write_table(frontier, output)
+    print("Wrote " + str(len(frontier)) + " configurations to " + output)
+
+    budgets = get_from_input("budgets", input_dict)
+    if (budgets != -1):
+        best = best_within_budgets(frontier, [float(budget) for budget in budgets.split(",")])
+        print("BUDGET\tNODES\tINSTANCE_TYPE\tAZ\tTIME_TO_RUN(seconds)\tCOST(dollars)")
+        for record in best:
+            print("{}\t{}\t{}\t{}\t{}\t{}".format(record["budget"], record["nodes"], record["instance_type"],
+                                                  record["az"], record["time"], record["cost"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2019 Nicholas Torres Okita <nicholas.okita@ggaunicamp.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+# This file converts the price log used by the simulation (log_prices.csv) to
+# a columnar binary file (price trace) that can be memory mapped. The
+# conversion is executed once:
+#
+# python price_trace.py log_prices.csv log_prices.trace
+#
+# And then the simulation can use the trace file instead of the price log,
+# which takes milliseconds to open and shares its pages between processes.
+#
+# Trace file layout (all integers are little endian):
+# magic (8 bytes) | header length (uint64) | JSON header | padding | arrays
+#
+# The JSON header holds the dictionaries for instance types and availability
+# zones, the number of rows, the offsets of each array and the series table.
+# The rows are sorted by (instance type, availability zone, timestamp) and are
+# stored in three columns: epoch timestamps (int64), prices (float32) and the
+# dictionary encoded instance type and availability zone (int16 each). The
+# series table stores (type code, az code, first row, last row + 1) for each
+# pair that has at least one record.
+
+import sys
+import csv
+import json
+import struct
+from array import array
+from datetime import datetime
+import numpy as np
+from pseudo_instance_operations import TIMESTAMP_FORMAT, to_epoch
+
+TRACE_MAGIC = b"CPTRACE1"
+
+# function _align
+# \param offset: offset in bytes
+# \return offset rounded up to a multiple of 8 bytes
+def _align(offset):
+    return (offset + 7) // 8 * 8
+
+# function convert
+# \param csv_path: path to the price log (tab separated, see log_prices.csv)
+# \param trace_path: path to the trace file to be written
+# \return number of rows written
+#
+# Reads the price log and writes it as a price trace. The columns are kept in
+# compact arrays while reading, so even logs with millions of rows can be
+# converted without creating one Python object per row.
+def convert(csv_path, trace_path):
+    types = {}
+    zones = {}
+    timestamps = array('q')
+    prices = array('f')
+    type_codes = array('h')
+    az_codes = array('h')
+
+    with open(csv_path, "r") as input_f:
+        csv_dr = csv.DictReader(input_f, delimiter="\t")
+        for row in csv_dr:
+            timestamps.append(to_epoch(datetime.strptime(row['timestamp'], TIMESTAMP_FORMAT)))
+            prices.append(float(row['price']))
+            type_codes.append(types.setdefault(row['instance_type'], len(types)))
+            az_codes.append(zones.setdefault(row['az'], len(zones)))
+
+    timestamps = np.frombuffer(timestamps, dtype=np.int64)
+    prices = np.frombuffer(prices, dtype=np.float32)
+    type_codes = np.frombuffer(type_codes, dtype=np.int16)
+    az_codes = np.frombuffer(az_codes, dtype=np.int16)
+
+    # Stable sort, so records with the same timestamp keep the file order
+    order = np.lexsort((timestamps, az_codes, type_codes))
+    columns = [("timestamps", timestamps[order].astype('<i8')),
+               ("prices", prices[order].astype('<f4')),
+               ("types", type_codes[order].astype('<i2')),
+               ("zones", az_codes[order].astype('<i2'))]
+
+    # Series table: one entry for each (type, az) pair
+    key = type_codes[order].astype(np.int64) * 65536 + az_codes[order]
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]]) if len(key) > 0 else np.zeros(0, dtype=np.int64)
+    ends = np.r_[starts[1:], len(key)].astype(np.int64)
+    series = [[int(columns[2][1][s]), int(columns[3][1][s]), int(s), int(e)] for s, e in zip(starts, ends)]
+
+    header = {"rows": int(len(order)),
+              "types": sorted(types, key=types.get),
+              "zones": sorted(zones, key=zones.get),
+              "series": series,
+              "columns": {}}
+
+    # The offsets depend on the header size, which depends on the offsets, so
+    # reserve enough digits for them before serializing the final header
+    for name, values in columns:
+        header["columns"][name] = [0, values.dtype.str]
+    header_size = len(json.dumps(header).encode()) + 32 * len(columns)
+
+    offset = _align(len(TRACE_MAGIC) + 8 + header_size)
+    for name, values in columns:
+        header["columns"][name] = [offset, values.dtype.str]
+        offset = _align(offset + values.nbytes)
+
+    header_bytes = json.dumps(header).encode()
+    header_bytes += b" " * (header_size - len(header_bytes))
+
+    with open(trace_path, "wb") as output_f:
+        output_f.write(TRACE_MAGIC)
+        output_f.write(struct.pack("<Q", len(header_bytes)))
+        output_f.write(header_bytes)
+        for name, values in columns:
+            output_f.write(b"\0" * (header["columns"][name][0] - output_f.tell()))
+            output_f.write(values.tobytes())
+
+    return len(order)
+
+# function load
+# \param trace_path: path to a trace file written by convert
+# \return dictionary mapping (instance_type, az) to a pair of arrays
+# (timestamps in epoch seconds, prices), both sorted by timestamp
+#
+# The arrays returned are views of a read only memory map of the trace file,
+# so nothing is read until a price is looked up and the operating system
+# shares the pages among all the processes that open the same trace.
+def load(trace_path):
+    with open(trace_path, "rb") as input_f:
+        if input_f.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            raise ValueError(trace_path + " is not a price trace file")
+        header_size = struct.unpack("<Q", input_f.read(8))[0]
+        header = json.loads(input_f.read(header_size).decode())
+
+    rows = header["rows"]
+    columns = {}
+    for name, (offset, dtype) in header["columns"].items():
+        if rows > 0:
+            columns[name] = np.memmap(trace_path, dtype=np.dtype(dtype), mode="r", offset=offset, shape=(rows,))
+        else:
+            columns[name] = np.zeros(0, dtype=np.dtype(dtype))
+
+    series = {}
+    for type_code, az_code, start, end in header["series"]:
+        key = (header["types"][type_code], header["zones"][az_code])
+        series[key] = (columns["timestamps"][start:end], columns["prices"][start:end])
+
+    return series
+
+# function main
+# \param (command line argument) csv_path: path to the price log
+# \param (command line argument) trace_path: path to the trace to be written
+def main():
+    if len(sys.argv) <= 2:
+        print("Usage: python price_trace.py log_prices.csv log_prices.trace")
+        return
+
+    rows = convert(sys.argv[1], sys.argv[2])
+    print("Wrote " + str(rows) + " price records to " + sys.argv[2])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2019 Nicholas Torres Okita <nicholas.okita@ggaunicamp.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+# This file keeps the performance profile (statistics of interpsec for each
+# instance type) of an experiment in memory. The statistics are read once from
+# the database and, after that, refresh only reads the measurements stored
+# after the last one already included (the watermark, the largest idinterpsec
+# read) and adds them to the statistics with Welford's algorithm. The
+# measurements sent by the workers during the execution are therefore used by
+# the next decision without aggregating the whole interpsec table every time.
+#
+# The auto increment idinterpsec is used as the watermark instead of the
+# creationDate, which has a resolution of one second and can be equal for
+# measurements read in different refreshes. However, the id is assigned when
+# the measurement is inserted and not when it is committed: with several
+# workers writing at the same time, a measurement can become visible after
+# others with a larger id were already read. The transactions that write
+# measurements are short (at most one batch of the measurement collector), so
+# each refresh reads again only the last OVERLAP ids below the watermark and
+# skips the ones already added. Measurements that take longer to commit are
+# included when the statistics are loaded again from interpsec_summary, every
+# RELOAD_EVERY refreshes (which reads one row per instance type and the
+# OVERLAP ids, as cheap as a refresh).
+
+import math
+import rds_operations
+
+# Number of ids below the watermark read again by each refresh (as many as
+# the measurements written by one transaction of the collector)
+OVERLAP = 500
+
+# Number of refreshes after which the statistics are loaded again
+RELOAD_EVERY = 10
+
+class type_statistics:
+
+    # function __init__
+    # \param count: number of measurements
+    # \param mean: mean of the measurements
+    # \param m2: sum of the squared differences to the mean
+    # \param min_interpsec: smallest measurement
+    # \param max_interpsec: largest measurement
+    def __init__(self, count=0, mean=0.0, m2=0.0, min_interpsec=None, max_interpsec=None):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.min = min_interpsec
+        self.max = max_interpsec
+
+    # function add
+    # \param value: new measurement
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    # function stddev
+    # \return population standard deviation (as the stddev of MySQL)
+    def stddev(self):
+        if self.count == 0:
+            return None
+        return math.sqrt(max(self.m2, 0) / self.count)
+
+class profile_cache:
+
+    # function __init__
+    # \param conn: Database connection object
+    # \param iddata: id for the data set
+    # \param idparameters: id for the parameters
+    def __init__(self, conn, iddata, idparameters):
+        self.conn = conn
+        self.iddata = iddata
+        self.idparameters = idparameters
+        self.stats = {}
+        self.name = None
+        self.hash = None
+        self.watermark = None
+        self.seen = set()
+        self.refreshes = 0
+
+    # function load
+    # Reads the statistics of every instance type, the watermark and the ids
+    # of the measurements they include that are in the overlap
+    def load(self):
+        rows, self.watermark, recent = rds_operations.get_interpsec_statistics(self.conn, self.iddata,
+                                                                               self.idparameters, OVERLAP)
+        self.seen = set(recent)
+        self.stats = {}
+        for instance_name, count, mean, m2, min_interpsec, max_interpsec, name, data_hash in rows:
+            self.name, self.hash = name, data_hash
+            if count > 0:
+                self.stats[instance_name] = type_statistics(int(count), float(mean), float(m2 or 0),
+                                                            float(min_interpsec), float(max_interpsec))
+
+    # function refresh
+    # \return number of new measurements added to the statistics
+    #
+    # Loads the statistics on the first call (and every RELOAD_EVERY calls),
+    # after that adds the measurements not added yet whose id is above
+    # watermark - OVERLAP.
+    def refresh(self):
+        self.refreshes += 1
+        if self.watermark is None or self.refreshes % RELOAD_EVERY == 0:
+            self.load()
+            return 0
+
+        rows = rds_operations.get_interpsec_since(self.conn, self.iddata, self.idparameters,
+                                                  self.watermark - OVERLAP)
+        added = 0
+        for idinterpsec, instance_name, interpsec in rows:
+            if idinterpsec in self.seen:
+                continue
+            self.seen.add(idinterpsec)
+            self.watermark = max(self.watermark, idinterpsec)
+            if interpsec is None:
+                continue
+            if instance_name not in self.stats:
+                self.stats[instance_name] = type_statistics()
+            self.stats[instance_name].add(float(interpsec))
+            added += 1
+
+        # Ids below the overlap are not read again
+        self.seen = set(idinterpsec for idinterpsec in self.seen if idinterpsec > self.watermark - OVERLAP)
+
+        return added
+
+    # function rows
+    # \return performance of every instance type in the format of
+    # rds_operations.get_interpsec_allinstances (instance_name, interpsec,
+    # stddev, min_interpsec, max_interpsec, name, hash), sorted by interpsec
+    def rows(self):
+        results = [(instance_name, stats.mean, stats.stddev(), stats.min, stats.max, self.name, self.hash)
+                   for instance_name, stats in self.stats.items()]
+        results.sort(key=lambda row: row[1])
+
+        return tuple(results)
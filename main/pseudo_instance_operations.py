@@ -23,42 +23,183 @@
 # IN THE SOFTWARE.
 
 # This file contains similar operations to the instance_operations however they
-# are fake ones, so there is no actual instance creation or termination
+# are fake ones, so there is no actual instance creation or termination. The
+# prices come from a price file and the clock only moves when the simulation
+# says so, so nothing here touches the network.
 
 from datetime import datetime
 from datetime import timedelta
+from bisect import bisect_right
+import calendar
 import csv
+import random
+from instance_provider import instance_provider
 
-class pseudo_instance_operations:
+# Format of the timestamps stored in the price log
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+# function to_epoch
+# \param time_stamp: datetime object (UTC, without timezone information)
+# \return Number of seconds since the epoch
+def to_epoch(time_stamp):
+    return calendar.timegm(time_stamp.utctimetuple())
+
+# function load_price_log
+# \param filename: path to the price log (tab separated)
+# \return dictionary mapping (instance_type, az) to a pair of lists
+# (timestamps in epoch seconds, prices), both sorted by timestamp
+#
+# The price log is parsed only once, so that every lookup made by the
+# simulation afterwards is a binary search instead of a full scan of the file.
+def load_price_log(filename):
+    rows = {}
+    with open(filename, "r") as input_f:
+        csv_dr = csv.DictReader(input_f, delimiter="\t")
+        for row in csv_dr:
+            time_stamp = to_epoch(datetime.strptime(row['timestamp'], TIMESTAMP_FORMAT))
+            key = (row['instance_type'], row['az'])
+            rows.setdefault(key, []).append((time_stamp, float(row['price'])))
+
+    series = {}
+    for key, values in rows.items():
+        # Stable sort, so records with the same timestamp keep the file order
+        values.sort(key=lambda value: value[0])
+        series[key] = ([value[0] for value in values], [value[1] for value in values])
+
+    return series
+
+class price_index:
 
     # function __init__
-    # Initiliaze the class object by opening the input file which stores the
+    # \param series: dictionary mapping (instance_type, az) to a pair of
+    # sorted sequences (timestamps in epoch seconds, prices)
+    # Builds the per instance type list of availability zones and the cursors
+    # used to speed up lookups while the simulated time moves forward.
+    def __init__(self, series):
+        self.series = series
+        self.zones = {}
+        for (instance_type, az) in sorted(series.keys()):
+            self.zones.setdefault(instance_type, []).append(az)
+        self.cursors = {}
+
+    # function instance_types
+    # \return list of instance types that have at least one price record
+    def instance_types(self):
+        return list(self.zones.keys())
+
+    # function price_at
+    # \param instance_type: string with the name of the instance type
+    # \param az: string containing the availability zone
+    # \param when: time in epoch seconds
+    # \param not_before: records older than this (epoch seconds) are ignored
+    # \return price valid at time when, or -1 if there is none
+    #
+    # Each (instance_type, az) keeps a cursor to the last record returned.
+    # Since the simulated time only moves forward, most lookups either reuse
+    # the cursor or move it a few positions. If the time goes backwards the
+    # lookup falls back to a binary search over the whole series.
+    def price_at(self, instance_type, az, when, not_before=0):
+        key = (instance_type, az)
+        if key not in self.series:
+            return -1
+        times, prices = self.series[key]
+
+        i = self.cursors.get(key, -1)
+        if i >= 0 and times[i] <= when:
+            if i + 1 < len(times) and times[i + 1] <= when:
+                i = bisect_right(times, when, i + 1) - 1
+        else:
+            i = bisect_right(times, when) - 1
+        self.cursors[key] = i
+
+        if i < 0 or times[i] < not_before:
+            return -1
+        return float(prices[i])
+
+    # function next_change
+    # \param instance_type: string with the name of the instance type
+    # \param az: string containing the availability zone
+    # \param when: time in epoch seconds
+    # \return time (epoch seconds) of the first price record after when, None
+    # if there is none
+    def next_change(self, instance_type, az, when):
+        key = (instance_type, az)
+        if key not in self.series:
+            return None
+        times = self.series[key][0]
+
+        i = bisect_right(times, when)
+        if i >= len(times):
+            return None
+        return int(times[i])
+
+    # function price_at_allaz
+    # \param instance_type: string with the name of the instance type
+    # \param when: time in epoch seconds
+    # \param not_before: records older than this (epoch seconds) are ignored
+    # \return dictionary with the price valid at time when for each
+    # availability zone that has one
+    def price_at_allaz(self, instance_type, when, not_before=0):
+        dict = {}
+        for az in self.zones.get(instance_type, []):
+            price = self.price_at(instance_type, az, when, not_before)
+            if price != -1:
+                dict[az] = price
+
+        return dict
+
+# function load_prices
+# \param price_file: price log or price trace (files ending in .trace)
+# \return dictionary mapping (instance_type, az) to the sorted timestamps and
+# prices, as used by price_index
+def load_prices(price_file):
+    if price_file.endswith(".trace"):
+        import price_trace
+        return price_trace.load(price_file)
+    return load_price_log(price_file)
+
+class pseudo_instance_operations(instance_provider):
+
+    # function __init__
+    # \param price_file: file that stores the price at each (simulated) time
+    # \param failure_create: chance of an instance failing to be created
+    # \param rng: random number generator (random.Random object or the random
+    # module itself) used to decide if an instance creation fails
+    # \param series: prices already loaded by load_prices (price_file is then
+    # not read), so that many simulations can share them
+    # Initiliaze the class object by loading the input file which stores the
     # price at each (simulated) time. And set a initial time for the simulation
     # program to be running (in this example 15th of February of 2019).
-    def __init__(self):
-        self.input_f = open("log_prices.csv", "r")
-        self.rd = []
-        csv_dr = csv.DictReader(self.input_f, delimiter="\t")
-        for row in csv_dr:
-            self.rd.append(row)
+    #
+    # The input file can either be the price log (log_prices.csv) or a price
+    # trace created from it by price_trace.py (files ending in .trace), which
+    # is memory mapped instead of parsed.
+    def __init__(self, price_file="log_prices.csv", failure_create=0, rng=random, series=None):
+        if series is None:
+            series = load_prices(price_file)
+        self.prices = price_index(series)
+
+        self.time_now = datetime.strptime("2019-02-15T00:00:00.000Z", TIMESTAMP_FORMAT)
+        # Prices older than this are not considered valid
+        self.valid_time = to_epoch(datetime.strptime("2019-01-01T00:00:00.000Z", TIMESTAMP_FORMAT))
 
-        self.time_now = datetime.strptime("2019-02-15T00:00:00.000Z", "%Y-%m-%dT%H:%M:%S.%fZ")
+        self.failure_create = failure_create
+        self.rng = rng
+        self.running = {}
+        self.created = 0
+
+    # function now_epoch
+    # \return current (simulated) time in epoch seconds, rounded to the
+    # nearest second
+    def now_epoch(self):
+        return to_epoch(self.time_now) + round(self.time_now.microsecond / 1000000)
 
     # function get_current_spot_price_allaz
     # \param instance_type: string with the name of the instance type
     # This function gets the current spot price (from a file) for an instance
     # type for all availability zones.
     def get_current_spot_price_allaz(self, instance_type):
-        valid_time = datetime.strptime("2019-01-01T00:00:00.000Z", "%Y-%m-%dT%H:%M:%S.%fZ")
-        dict = {}
-        for row in self.rd:
-            if (row['instance_type'] == instance_type):
-                time_stamp = datetime.strptime(row['timestamp'], "%Y-%m-%dT%H:%M:%S.%fZ")
-                if (time_stamp <= self.time_now and time_stamp >= valid_time):
-                    valid_time = time_stamp
-                    dict[row['az']] = float(row['price'])
-
-        return dict
+        return self.prices.price_at_allaz(instance_type, self.now_epoch(), self.valid_time)
 
     # function get_current_spot_price
     # \param instance_type: string with the name of the instance type
@@ -66,19 +207,46 @@ class pseudo_instance_operations:
     # This function gets the current spot price (from a file) for an instance
     # type in an availability zone az
     def get_current_spot_price(self, instance_type, az):
-        valid_time = datetime.strptime("2019-01-01T00:00:00.000Z", "%Y-%m-%dT%H:%M:%S.%fZ")
-        price = -1
-        for row in self.rd:
-            if (row['instance_type'] == instance_type and row['az'] == az):
-                time_stamp = datetime.strptime(row['timestamp'], "%Y-%m-%dT%H:%M:%S.%fZ")
-                if (time_stamp <= self.time_now and time_stamp >= valid_time):
-                    valid_time = time_stamp
-                    price = float(row['price'])
+        return self.prices.price_at(instance_type, az, self.now_epoch(), self.valid_time)
+
+    # function next_price_change
+    # \param instance_type: string with the name of the instance type
+    # \param az: string containing the availability zone
+    # \return time in minutes from now until the price of the instance type in
+    # the availability zone az changes, None if it never changes again
+    def next_price_change(self, instance_type, az):
+        now = self.now_epoch()
+        change = self.prices.next_change(instance_type, az, now)
+        if change is None:
+            return None
+        return (change - now) / 60
+
+    # function createSpotInstances
+    # \param requests: list of (instance_type, az, price, count)
+    # \param timeout: not used (creations are instantaneous)
+    # \return list of (instance_id, instance_type, az, price), one for each
+    # instance created
+    # Pretends to create the instances, each creation failing with
+    # probability failure_create
+    def createSpotInstances(self, requests, timeout=30):
+        created = []
+        for instance_type, az, price, count in requests:
+            for i in range(count):
+                if (self.rng.random() > self.failure_create):
+                    instance_id = "sim-" + str(self.created)
+                    self.created += 1
+                    self.running[instance_id] = (instance_type, az, price)
+                    created.append((instance_id, instance_type, az, price))
+
+        return created
 
-        return price
+    # function terminateInstance
+    # \param instanceid: string containing the instance id to be terminated
+    def terminateInstance(self, instanceid):
+        self.running.pop(instanceid, None)
 
     # function add_minutes
     # \param increase_time: time to be increased in minutes
     # Increment the current timer in increase_time minutes
     def add_minutes(self, increase_time):
-        self.time_now = self.time_now + timedelta(minutes=increase_time)
\ No newline at end of file
+        self.time_now = self.time_now + timedelta(minutes=increase_time)
@@ -26,7 +26,21 @@
 # db_username: Username to access the database
 # db_password: Password to access the database
 # db_name: Name of the database to be accessed
+# db_backend: "mysql" (the database above) or "sqlite" (a local file)
+# db_sqlite_path: SQLite database file, used when db_backend is "sqlite"
+# collector_url: address of the measurement collector running on the Job
+# Manager (e.g. "http://10.0.0.10:8000"), empty to write to the database
+# collector_spool: file where the workers keep the measurements that could not
+# be sent to the collector
+# collector_token: secret shared by the collector and the workers, sent with
+# every measurement (the collector rejects the ones without it), empty to
+# accept any measurement
 db_host = ""
 db_username = ""
 db_password = ""
-db_name = ""
\ No newline at end of file
+db_name = ""
+db_backend = "mysql"
+db_sqlite_path = "experimentos.db"
+collector_url = ""
+collector_spool = "measurements.spool"
+collector_token = ""
@@ -24,10 +24,76 @@
 
 # This file contains the RDS operations to access and get information from a Relational Database Server (RDS)
 # At this moment it requires that the
+#
+# The database can also be a local SQLite file (rds_config.db_backend = "sqlite"), see rds_sqlite.py, so that
+# simulations and analyses can run without the RDS instance. db_sync.py copies the data between both.
+#
+# Connections are kept by a pool (one per thread, opened on first use) and reused for the whole life of the
+# process, so rds_connect can be called freely. They are in autocommit mode, so reads always see the rows stored
+# by other processes without committing, and a connection lost by the server is reopened once before failing.
+# Every query is parameterized (%s placeholders), the values are never formatted into the SQL text.
+#
+# The performance statistics of each (data, parameters, instance type) are kept by the interpsec_summary table
+# (count, mean, M2, min and max), updated with Welford's algorithm by every insert_interpsec, so reading them does
+# not depend on how many measurements were stored. The first time the statistics of a data set and parameters are
+# read by a process, the number of measurements in the summary is compared with the one in interpsec, and the summary
+# of that data set and parameters is built again if they differ (e.g. measurements stored before the table existed or
+# by a version that did not update it). backfill_summary.py builds the whole table at once.
 
-import pymysql
-import rds_config
+import math
+import random
 import sys
+import threading
+import time
+import rds_config
+import rds_sqlite
+
+# Number of attempts to open a connection, waiting a random (growing) time
+# between them so that many workers starting at once do not retry together
+CONNECT_ATTEMPTS = 3
+
+# MySQL client errors after which a query is executed again on a new
+# connection: server gone away (the query was not sent) and lost connection
+# (the query may have run, so only reads are repeated)
+CR_SERVER_GONE_ERROR = 2006
+CR_SERVER_LOST = 2013
+
+# Function called after every query with the kind of the query ("read",
+# "write" or "transaction") and the time spent in seconds, None to not observe
+# them (see instrumentation.py)
+query_observer = None
+
+class connection_pool:
+
+    # function __init__
+    # \param connect: function that opens a new connection
+    def __init__(self, connect):
+        self.connect = connect
+        self.local = threading.local()
+
+    # function get
+    # \return connection of the calling thread (opened if there is none)
+    def get(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.connect()
+            self.local.conn = conn
+        return conn
+
+    # function discard
+    # Closes the connection of the calling thread, the next get opens another
+    def discard(self):
+        conn = getattr(self.local, "conn", None)
+        self.local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+# Pool used by rds_connect (created on first use)
+_pool = None
+_pool_lock = threading.Lock()
 
 # function rds_connect
 #
@@ -37,7 +103,37 @@ import sys
 # create a connection to a database. The connection object is then returned
 # to the function caller. If there was an error while trying to connect to the
 # database, the program will call sys.exit() and close.
+#
+# The connection comes from a pool and is shared by every caller of the same
+# thread, so calling it again does not open a new connection.
 def rds_connect():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if getattr(rds_config, "db_backend", "mysql") == "sqlite":
+                _pool = connection_pool(lambda: sqlite_connect(rds_config.db_sqlite_path))
+            else:
+                _pool = connection_pool(mysql_connect)
+
+    return _pool.get()
+
+# function sqlite_connect
+# \param path: path to the SQLite database file (created if it does not exist)
+# \return conn connection object
+def sqlite_connect(path):
+    try:
+        conn = rds_sqlite.connect(path)
+    except Exception as e:
+        print("ERROR: Unexpected error: Could not open SQLite database " + path + " (" + str(e) + ").")
+        sys.exit()
+
+    return conn
+
+# function mysql_connect
+# \return conn connection object to the MySQL database of rds_config.py
+def mysql_connect():
+    import pymysql
+
     # Remote access to MySQL database in RDS
     rds_host = rds_config.db_host
     name = rds_config.db_username
@@ -45,13 +141,114 @@ def rds_connect():
     db_name = rds_config.db_name
 
     # Try connection
+    for attempt in range(CONNECT_ATTEMPTS):
+        try:
+            return pymysql.connect(host=rds_host, user=name, password=password, database=db_name,
+                                   connect_timeout=5, autocommit=True)
+        except pymysql.err.OperationalError:
+            if attempt + 1 < CONNECT_ATTEMPTS:
+                time.sleep(random.uniform(0, 2 ** attempt))
+
+    print("ERROR: Unexpected error: Could not connect to MySql instance.")
+    sys.exit()
+
+# function reconnect_errors
+# \param conn: Database connection object
+# \return exception types raised when the connection was lost
+def reconnect_errors(conn):
+    if is_sqlite(conn):
+        return ()
+
+    import pymysql
+    return (pymysql.err.OperationalError, pymysql.err.InterfaceError)
+
+# function transient_errors
+# \param conn: Database connection object
+# \return exception types raised when a query failed because of the
+# connection or the server (e.g. lost connection, lock wait timeout or locked
+# SQLite file), so that it may succeed later, unlike the errors caused by the
+# values (e.g. a foreign key that does not exist)
+def transient_errors(conn):
+    if is_sqlite(conn):
+        import sqlite3
+        return (sqlite3.OperationalError,)
+
+    import pymysql
+    return (pymysql.err.OperationalError, pymysql.err.InterfaceError)
+
+# function execute
+# \param conn: Database connection object
+# \param query: SQL query with %s placeholders
+# \param args: values of the placeholders
+# \param write: whether the query changes the database
+# \return rows returned by the query (reads) or the id of the row inserted
+# (writes)
+#
+# If the connection was lost, it is reopened and the query is executed again
+# (writes only when the server was gone before the query was sent).
+def execute(conn, query, args=(), write=False):
+    start = time.monotonic()
+    errors = reconnect_errors(conn)
+    try:
+        for attempt in range(2):
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(query, args)
+                    if write:
+                        return cur.lastrowid
+                    return cur.fetchall()
+            except errors as e:
+                code = e.args[0] if len(e.args) > 0 else None
+                if attempt == 1 or (write and code != CR_SERVER_GONE_ERROR) or \
+                        (not write and code not in (CR_SERVER_GONE_ERROR, CR_SERVER_LOST)):
+                    raise
+                conn.ping(reconnect=True)
+    finally:
+        if query_observer is not None:
+            query_observer("write" if write else "read", time.monotonic() - start)
+
+# function execute_transaction
+# \param conn: Database connection object
+# \param statements: list of (query, args) changing the database
+# \param many: whether the args of each statement are a list of argument
+# sequences (executed with executemany)
+#
+# Executes the statements in a single transaction, so either all of them or
+# none are stored. The transaction is started again on a new connection if
+# the server was gone.
+def execute_transaction(conn, statements, many=False):
+    start = time.monotonic()
+    errors = reconnect_errors(conn)
+    for attempt in range(2):
+        try:
+            conn.begin()
+            break
+        except errors as e:
+            code = e.args[0] if len(e.args) > 0 else None
+            if attempt == 1 or code != CR_SERVER_GONE_ERROR:
+                raise
+            conn.ping(reconnect=True)
+
     try:
-        conn = pymysql.connect(rds_host, user=name, passwd=password, db=db_name, connect_timeout=5)
+        with conn.cursor() as cur:
+            for query, args in statements:
+                if many:
+                    cur.executemany(query, args)
+                else:
+                    cur.execute(query, args)
+        conn.commit()
     except:
-        print("ERROR: Unexpected error: Could not connect to MySql instance.")
-        sys.exit()
+        conn.rollback()
+        raise
+    finally:
+        if query_observer is not None:
+            query_observer("transaction", time.monotonic() - start)
 
-    return conn
+# function is_sqlite
+# \param conn: Database connection object
+# \return whether the connection is to a SQLite database
+def is_sqlite(conn):
+    return isinstance(conn, rds_sqlite.sqlite_connection)
 
 # function get_idparameters
 # \param conn: Database connection object
@@ -71,20 +268,13 @@ def rds_connect():
 # create a new entry. At last, return the idparameters key stored.
 def get_idparameters(conn, aph, apm, window, np, gens):
     idparameters = -1
-    with conn.cursor() as cur:
-        query = "select * from experimentos.parameters where `aph`={} and `apm`={} and `window` like {} and `np`={} and `gens`={};"
-        cur.execute(query.format(aph, apm, window, np, gens))
-        results = cur.fetchall()
-        if len(results) == 0:
-            query = "insert into experimentos.parameters(`aph`,`apm`,`window`,`np`,`gens`) values({},{},{},{},{});"
-            cur.execute(query.format(aph, apm, window, np, gens))
-            cur.execute("select LAST_INSERT_ID();")
-            results = cur.fetchall()
-            idparameters = results[0][0]
-        else:
-            idparameters = results[0][0]
-        conn.commit()
-    conn.commit()
+    query = "select * from experimentos.parameters where `aph`=%s and `apm`=%s and `window` like %s and `np`=%s and `gens`=%s;"
+    results = execute(conn, query, (aph, apm, window, np, gens))
+    if len(results) == 0:
+        query = "insert into experimentos.parameters(`aph`,`apm`,`window`,`np`,`gens`) values(%s,%s,%s,%s,%s);"
+        idparameters = execute(conn, query, (aph, apm, window, np, gens), write=True)
+    else:
+        idparameters = results[0][0]
 
     return idparameters
 
@@ -98,16 +288,12 @@ def get_idparameters(conn, aph, apm, window, np, gens):
 # returning -1 if the table was not found.
 def get_iddata(conn, data_hash):
     iddata = -1
-    with conn.cursor() as cur:
-        query = "select * from experimentos.data where hash='{}'"
-        cur.execute(query.format(data_hash))
-        results = cur.fetchall()
-        if len(results) == 0:
-            print("Data wasn't found")
-        else:
-            iddata = results[0][0]
-        conn.commit()
-    conn.commit()
+    query = "select * from experimentos.data where hash=%s"
+    results = execute(conn, query, (data_hash,))
+    if len(results) == 0:
+        print("Data wasn't found")
+    else:
+        iddata = results[0][0]
 
     return iddata
 
@@ -125,21 +311,14 @@ def get_iddata(conn, data_hash):
 # table does not exist, create a new one. Then return the table id.
 def get_idexperiment(conn, iddata, idparameters, instance_type):
     idexperiment = -1
-    with conn.cursor() as cur:
-        query = "select * from experimentos.experiment where data_iddata={} and parameters_idparameters={} and instance_name='{}'"
-        cur.execute(query.format(iddata, idparameters, instance_type))
-        results = cur.fetchall()
-        if len(results) == 0:
-            query = "insert into experimentos.experiment(`data_iddata`,`parameters_idparameters`,`instance_name`) values({},{},'{}');"
-            print(query.format(iddata, idparameters, instance_type))
-            cur.execute(query.format(iddata, idparameters, instance_type))
-            cur.execute("select LAST_INSERT_ID();")
-            results = cur.fetchall()
-            idexperiment = results[0][0]
-        else:
-            idexperiment = results[0][0]
-        conn.commit()
-    conn.commit()
+    query = "select * from experimentos.experiment where data_iddata=%s and parameters_idparameters=%s and instance_name=%s"
+    results = execute(conn, query, (iddata, idparameters, instance_type))
+    if len(results) == 0:
+        query = "insert into experimentos.experiment(`data_iddata`,`parameters_idparameters`,`instance_name`) values(%s,%s,%s);"
+        print(query, (iddata, idparameters, instance_type))
+        idexperiment = execute(conn, query, (iddata, idparameters, instance_type), write=True)
+    else:
+        idexperiment = results[0][0]
 
     return idexperiment
 
@@ -150,11 +329,144 @@ def get_idexperiment(conn, iddata, idparameters, instance_type):
 #
 # This function accesses the database using the connection object conn, then
 # it inserts a new performance entry for a given experiment.
+#
+# The statistics of the experiment in interpsec_summary are updated in the
+# same transaction (see update_summary_query).
 def insert_interpsec(conn, idexperiment, interpsec):
-    with conn.cursor() as cur:
-        query = "insert into experimentos.interpsec(`interpsec`,`experiment_idperformance`) values({},{});"
-        cur.execute(query.format(interpsec, idexperiment))
-    conn.commit()
+    query = "insert into experimentos.interpsec(`interpsec`,`experiment_idperformance`) values(%s,%s);"
+    execute_transaction(conn, [(query, (interpsec, idexperiment)),
+                               (update_summary_query(conn), (1, interpsec, 0, interpsec, interpsec, idexperiment))])
+
+# function insert_interpsec_many
+# \param conn: Database connection object
+# \param measurements: list of (idexperiment, interpsec) pairs
+#
+# Inserts many performance entries with a single executemany and merges the
+# statistics of each experiment into interpsec_summary, all in the same
+# transaction.
+def insert_interpsec_many(conn, measurements):
+    if len(measurements) == 0:
+        return
+
+    batches = {}
+    for idexperiment, interpsec in measurements:
+        count, mean, m2, min_interpsec, max_interpsec = batches.get(idexperiment, (0, 0.0, 0.0, interpsec, interpsec))
+        count += 1
+        delta = interpsec - mean
+        mean += delta / count
+        m2 += delta * (interpsec - mean)
+        batches[idexperiment] = (count, mean, m2, min(min_interpsec, interpsec), max(max_interpsec, interpsec))
+
+    query = "insert into experimentos.interpsec(`interpsec`,`experiment_idperformance`) values(%s,%s);"
+    summary_query = update_summary_query(conn)
+    statements = [(query, [(interpsec, idexperiment) for idexperiment, interpsec in measurements])]
+    statements += [(summary_query, [batch + (idexperiment,) for idexperiment, batch in batches.items()])]
+    execute_transaction(conn, statements, many=True)
+
+# function update_summary_query
+# \param conn: Database connection object
+# \return query that merges the statistics of a group of measurements into
+# the ones of an experiment in interpsec_summary, with the arguments (count,
+# mean, m2, min, max, idexperiment) of the group
+#
+# The statistics are merged as in Welford's algorithm: with n measurements of
+# mean m and a group of k measurements of mean g (k = 1, g = x and M2 = 0 for
+# a single measurement x)
+#
+# M2' = M2 + M2_group + (g - m)^2 * n * k / (n + k)
+# m' = m + (g - m) * k / (n + k)
+# n' = n + k
+#
+# MySQL assigns the columns from left to right using the values already
+# updated, so M2 is updated before the mean and both before the count (SQLite
+# always uses the old values). The values of the group are the ones of the
+# row that would be inserted (values() in MySQL, excluded in SQLite).
+def update_summary_query(conn):
+    if is_sqlite(conn):
+        conflict = "on conflict(`data_iddata`,`parameters_idparameters`,`instance_name`) do update set"
+        least, greatest = "min", "max"
+        new = "excluded.`{}`"
+    else:
+        conflict = "on duplicate key update"
+        least, greatest = "least", "greatest"
+        new = "values(`{}`)"
+    count, mean, m2 = new.format("count"), new.format("mean"), new.format("m2")
+
+    return """insert into experimentos.interpsec_summary(`data_iddata`,`parameters_idparameters`,`instance_name`,
+        `count`,`mean`,`m2`,`min`,`max`)
+        select data_iddata, parameters_idparameters, instance_name, %s, %s, %s, %s, %s
+        from experimentos.experiment where idperformance=%s
+        {conflict} `m2`=`m2`+{m2}+({mean}-`mean`)*({mean}-`mean`)*`count`*{count}/(`count`+{count}),
+        `mean`=`mean`+({mean}-`mean`)*{count}/(`count`+{count}), `count`=`count`+{count},
+        `min`={least}(`min`,{min}), `max`={greatest}(`max`,{max});""".format(
+        conflict=conflict, least=least, greatest=greatest, count=count, mean=mean, m2=m2,
+        min=new.format("min"), max=new.format("max"))
+
+# function rebuild_interpsec_summary
+# \param conn: Database connection object
+# \param iddata: id for the data set (None for every data set)
+# \param idparameters: id for the parameters (None for every parameters)
+#
+# Computes the statistics of every experiment (of the data set and parameters,
+# if given) in interpsec_summary again from all the measurements in interpsec
+# (M2 = population variance * count).
+def rebuild_interpsec_summary(conn, iddata=None, idparameters=None):
+    where = ""
+    args = ()
+    if iddata is not None:
+        where = " and data_iddata=%s and parameters_idparameters=%s"
+        args = (iddata, idparameters)
+    execute_transaction(conn, [("delete from experimentos.interpsec_summary" + where.replace(" and", " where", 1) +
+                                ";", args),
+                               ("""insert into experimentos.interpsec_summary(`data_iddata`,`parameters_idparameters`,
+        `instance_name`,`count`,`mean`,`m2`,`min`,`max`)
+        select data_iddata, parameters_idparameters, instance_name, count(interpsec), avg(interpsec),
+        stddev(interpsec)*stddev(interpsec)*count(interpsec), min(interpsec), max(interpsec)
+        from experimentos.interpsec inner join experimentos.experiment on experiment_idperformance=idperformance
+        where interpsec is not null""" + where + """
+        group by data_iddata, parameters_idparameters, instance_name;""", args)])
+
+# (data, parameters) whose summary was already compared with the measurements
+_summary_checked = set()
+
+# function check_interpsec_summary
+# \param conn: Database connection object
+# \param iddata: id for the data set
+# \param idparameters: id for the parameters
+#
+# The first time it is called for a data set and parameters, compares the
+# number of measurements in interpsec_summary with the one in interpsec (in a
+# single query, so both are counted at the same time) and rebuilds the summary
+# of the data set and parameters if they differ.
+def check_interpsec_summary(conn, iddata, idparameters):
+    key = (iddata, idparameters)
+    if key in _summary_checked:
+        return
+
+    query = """select (select coalesce(sum(`count`), 0) from experimentos.interpsec_summary
+            where data_iddata=%s and parameters_idparameters=%s),
+        (select count(interpsec) from experimentos.interpsec inner join experimentos.experiment
+            on experiment_idperformance=idperformance
+            where data_iddata=%s and parameters_idparameters=%s);
+    """
+    summarized, stored = execute(conn, query, (iddata, idparameters, iddata, idparameters))[0]
+    if int(summarized) != int(stored):
+        print("interpsec_summary has " + str(summarized) + " of " + str(stored) + " measurements, rebuilding it")
+        rebuild_interpsec_summary(conn, iddata, idparameters)
+    _summary_checked.add(key)
+
+# function summary_rows
+# \param rows: rows of interpsec_summary joined with data (instance_name,
+# mean, m2, count, min, max, name, hash)
+# \return rows in the format of get_interpsec_allinstances (instance_name,
+# interpsec, stddev, min_interpsec, max_interpsec, name, hash)
+def summary_rows(rows):
+    results = []
+    for instance_name, mean, m2, count, min_interpsec, max_interpsec, name, data_hash in rows:
+        stddev = math.sqrt(max(m2, 0) / count) if count > 0 else None
+        results.append((instance_name, mean, stddev, min_interpsec, max_interpsec, name, data_hash))
+
+    return tuple(results)
 
 # function insert_interpols
 # \param conn: Database connection object
@@ -166,10 +478,21 @@ def insert_interpsec(conn, idexperiment, interpsec):
 # it inserts the total amount of tasks completed for the pair of parameters
 # and data set.
 def insert_interpols(conn, idparameters, iddata, interpols):
-    with conn.cursor() as cur:
-        query = "insert into experimentos.interpols(`parameters_idparameters`,`data_iddata`, `interpols`) values({},{},{});"
-        cur.execute(query.format(idparameters, iddata, interpols))
-    conn.commit()
+    query = "insert into experimentos.interpols(`parameters_idparameters`,`data_iddata`, `interpols`) values(%s,%s,%s);"
+    execute(conn, query, (idparameters, iddata, interpols), write=True)
+
+# function insert_interpols_many
+# \param conn: Database connection object
+# \param entries: list of (idparameters, iddata, interpols)
+#
+# Inserts the number of tasks completed of many executions with a single
+# executemany.
+def insert_interpols_many(conn, entries):
+    if len(entries) == 0:
+        return
+
+    query = "insert into experimentos.interpols(`parameters_idparameters`,`data_iddata`, `interpols`) values(%s,%s,%s);"
+    execute_transaction(conn, [(query, entries)], many=True)
 
 # function get_interpols
 # \param conn: Database connection object
@@ -181,12 +504,8 @@ def insert_interpols(conn, idparameters, iddata, interpols):
 # This function simply accesses the database via the conn object and gets the
 # number of tasks for the pair iddata and idparameters.
 def get_interpols(conn, idparameters, iddata):
-    with conn.cursor() as cur:
-        query = "select avg(interpols) from experimentos.interpols where `parameters_idparameters`={} and `data_iddata`={};"
-        cur.execute(query.format(idparameters, iddata))
-        results = cur.fetchall()
-        conn.commit()
-    conn.commit()
+    query = "select avg(interpols) from experimentos.interpols where `parameters_idparameters`=%s and `data_iddata`=%s;"
+    results = execute(conn, query, (idparameters, iddata))
 
     return results[0][0]
 
@@ -200,23 +519,19 @@ def get_interpols(conn, idparameters, iddata):
 # This function accesses the database via the conn object and runs a query to
 # return the performance information (stored as interpsec) for all instances
 # types that executed the data with a set of parameters.
+#
+# The statistics come from interpsec_summary (one row per instance type),
+# checked against the measurements first (see check_interpsec_summary).
 def get_interpsec_allinstances(conn, iddata, idparameters):
-    with conn.cursor() as cur:
-        query = """select instance_name, avg(interpsec) as interpsec, stddev(interpsec) as stddev, min(interpsec) as min_interpsec,
-            max(interpsec) as max_interpsec, T.name, T.hash
-            from experimentos.interpsec inner join experimentos.experiment on experiment_idperformance=idperformance
-            inner join experimentos.data T on data_iddata=T.iddata
-            where iddata={} and parameters_idparameters={}
-            group by T.name, instance_name
-            order by T.name, interpsec;
-        """
-
-        cur.execute(query.format(iddata, idparameters))
-        results = cur.fetchall()
-        conn.commit()
-    conn.commit()
+    check_interpsec_summary(conn, iddata, idparameters)
+    query = """select S.instance_name, S.mean, S.m2, S.count, S.min, S.max, T.name, T.hash
+        from experimentos.interpsec_summary S inner join experimentos.data T on S.data_iddata=T.iddata
+        where S.data_iddata=%s and S.parameters_idparameters=%s
+        order by T.name, S.mean;
+    """
+    results = execute(conn, query, (iddata, idparameters))
 
-    return results
+    return summary_rows(results)
 
 # function get_interpsec_allinstances
 # \param conn: Database connection object
@@ -229,20 +544,71 @@ def get_interpsec_allinstances(conn, iddata, idparameters):
 # This function accesses the database via the conn object and runs a query to
 # return the performance information (stored as interpsec) for an input instance
 # type that executed the data with a set of parameters.
+#
+# As get_interpsec_allinstances, the statistics come from interpsec_summary.
 def get_interpsec(conn, iddata, idparameters, instance_type):
-    with conn.cursor() as cur:
-        query = """select instance_name, avg(interpsec) as interpsec, stddev(interpsec) as stddev, min(interpsec) as min_interpsec,
-                max(interpsec) as max_interpsec, T.name, T.hash
-                from experimentos.interpsec inner join experimentos.experiment on experiment_idperformance=idperformance
-                inner join experimentos.data T on data_iddata=T.iddata
-                where iddata={} and parameters_idparameters={} and instance_name="{}"
-                group by T.name, instance_name
-                order by T.name, interpsec;
-        """
-
-        cur.execute(query.format(iddata, idparameters, instance_type))
-        results = cur.fetchall()
+    check_interpsec_summary(conn, iddata, idparameters)
+    query = """select S.instance_name, S.mean, S.m2, S.count, S.min, S.max, T.name, T.hash
+        from experimentos.interpsec_summary S inner join experimentos.data T on S.data_iddata=T.iddata
+        where S.data_iddata=%s and S.parameters_idparameters=%s and S.instance_name=%s;
+    """
+    results = execute(conn, query, (iddata, idparameters, instance_type))
+
+    return summary_rows(results)
+
+# function get_interpsec_statistics
+# \param conn: Database connection object
+# \param iddata: id for the data set
+# \param idparametrs: id for the parameters
+# \param overlap: number of ids below the watermark whose measurements are
+# listed in recent
+#
+# \return (rows, watermark, recent): statistics of each instance type
+# (instance_name, count, mean, m2, min, max, name, hash), the largest
+# idinterpsec they include (0 if there are no measurements) and the
+# idinterpsec of the measurements included whose id is greater than
+# watermark - overlap
+#
+# Everything is read in a single transaction, so the three match (the summary
+# is updated in the same transaction as the measurement). Ids are assigned
+# when a measurement is inserted, not when it is committed, so measurements
+# below the watermark that are not in recent may still appear later. As
+# get_interpsec_allinstances, the summary is checked against the measurements
+# first (see check_interpsec_summary).
+def get_interpsec_statistics(conn, iddata, idparameters, overlap=0):
+    check_interpsec_summary(conn, iddata, idparameters)
+    query = """select S.instance_name, S.count, S.mean, S.m2, S.min, S.max, T.name, T.hash,
+        (select max(idinterpsec) from experimentos.interpsec inner join experimentos.experiment
+            on experiment_idperformance=idperformance
+            where data_iddata=%s and parameters_idparameters=%s) as watermark
+        from experimentos.interpsec_summary S inner join experimentos.data T on S.data_iddata=T.iddata
+        where S.data_iddata=%s and S.parameters_idparameters=%s;
+    """
+    conn.begin()
+    try:
+        results = execute(conn, query, (iddata, idparameters, iddata, idparameters))
+        watermark = max([row[8] or 0 for row in results] + [0])
+        recent = [row[0] for row in get_interpsec_since(conn, iddata, idparameters, watermark - overlap)
+                  if row[0] <= watermark]
+    finally:
         conn.commit()
-    conn.commit()
+    rows = [row[:8] for row in results]
+
+    return rows, watermark, recent
+
+# function get_interpsec_since
+# \param conn: Database connection object
+# \param iddata: id for the data set
+# \param idparametrs: id for the parameters
+# \param watermark: idinterpsec after which the measurements are read
+#
+# \return measurements whose idinterpsec is greater than the watermark
+# (idinterpsec, instance_name, interpsec), in the order of idinterpsec
+def get_interpsec_since(conn, iddata, idparameters, watermark):
+    query = """select idinterpsec, instance_name, interpsec
+        from experimentos.interpsec inner join experimentos.experiment on experiment_idperformance=idperformance
+        where idinterpsec>%s and data_iddata=%s and parameters_idparameters=%s
+        order by idinterpsec;
+    """
 
-    return results
\ No newline at end of file
+    return execute(conn, query, (watermark, iddata, idparameters))
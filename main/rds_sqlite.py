@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2019 Nicholas Torres Okita <nicholas.okita@ggaunicamp.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+# This file contains the local (SQLite) backend of rds_operations.py, used
+# when rds_config.db_backend is "sqlite". The database file is attached as
+# "experimentos", so the queries written for the MySQL database (including the
+# schema prefix and the backquoted names) run unchanged. The connection and
+# cursor objects behave like the pymysql ones used by rds_operations.py:
+#
+# - cursors can be used in a "with" statement
+# - queries use %s placeholders (translated to the SQLite ones)
+# - there is a stddev aggregate function (population standard deviation, as
+# the one of MySQL)
+
+import math
+import sqlite3
+
+# Schema of the experimentos database (the same tables and columns of
+# database/experimentos_db.sql)
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS experimentos.data (
+  `iddata` INTEGER PRIMARY KEY AUTOINCREMENT,
+  `name` VARCHAR(45) NULL DEFAULT NULL,
+  `hash` VARCHAR(45) NULL DEFAULT NULL);
+
+CREATE TABLE IF NOT EXISTS experimentos.instance (
+  `name` VARCHAR(45) NOT NULL PRIMARY KEY);
+
+CREATE TABLE IF NOT EXISTS experimentos.parameters (
+  `idparameters` INTEGER PRIMARY KEY AUTOINCREMENT,
+  `aph` FLOAT NULL DEFAULT NULL,
+  `apm` FLOAT NULL DEFAULT NULL,
+  `window` DOUBLE NULL DEFAULT NULL,
+  `np` FLOAT NULL DEFAULT NULL,
+  `gens` FLOAT NULL DEFAULT NULL);
+
+CREATE TABLE IF NOT EXISTS experimentos.experiment (
+  `idperformance` INTEGER PRIMARY KEY AUTOINCREMENT,
+  `data_iddata` INT NOT NULL REFERENCES data (`iddata`),
+  `parameters_idparameters` INT NOT NULL REFERENCES parameters (`idparameters`),
+  `instance_name` VARCHAR(45) NOT NULL REFERENCES instance (`name`));
+CREATE INDEX IF NOT EXISTS experimentos.fk_performance_data1_idx ON experiment (`data_iddata`);
+CREATE INDEX IF NOT EXISTS experimentos.fk_performance_parameters1_idx ON experiment (`parameters_idparameters`);
+CREATE INDEX IF NOT EXISTS experimentos.fk_performance_instance1_idx ON experiment (`instance_name`);
+
+CREATE TABLE IF NOT EXISTS experimentos.interpols (
+  `idinterpols` INTEGER PRIMARY KEY AUTOINCREMENT,
+  `parameters_idparameters` INT NOT NULL REFERENCES parameters (`idparameters`),
+  `data_iddata` INT NOT NULL REFERENCES data (`iddata`),
+  `interpols` FLOAT NULL DEFAULT NULL,
+  `datetime` DATETIME NULL DEFAULT CURRENT_TIMESTAMP);
+CREATE INDEX IF NOT EXISTS experimentos.fk_interpols_parameters1_idx ON interpols (`parameters_idparameters`);
+CREATE INDEX IF NOT EXISTS experimentos.fk_interpols_data1_idx ON interpols (`data_iddata`);
+
+CREATE TABLE IF NOT EXISTS experimentos.interpsec (
+  `idinterpsec` INTEGER PRIMARY KEY AUTOINCREMENT,
+  `interpsec` FLOAT NULL DEFAULT NULL,
+  `experiment_idperformance` INT NOT NULL REFERENCES experiment (`idperformance`),
+  `creationDate` DATETIME NULL DEFAULT CURRENT_TIMESTAMP);
+CREATE INDEX IF NOT EXISTS experimentos.fk_interpsec_experiment1_idx ON interpsec (`experiment_idperformance`);
+
+CREATE TABLE IF NOT EXISTS experimentos.interpsec_summary (
+  `data_iddata` INT NOT NULL,
+  `parameters_idparameters` INT NOT NULL,
+  `instance_name` VARCHAR(45) NOT NULL,
+  `count` BIGINT NOT NULL DEFAULT 0,
+  `mean` DOUBLE NOT NULL DEFAULT 0,
+  `m2` DOUBLE NOT NULL DEFAULT 0,
+  `min` DOUBLE NULL DEFAULT NULL,
+  `max` DOUBLE NULL DEFAULT NULL,
+  PRIMARY KEY (`data_iddata`, `parameters_idparameters`, `instance_name`));
+"""
+
+class stddev_aggregate:
+
+    # function __init__
+    # Population standard deviation computed with Welford's algorithm
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    # function step
+    # \param value: next value (NULL values are ignored, as in MySQL)
+    def step(self, value):
+        if value is None:
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    # function finalize
+    # \return standard deviation, NULL if there were no values
+    def finalize(self):
+        if self.count == 0:
+            return None
+        return math.sqrt(self.m2 / self.count)
+
+class sqlite_cursor:
+
+    # function __init__
+    # \param cursor: sqlite3 cursor
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cursor.close()
+
+    # function execute
+    # \param query: SQL query with %s placeholders
+    # \param args: optional sequence with the values of the placeholders
+    def execute(self, query, args=()):
+        return self.cursor.execute(query.replace("%s", "?"), args)
+
+    # function executemany
+    # \param query: SQL query with %s placeholders
+    # \param seq_args: sequence of sequences with the values of the placeholders
+    def executemany(self, query, seq_args):
+        return self.cursor.executemany(query.replace("%s", "?"), seq_args)
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchall(self):
+        return tuple(self.cursor.fetchall())
+
+    @property
+    def lastrowid(self):
+        return self.cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+class sqlite_connection:
+
+    # function __init__
+    # \param path: path to the database file (created if it does not exist)
+    # The connection is in autocommit mode (as the MySQL ones), begin starts
+    # a transaction
+    def __init__(self, path):
+        self.conn = sqlite3.connect(":memory:", check_same_thread=False, isolation_level=None)
+        self.conn.execute("attach database ? as experimentos", (path,))
+        self.conn.create_aggregate("stddev", 1, stddev_aggregate)
+        self.conn.executescript(SCHEMA)
+
+    def cursor(self):
+        return sqlite_cursor(self.conn.cursor())
+
+    def begin(self):
+        self.conn.execute("begin")
+
+    def commit(self):
+        if self.conn.in_transaction:
+            self.conn.execute("commit")
+
+    def rollback(self):
+        if self.conn.in_transaction:
+            self.conn.execute("rollback")
+
+    # function ping
+    # \param reconnect: not used (a local file is never disconnected)
+    def ping(self, reconnect=True):
+        pass
+
+    def close(self):
+        self.conn.close()
+
+# function connect
+# \param path: path to the database file (created if it does not exist)
+# \return connection object, used as the pymysql one
+def connect(path):
+    return sqlite_connection(path)
@@ -34,6 +34,8 @@
 
 import logging
 import sys
+import measurement_collector
+import rds_config
 import rds_operations
 
 # function main
@@ -48,30 +50,41 @@ import rds_operations
 # This function accesses the MySQL database using rds_operations and adds a
 # the number of tasks completed related to an experiment
 #
+# If rds_config.collector_url is set, the number of tasks is sent to the
+# measurement collector of the Job Manager instead (see
+# measurement_collector.py), which writes it to the database.
+#
 # This is an example code and can be modified to better suit the user needs.
 # However, keep in mind that others parts of the code will need to be modified
 # as well, namely rds_operations.py, to_execute.py and simulation.py.
 def main():
-    # Remote access to MySQL database in RDS
-    conn = rds_operations.rds_connect()
-
     # Get parameters from command line
     aph = float(sys.argv[1])
     apm = float(sys.argv[2])
     window = float(sys.argv[3])
     np = int(sys.argv[4])
     gens = int(sys.argv[5])
+    data_hash = sys.argv[6]
+
+    # Get number of tasks from command line
+    interpols = float(sys.argv[7])
+
+    if (rds_config.collector_url != ""):
+        measurement_collector.send(rds_config.collector_url, "interpols",
+                                   {"aph": aph, "apm": apm, "window": window, "np": np, "gens": gens,
+                                    "data_hash": data_hash, "interpols": interpols},
+                                   rds_config.collector_spool)
+        return
+
+    # Remote access to MySQL database in RDS
+    conn = rds_operations.rds_connect()
 
     # Get parameters id
     idparameters = rds_operations.get_idparameters(conn, aph, apm, window, np, gens)
 
     # Get data id from hash
-    data_hash = sys.argv[6]
     iddata = rds_operations.get_iddata(conn, data_hash)
 
-    # Get number of tasks from command line
-    interpols = float(sys.argv[7])
-
     # Insert tasks to the database
     rds_operations.insert_interpols(conn, idparameters, iddata, interpols)
 
@@ -35,6 +35,8 @@
 import logging
 import sys
 import requests
+import measurement_collector
+import rds_config
 import rds_operations
 
 # function getInstanceType
@@ -58,38 +60,51 @@ def getInstanceType():
 # performance measurement relating to an experiment. If the performance
 # measurement is zero, then it will simply ignore the value.
 #
+# If rds_config.collector_url is set, the measurement is sent to the
+# measurement collector of the Job Manager instead (see
+# measurement_collector.py), which writes it to the database.
+#
 # This is an example code and can be modified to better suit the user needs.
 # However, keep in mind that others parts of the code will need to be modified
 # as well, namely rds_operations.py, to_execute.py and simulation.py.
 def main():
-    # Remote access to MySQL database in RDS
-    conn = rds_operations.rds_connect()
-
     # Get parameters from input
     aph = float(sys.argv[1])
     apm = float(sys.argv[2])
     window = float(sys.argv[3])
     np = int(sys.argv[4])
     gens = int(sys.argv[5])
+    data_hash = sys.argv[6]
+
+    # Gets current instance type and performance
+    instance_type = getInstanceType()
+    interpsec = float(sys.argv[7])
+
+    # Does not insert if it was zero
+    if (interpsec == 0):
+        return
+
+    if (rds_config.collector_url != ""):
+        measurement_collector.send(rds_config.collector_url, "interpsec",
+                                   {"aph": aph, "apm": apm, "window": window, "np": np, "gens": gens,
+                                    "data_hash": data_hash, "instance_type": instance_type, "interpsec": interpsec},
+                                   rds_config.collector_spool)
+        return
+
+    # Remote access to MySQL database in RDS
+    conn = rds_operations.rds_connect()
 
     # Get parameters id
     idparameters = rds_operations.get_idparameters(conn, aph, apm, window, np, gens)
 
     # Get data id from hash
-    data_hash = sys.argv[6]
     iddata = rds_operations.get_iddata(conn, data_hash)
 
-    # Gets current instance type and performance
-    instance_type = getInstanceType()
-    interpsec = float(sys.argv[7])
-
     # Gets experiment id (with data, parameters and instance type)
     idexperiment = rds_operations.get_idexperiment(conn, iddata, idparameters, instance_type)
 
     # Insert performance measurement to the database
-    # Does not insert if it was zero
-    if (interpsec != 0):
-        rds_operations.insert_interpsec(conn, idexperiment, interpsec)
+    rds_operations.insert_interpsec(conn, idexperiment, interpsec)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2019 Nicholas Torres Okita <nicholas.okita@ggaunicamp.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+# This file contains the instance selection kernel shared by to_execute.py and
+# simulation.py. Instead of looping over every (instance type, availability
+# zone) pair, the candidates are scored for all pairs at once using NumPy.
+
+import numpy as np
+
+# Cost of the 20GB 1000IOPS disk (per hour) added to every instance price
+DISK_COST = 0.09375
+
+# Record returned by score_candidates, one for each candidate
+CANDIDATE_DTYPE = np.dtype([("type_idx", np.int64),
+                            ("az_idx", np.int64),
+                            ("price", np.float64),
+                            ("interpsec", np.float64),
+                            ("costperinterp", np.float64),
+                            ("costperinterp_stdev", np.float64),
+                            ("costperinterp_negative", np.float64),
+                            ("costperinterp_positive", np.float64)])
+
+# function profile_arrays
+# \param all_performance: rows returned by rds_operations.get_interpsec_allinstances
+# \return (list of instance types, interpsec vector, stddev vector)
+#
+# Converts the performance rows stored in the database to the vectors used by
+# score_candidates. Types with a single measurement have no deviation.
+def profile_arrays(all_performance):
+    instance_types = [result[0] for result in all_performance]
+    interpsec = np.array([float(result[1]) for result in all_performance], dtype=np.float64)
+    stddev = np.array([float(result[2] or 0) for result in all_performance], dtype=np.float64)
+
+    return instance_types, interpsec, stddev
+
+# function price_matrix
+# \param ops: instance_operations or pseudo_instance_operations object
+# \param instance_types: list of instance types (matrix rows)
+# \param zones: list of availability zones (matrix columns)
+# \return matrix with the current spot price of each (type, az) pair, NaN for
+# the pairs without price
+def price_matrix(ops, instance_types, zones):
+    prices = np.full((len(instance_types), len(zones)), np.nan)
+    zone_idx = {az: j for j, az in enumerate(zones)}
+    for i, instance_type in enumerate(instance_types):
+        for az, price in ops.get_current_spot_price_allaz(instance_type).items():
+            if az in zone_idx:
+                prices[i, zone_idx[az]] = price
+
+    return prices
+
+# function score_candidates
+# \param interpsec: performance (interpolations per second) for each type
+# \param stddev: performance standard deviation for each type
+# \param prices: matrix (types x zones) with the spot price, NaN or a
+# non-positive value where there is no price
+# \param target_ratio: interpolations per dollar needed to finish in budget
+# \param overhead: cost added to every spot price (disk)
+# \param allowed: optional boolean vector with the types that can be selected
+# \return array of CANDIDATE_DTYPE records, best performance first
+#
+# Computes, for every (type, az) pair, the interpolations per dollar
+# (costperinterp), its deviation and the worst case (negative) bound. The pairs
+# whose worst case is above the target ratio are returned, sorted by decreasing
+# performance. Ties keep the (type, az) order of the input.
+def score_candidates(interpsec, stddev, prices, target_ratio, overhead=DISK_COST, allowed=None):
+    interpsec = np.asarray(interpsec, dtype=np.float64)
+    stddev = np.asarray(stddev, dtype=np.float64)
+    prices = np.asarray(prices, dtype=np.float64).reshape(len(interpsec), -1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        valid = np.isfinite(prices) & (prices > 0)
+        price = prices + overhead
+        costperinterp = interpsec[:, None] / (price / 3600)
+        costperinterp_stdev = stddev[:, None] / (price / 3600)
+        costperinterp_negative = costperinterp - costperinterp_stdev
+        selected = valid & (costperinterp_negative > target_ratio)
+
+    if allowed is not None:
+        selected &= np.asarray(allowed, dtype=bool)[:, None]
+
+    type_idx, az_idx = np.nonzero(selected)
+    order = np.argsort(-interpsec[type_idx], kind="stable")
+    type_idx = type_idx[order]
+    az_idx = az_idx[order]
+
+    candidates = np.empty(len(type_idx), dtype=CANDIDATE_DTYPE)
+    candidates["type_idx"] = type_idx
+    candidates["az_idx"] = az_idx
+    candidates["price"] = price[type_idx, az_idx]
+    candidates["interpsec"] = interpsec[type_idx]
+    candidates["costperinterp"] = costperinterp[type_idx, az_idx]
+    candidates["costperinterp_stdev"] = costperinterp_stdev[type_idx, az_idx]
+    candidates["costperinterp_negative"] = costperinterp_negative[type_idx, az_idx]
+    candidates["costperinterp_positive"] = candidates["costperinterp"] + candidates["costperinterp_stdev"]
+
+    return candidates
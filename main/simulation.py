@@ -26,13 +26,16 @@
 
 import logging
 import sys
-import time
+import math
 from datetime import datetime
-import operator
-from instance_operations import instance_operations
 from pseudo_instance_operations import pseudo_instance_operations
 import rds_operations
+import selection
 import random
+from discrete_event import event_queue
+from decision_engine import decision_engine
+from decision_engine import MAX_LAPS
+from fleet_state import instance_record
 
 # function getLogger
 #
@@ -75,6 +78,7 @@ def get_from_input(_string, input_dict):
 # \param target_nodes: number of instances that will be used
 # \param data_hash: data to be executed hash (needs to be stored in the database)
 # \param idparameters: database id with the parameters used in experiment
+# \param price_file: price log or price trace used by the simulation
 #
 # This function will print the estimated Pareto given the stored performance and
 # current price for each instance. Note that the Job Manager instance selected
@@ -83,16 +87,15 @@ def get_from_input(_string, input_dict):
 #
 # Furthermore, we consider a performance penalty of 0.1% for each new instance
 # added.
-def pareto(target_nodes, data_hash, idparameters):
+def pareto(target_nodes, data_hash, idparameters, price_file="log_prices.csv"):
     all_zones = ['us-east-1a', 'us-east-1b', 'us-east-1c', 'us-east-1d', 'us-east-1e', 'us-east-1f']
 
     conn = rds_operations.rds_connect()
-    target_tasks = rds_operations.get_interpols(conn, idparameters, rds_operations.get_iddata(conn, data_hash))
     iddata = rds_operations.get_iddata(conn, data_hash)
+    target_tasks = rds_operations.get_interpols(conn, idparameters, iddata)
 
     all_performance = rds_operations.get_interpsec_allinstances(conn, iddata, idparameters)
-    fake_ops = pseudo_instance_operations()
-    ops = instance_operations(logger)
+    fake_ops = pseudo_instance_operations(price_file)
 
     jm_perf = 0
     for result in all_performance:
@@ -111,7 +114,7 @@ def pareto(target_nodes, data_hash, idparameters):
         best_az = ""
 
         for az in all_zones:
-            price = ops.get_current_spot_price(instance_type, az)
+            price = fake_ops.get_current_spot_price(instance_type, az)
 
             if (price < best_price and price > 0):
                 best_price = price + 0.09375
@@ -123,9 +126,432 @@ def pareto(target_nodes, data_hash, idparameters):
         price_to_pay = time_to_run * target_nodes * best_price / 3600 + time_to_run * 0.68 / 3600
         logger.info(string.format(instance_type,time_to_run,price_to_pay))
 
+# Kinds of events of the simulation and their priority (lower runs first when
+# two events happen at the same time)
+PRICE_EVENT = "price"
+BOOT_EVENT = "boot"
+FAILURE_EVENT = "failure"
+DONE_EVENT = "done"
+TICK_EVENT = "tick"
+EVENT_PRIORITY = {PRICE_EVENT: 0, BOOT_EVENT: 1, FAILURE_EVENT: 2, DONE_EVENT: 3, TICK_EVENT: 4}
+
+class simulator:
+
+    # function __init__
+    # \param logger: logger to output information
+    # \param provider: instance_provider.instance_provider object that gives the
+    # spot prices, creates and terminates the instances and whose clock
+    # (add_minutes) follows the simulated time, usually a
+    # pseudo_instance_operations object
+    # \param profile: (instance types, interpsec, stddev) as returned by
+    # selection.profile_arrays
+    # \param jm_interpsec: performance row of the Job Manager instance type
+    # \param in_tasks: number of tasks to be executed
+    # \param in_budget: budget in dollars to complete the execution
+    # \param target_nodes: number of instances running
+    # \param time_skip: time between two iterations of the control loop in minutes
+    # \param failure_exec: failure rate (per iteration) while instance is running
+    # \param zones: list of availability zones
+    # \param mode: "step" or "event" (see run)
+    # \param boot_time: time in minutes until a new instance starts working
+    # (only used in the "event" mode)
+    # \param rng: random number generator (random.Random object or the random
+    # module itself)
+    # \param valid_count: number of iterations an instance may be below the
+    # target ratio before being terminated
+    # \param excluded: instance types that are never launched
+    def __init__(self, logger, provider, profile, jm_interpsec, in_tasks, in_budget, target_nodes,
+                 time_skip, failure_exec, zones, mode="step", boot_time=0, rng=random, valid_count=1, excluded=()):
+        self.logger = logger
+        self.provider = provider
+        self.profile = profile
+        self.instance_types, self.interpsec, self.stddev_interpsec = profile
+        self.type_interpsec = {instance_type: float(interpsec)
+                               for instance_type, interpsec in zip(self.instance_types, self.interpsec)}
+        self.engine = decision_engine(zones, target_nodes, valid_count, excluded)
+        self.valid_count = valid_count
+        self.jm_interpsec = jm_interpsec
+        self.target_nodes = target_nodes
+        self.time_skip = time_skip
+        self.failure_exec = failure_exec
+        self.zones = zones
+        self.mode = mode
+        self.boot_time = boot_time
+        self.rng = rng
+
+        self.in_tasks = in_tasks
+        self.in_budget = in_budget
+        self._in_budget = in_budget
+        self.tasks_sofar = 0
+        self.wk_spent_sofar = 0
+        self.jm_spent_sofar = 0
+        self.spent_sofar = 0
+        self.time_spent = 0
+        self.finished = False
+
+        # Running instances. In the "step" mode they are instance_record
+        # objects (see fleet_state.py), in the "event" mode dictionaries with
+        # the instance_record ("inst"), rate (interpsec with noise), booted
+        # and the failure event. The price and performance of the records are
+        # what the Job Manager would measure: the current price (plus disk)
+        # and the interpsec of the type, -1 before the instance boots.
+        self.list_running = []
+        self.jm_rate = 0
+        self.pool_events = {}
+        self.done_event = None
+        self.events = event_queue()
+
+    # function price
+    # \param instance_type: string containing the instance type
+    # \param az: availability zone
+    # \return spot price plus disk cost
+    def price(self, instance_type, az):
+        return self.provider.get_current_spot_price(instance_type, az) + selection.DISK_COST
+
+    # function set_time
+    # \param now: simulated time in minutes
+    # Moves the clock of the provider to the simulated time
+    def set_time(self, now):
+        self.provider.add_minutes(now - self.time_spent)
+        self.time_spent = now
+
+    # function log_status
+    # Outputs the current state of the simulation
+    def log_status(self):
+        tasks_str = 'TASKS PROCESSED SO FAR = {}/{}'
+        spent_str = 'HOW MONEY WAS SPENT (TOTAL = JM + WK) = {} = {} + {}'
+        money_str = 'MONEY SPENT SO FAR = {}/{} (user requested = {})'
+        instances_str = 'NUMBER OF INSTANCES RUNNING = {}/{}'
+        simulated_time = 'SIMULATED TIMENOW = {}'
+        log_to_csv = 'CSV\t{}\t{}'
+
+        self.logger.info(simulated_time.format(self.provider.time_now))
+        self.logger.info(tasks_str.format(self.tasks_sofar, self.in_tasks))
+        self.logger.info(spent_str.format(self.spent_sofar, self.jm_spent_sofar, self.wk_spent_sofar))
+        self.logger.info(money_str.format(self.spent_sofar, self.in_budget, self._in_budget))
+        self.logger.info(instances_str.format(len(self.list_running), self.target_nodes))
+        self.logger.info(log_to_csv.format(self.time_spent/60, self.spent_sofar))
+
+    # function running_records
+    # \return instance_record of every running instance
+    def running_records(self):
+        if self.mode == "step":
+            return self.list_running
+        return [inst["inst"] for inst in self.list_running]
+
+    # function verify
+    # \param target_ratio: tasks left per dollar left
+    # Updates the validity counters of the running instances (see
+    # decision_engine.verify), the ones whose counter reached zero must be
+    # terminated
+    def verify(self, target_ratio):
+        valid, terminate = self.engine.verify(self.running_records(), target_ratio)
+        for record, counter in valid:
+            record.valid = counter
+
+    # function get_candidates
+    # \return list of candidates (instance_record), best first
+    #
+    # If there are no candidates within the budget, the budget is increased by
+    # 10% until there are (see decision_engine.select).
+    def get_candidates(self):
+        target_tasks = self.in_tasks - self.tasks_sofar
+        prices = selection.price_matrix(self.provider, self.instance_types, self.zones)
+
+        # The running instances of each (type, az) pair, grouped once for
+        # every pair looked up by select
+        by_location = {}
+        for inst in self.running_records():
+            by_location.setdefault((inst.instance_type, inst.instance_az), []).append(inst)
+
+        def at(instance_type, az):
+            return by_location.get((instance_type, az), [])
+
+        candidates, in_budget, increases = self.engine.select(at, self.profile, prices, target_tasks, self.in_budget,
+                                                              self.spent_sofar)
+
+        if (len(candidates) == 0):
+            self.logger.error("NO SPOT PRICE FOR ANY INSTANCE TYPE")
+        if (increases > 0):
+            self.logger.error("IMPOSSIBLE TO RUN EXPERIMENT WITH THIS CONFIGURATION")
+            self.logger.error("INCREASING BUDGET BY 10\% " + str(increases) + " TIME(S) (TO " + str(in_budget) + " USD)")
+        self.in_budget = in_budget
+
+        self.logger.debug(candidates)
+
+        return candidates
+
+    # function create_instances
+    # \param candidates: list of candidates (instance_record)
+    # \param number_running: number of instances running
+    # \return list of instance_record of the instances created
+    #
+    # Creates the missing instances in waves (see decision_engine.plan_wave),
+    # as the Job Manager: instances that fail to be created are requested
+    # again in the next wave, from the next candidates.
+    def create_instances(self, candidates, number_running):
+        created = []
+        position = 0
+        counter = 0
+        while number_running + len(created) < self.target_nodes and counter < MAX_LAPS and len(candidates) > 0:
+            requests, position, laps = self.engine.plan_wave(candidates, self.target_nodes - number_running -
+                                                             len(created), position)
+            counter += laps
+
+            for instance_id, instance_type, az, price in self.provider.createSpotInstances(requests):
+                created.append(instance_record(instance_id, instance_type, az, price,
+                                               self.type_interpsec[instance_type], valid=self.valid_count))
+
+        return created
+
+    # function step_tick
+    # \param now: simulated time in minutes
+    # \param payload: not used
+    #
+    # One iteration of the fixed step simulation: the instances run for
+    # time_skip minutes (failing with probability failure_exec), then the
+    # instances that are over budget are removed and new ones are created.
+    def step_tick(self, now, payload):
+        self.set_time(now)
+        list_running = self.list_running
+
+        negative_bias = (len(list_running)-1)/1000
+        for inst in list(list_running):
+            inst.price = self.price(inst.instance_type, inst.instance_az)
+            self.wk_spent_sofar += inst.price * self.time_skip / 60
+
+            coin_toss = self.rng.random()
+            if (coin_toss < self.failure_exec):
+                self.logger.debug('REMOVING INST ' + inst.instance_type + ' FOR RANDOM FAILURE (' + str(coin_toss) + '/' + str(
+                    self.failure_exec) + ')')
+                list_running.remove(inst)
+                self.provider.terminateInstance(inst.instance_id)
+            else:
+                self.tasks_sofar += self.type_interpsec[inst.instance_type] * self.rng.uniform(0.9 - negative_bias, 1.1 - negative_bias) * self.time_skip * 60
+
+        self.tasks_sofar += self.rng.uniform(self.jm_interpsec[1] - self.jm_interpsec[2],
+                                             self.jm_interpsec[1] + self.jm_interpsec[2]) * self.time_skip * 60
+        self.jm_spent_sofar += 0.68 * self.time_skip / 60
+
+        self.spent_sofar = self.wk_spent_sofar + self.jm_spent_sofar
+
+        target_tasks = self.in_tasks - self.tasks_sofar
+
+        self.log_status()
+
+        self.logger.debug("INSTANCES RUNNING")
+        for inst in list_running:
+            self.logger.debug("(" + inst.instance_type + "," + inst.instance_az + "," + str(inst.price) + "," +
+                              str(inst.performance_negative) + ")")
+
+        if (target_tasks <= 0):
+            self.finished = True
+            self.events.stop()
+            return
+
+        self.verify(self.engine.target_ratio(target_tasks, self.in_budget, self.spent_sofar))
+
+        self.list_running = []
+        for inst in list_running:
+            if (inst.valid > 0):
+                self.list_running.append(inst)
+            else:
+                self.logger.debug('REMOVING INST ' + inst.instance_type)
+                self.provider.terminateInstance(inst.instance_id)
+
+        if (len(self.list_running) < self.target_nodes):
+            candidates = self.get_candidates()
+            self.list_running.extend(self.create_instances(candidates, len(self.list_running)))
+
+        self.events.schedule(now + self.time_skip, TICK_EVENT, priority=EVENT_PRIORITY[TICK_EVENT])
+
+    # function advance
+    # \param now: simulated time in minutes
+    # Accounts the tasks completed and money spent since the last event,
+    # considering the current rate and price of each instance
+    def advance(self, now):
+        elapsed = now - self.time_spent
+        for inst in self.list_running:
+            self.wk_spent_sofar += inst["inst"].price * elapsed / 60
+            if inst["booted"]:
+                self.tasks_sofar += inst["rate"] * elapsed * 60
+        self.tasks_sofar += self.jm_rate * elapsed * 60
+        self.jm_spent_sofar += 0.68 * elapsed / 60
+        self.spent_sofar = self.wk_spent_sofar + self.jm_spent_sofar
+        self.set_time(now)
+
+    # function predict_done
+    # \param now: simulated time in minutes
+    # Schedules the completion of the execution given the current rates (it
+    # must be called whenever a rate changes)
+    def predict_done(self, now):
+        self.events.cancel(self.done_event)
+        self.done_event = None
+        rate = self.jm_rate + sum(inst["rate"] for inst in self.list_running if inst["booted"])
+        if rate > 0:
+            remaining = self.in_tasks - self.tasks_sofar
+            self.done_event = self.events.schedule(now + remaining / (rate * 60), DONE_EVENT,
+                                                   priority=EVENT_PRIORITY[DONE_EVENT])
+
+    # function watch_pool
+    # \param now: simulated time in minutes
+    # \param pool: (instance_type, az)
+    # Schedules the next price change of a pool that has running instances
+    def watch_pool(self, now, pool):
+        if pool in self.pool_events or not hasattr(self.provider, "next_price_change"):
+            return
+        delay = self.provider.next_price_change(pool[0], pool[1])
+        if delay is not None:
+            self.pool_events[pool] = self.events.schedule(now + delay, PRICE_EVENT, pool,
+                                                          priority=EVENT_PRIORITY[PRICE_EVENT])
+
+    # function remove_instance
+    # \param inst: running instance (dictionary)
+    # Removes the instance itself (another instance may compare equal to it)
+    def remove_instance(self, inst):
+        for i, other in enumerate(self.list_running):
+            if other is inst:
+                del self.list_running[i]
+                break
+        self.events.cancel(inst["failure"])
+        self.provider.terminateInstance(inst["inst"].instance_id)
+
+    # function event_tick
+    # \param now: simulated time in minutes
+    # \param payload: not used
+    #
+    # Iteration of the control loop in the event driven simulation: removes
+    # the instances that are over budget, creates new ones and draws the rate
+    # of every instance until the next iteration.
+    def event_tick(self, now, payload):
+        self.advance(now)
+
+        target_tasks = self.in_tasks - self.tasks_sofar
+
+        self.log_status()
+
+        self.logger.debug("INSTANCES RUNNING")
+        for inst in self.list_running:
+            self.logger.debug("(" + inst["inst"].instance_type + "," + inst["inst"].instance_az + "," +
+                              str(inst["inst"].price) + "," + str(inst["inst"].performance_negative) + ")")
+
+        if (target_tasks <= 0):
+            self.done(now, None)
+            return
+
+        self.verify(self.engine.target_ratio(target_tasks, self.in_budget, self.spent_sofar))
+
+        for inst in list(self.list_running):
+            if (inst["inst"].valid <= 0):
+                self.logger.debug('REMOVING INST ' + inst["inst"].instance_type)
+                self.remove_instance(inst)
+
+        if (len(self.list_running) < self.target_nodes):
+            candidates = self.get_candidates()
+            for cand in self.create_instances(candidates, len(self.list_running)):
+                cand.price = self.price(cand.instance_type, cand.instance_az)
+                inst = {"inst": cand,
+                        "rate": 0,
+                        "booted": self.boot_time <= 0,
+                        "failure": None}
+                if not inst["booted"]:
+                    cand.performance_negative = -1
+                    self.events.schedule(now + self.boot_time, BOOT_EVENT, inst, priority=EVENT_PRIORITY[BOOT_EVENT])
+                if self.failure_exec > 0:
+                    # Same chance of failing during one iteration as the
+                    # fixed step simulation
+                    failure_rate = -math.log(1 - min(self.failure_exec, 0.999999)) / self.time_skip
+                    inst["failure"] = self.events.schedule(now + self.rng.expovariate(failure_rate), FAILURE_EVENT,
+                                                           inst, priority=EVENT_PRIORITY[FAILURE_EVENT])
+                self.list_running.append(inst)
+                self.watch_pool(now, (cand.instance_type, cand.instance_az))
+
+        negative_bias = (len(self.list_running)-1)/1000
+        for inst in self.list_running:
+            inst["rate"] = self.type_interpsec[inst["inst"].instance_type] * self.rng.uniform(0.9 - negative_bias, 1.1 - negative_bias)
+        self.jm_rate = self.rng.uniform(self.jm_interpsec[1] - self.jm_interpsec[2],
+                                        self.jm_interpsec[1] + self.jm_interpsec[2])
+
+        self.predict_done(now)
+        self.events.schedule(now + self.time_skip, TICK_EVENT, priority=EVENT_PRIORITY[TICK_EVENT])
+
+    # function boot
+    # \param now: simulated time in minutes
+    # \param inst: instance that finished booting
+    def boot(self, now, inst):
+        self.advance(now)
+        inst["booted"] = True
+        inst["inst"].performance_negative = self.type_interpsec[inst["inst"].instance_type]
+        self.predict_done(now)
+
+    # function failure
+    # \param now: simulated time in minutes
+    # \param inst: instance terminated by the provider
+    def failure(self, now, inst):
+        self.advance(now)
+        self.logger.debug('REMOVING INST ' + inst["inst"].instance_type + ' FOR RANDOM FAILURE')
+        self.remove_instance(inst)
+        self.predict_done(now)
+
+    # function price_change
+    # \param now: simulated time in minutes
+    # \param pool: (instance_type, az) whose price changed
+    def price_change(self, now, pool):
+        self.advance(now)
+        del self.pool_events[pool]
+        running = [inst for inst in self.list_running if (inst["inst"].instance_type, inst["inst"].instance_az) == pool]
+        if len(running) > 0:
+            price = self.price(pool[0], pool[1])
+            for inst in running:
+                inst["inst"].price = price
+            self.watch_pool(now, pool)
+
+    # function done
+    # \param now: simulated time in minutes
+    # \param payload: not used
+    def done(self, now, payload):
+        self.advance(now)
+        self.tasks_sofar = max(self.tasks_sofar, self.in_tasks)
+        self.log_status()
+        self.finished = True
+        self.events.stop()
+
+    # function run
+    # \param until: optional limit of simulated time in minutes
+    # \return dictionary with the simulated time to complete the execution
+    # (minutes), the money spent (total, Job Manager and workers), the tasks
+    # completed, the final budget and whether the execution finished
+    #
+    # In the "step" mode, the simulation advances time_skip minutes on each
+    # iteration of the control loop, exactly as the original fixed step loop.
+    # In the "event" mode, progress and cost are integrated between events
+    # (price changes from the price file, instances finishing booting,
+    # random failures, control loop iterations and the completion of the
+    # execution), so the completion time is exact instead of a multiple of
+    # time_skip. In both modes the clock jumps from one event to the next.
+    def run(self, until=None):
+        if self.mode == "step":
+            handlers = {TICK_EVENT: self.step_tick}
+        else:
+            handlers = {TICK_EVENT: self.event_tick,
+                        BOOT_EVENT: self.boot,
+                        FAILURE_EVENT: self.failure,
+                        PRICE_EVENT: self.price_change,
+                        DONE_EVENT: self.done}
+
+        self.events.schedule(0, TICK_EVENT, priority=EVENT_PRIORITY[TICK_EVENT])
+        self.events.run(handlers, until)
+
+        return {"time": self.time_spent,
+                "spent": self.spent_sofar,
+                "jm_spent": self.jm_spent_sofar,
+                "wk_spent": self.wk_spent_sofar,
+                "tasks": self.tasks_sofar,
+                "budget": self.in_budget,
+                "finished": self.finished}
+
 # function main
 #
-# \param (command line input) interval : time to wait for the next iteration in seconds
 # \param (command line input) time_skip : time to skip in simulation in minutes
 # \param (command line input) failure_create : failure rate (percentage) when creating an instance
 # \param (command line input) failure_execute : failure rate (percentage) while instance is running
@@ -134,6 +560,14 @@ def pareto(target_nodes, data_hash, idparameters):
 # \param (command line input) nodes : number of instances running
 # \param (command line input) target_tasks : number of tasks to be executed (if empty, gets from database from
 # data_hash)
+# \param (command line input) prices : price log or price trace (see price_trace.py) with the prices for the
+# simulation (if empty, uses log_prices.csv)
+# \param (command line input) mode : "step" (default) for the fixed step simulation or "event" for the event
+# driven one (see simulator.run)
+# \param (command line input) boot_time : time in minutes for a new instance to start working (event mode only)
+# \param (command line input) valid_count : number of iterations an instance may be below the target ratio before
+# being terminated (default 1)
+# \param (command line input) exclude : comma separated instance types that are never launched (e.g. p3.2xlarge)
 # (id parameters is set as default to 41, can be changed in code)
 #
 # Before the iterations loop, this function sets the input parameters and
@@ -147,7 +581,8 @@ def pareto(target_nodes, data_hash, idparameters):
 # killing the ones that are and replacing them with instances that are not.
 #
 # If the experiment cannot continue due to budget constraints, then the budget
-# is increased by 10%.
+# is increased by 10%. These decisions are made by decision_engine.py, the same
+# policy used by the Job Manager (to_execute.py).
 #
 # The differences between the simulation and the real module (to_execute.py) is
 # that the simulation considers that there is an user defined chance of an
@@ -157,7 +592,8 @@ def pareto(target_nodes, data_hash, idparameters):
 # provider. Furthermore, it allows the user to define the prices via a file
 # (log_prices.py) so that they can see how the algorithm behaves given price
 # changes. At last, to allow the user to simulate the execution without waiting
-# for the actual execution time, it is possible to set a time_skip, so that the
+# for the actual execution time, the simulated clock jumps from one event to
+# the next (every time_skip minutes in the fixed step mode), so that the
 # module will simulate how much of the task was completed (with a random
 # oscillation of 10% and performance penalty of 0.1% with an increased number of
 # instances) and how much was spent.
@@ -172,154 +608,51 @@ def main():
             key, val = cur.split('=')
             input_dict.update({key: val})
 
-    interval = float(get_from_input("interval", input_dict))
     time_skip = float(get_from_input("time_skip", input_dict))
     failure_create = float(get_from_input("failure_create", input_dict))
     failure_exec = float(get_from_input("failure_exec", input_dict))
 
-    list_running = []
     budget = float(get_from_input("budget", input_dict))
     data_hash = get_from_input("data_hash", input_dict)
     target_nodes = int(get_from_input("nodes", input_dict))
+    price_file = get_from_input("prices", input_dict)
+    if (price_file == -1):
+        price_file = "log_prices.csv"
+
+    mode = get_from_input("mode", input_dict)
+    if (mode == -1):
+        mode = "step"
+    boot_time = float(get_from_input("boot_time", input_dict))
+    if (boot_time == -1):
+        boot_time = 0
+    valid_count = int(get_from_input("valid_count", input_dict))
+    if (valid_count == -1):
+        valid_count = 1
+    excluded = get_from_input("exclude", input_dict)
+    if (excluded == -1):
+        excluded = ""
+    excluded = [instance_type for instance_type in excluded.split(",") if instance_type]
 
     all_zones = ['us-east-1a', 'us-east-1b', 'us-east-1c', 'us-east-1d', 'us-east-1e', 'us-east-1f']
 
     idparameters = 41
 
     conn = rds_operations.rds_connect()
+    iddata = rds_operations.get_iddata(conn, data_hash)
     target_tasks = float(get_from_input("target_tasks", input_dict))
     if (target_tasks == -1):
-        target_tasks = rds_operations.get_interpols(conn, idparameters, rds_operations.get_iddata(conn, data_hash))
-    iddata = rds_operations.get_iddata(conn, data_hash)
-
-    spent_sofar = 0
-    wk_spent_sofar = 0
-    jm_spent_sofar = 0
-    tasks_sofar = 0
+        target_tasks = rds_operations.get_interpols(conn, idparameters, iddata)
 
-    in_budget = budget
-    _in_budget = in_budget
-    in_tasks = target_tasks
+    fake_ops = pseudo_instance_operations(price_file, failure_create)
 
-    fake_ops = pseudo_instance_operations()
-    ops = instance_operations(logger)
+    pareto(target_nodes, data_hash, idparameters, price_file)
+    jm_interpsec = rds_operations.get_interpsec(conn, iddata, idparameters, "c5.4xlarge")[0]
+    profile = selection.profile_arrays(rds_operations.get_interpsec_allinstances(conn, iddata, idparameters))
 
-    pareto(target_nodes, data_hash, idparameters)
-    jm_cost = 0.68
-    jm_interpsec = rds_operations.get_interpsec(conn, iddata, idparameters, "c5.4xlarge")
-
-    tasks_str = 'TASKS PROCESSED SO FAR = {}/{}'
-    spent_str = 'HOW MONEY WAS SPENT (TOTAL = JM + WK) = {} = {} + {}'
-    money_str = 'MONEY SPENT SO FAR = {}/{} (user requested = {})'
-    instances_str = 'NUMBER OF INSTANCES RUNNING = {}/{}'
-    simulated_time = 'SIMULATED TIMENOW = {}'
-
-    log_to_csv = 'CSV\t{}\t{}'
-
-    time_spent = 0
-
-    while target_tasks > 0:
-        negative_bias = (len(list_running)-1)/1000
-        for inst in list_running:
-            price = ops.get_current_spot_price(inst[1], inst[2]) + 0.09375
-            wk_spent_sofar += price * time_skip / 60
-
-            coin_toss = random.random()
-            if (coin_toss < failure_exec):
-                logger.debug('REMOVING INST ' + inst[1] + ' FOR RANDOM FAILURE (' + str(coin_toss) + '/' + str(
-                    failure_exec) + ')')
-                list_running.remove(inst)
-            else:
-                tasks_sofar += inst[8] * random.uniform(0.9 - negative_bias, 1.1 - negative_bias) * time_skip * 60
-
-        tasks_sofar += random.uniform(jm_interpsec[1] - jm_interpsec[2], jm_interpsec[1] + jm_interpsec[2]) * time_skip * 60
-        jm_spent_sofar += 0.68 * time_skip / 60
-
-        spent_sofar = wk_spent_sofar + jm_spent_sofar
-
-        target_tasks = in_tasks - tasks_sofar
-        budget = in_budget - spent_sofar
-
-        logger.info(simulated_time.format(fake_ops.time_now))
-        logger.info(tasks_str.format(tasks_sofar, in_tasks))
-        logger.info(spent_str.format(spent_sofar, jm_spent_sofar, wk_spent_sofar))
-        logger.info(money_str.format(spent_sofar, in_budget, _in_budget))
-        logger.info(instances_str.format(len(list_running), target_nodes))
-        logger.info(log_to_csv.format(time_spent/60,spent_sofar))
-
-        logger.debug("INSTANCES RUNNING")
-        for inst in list_running:
-            logger.debug("(" + inst[1] + "," + inst[2] + "," + str(inst[3]) + "," + str(inst[8]) + ")")
-
-        if (target_tasks <= 0):
-            break
-
-        target_ratio = target_tasks / budget
-
-        old_list = list_running
-        list_running = []
-
-        for inst in old_list:
-            price = ops.get_current_spot_price(inst[1], inst[2]) + 0.09375
-            if (inst[8]/(price/3600) >= target_ratio):
-                list_running.append(inst)
-            else:
-                logger.debug('REMOVING INST ' + inst[1])
-
-        if (len(list_running) < target_nodes):
-            candidates = []
-
-            while len(candidates) == 0:
-                budget = in_budget - spent_sofar
-                target_ratio = target_tasks / budget
-                all_performance = rds_operations.get_interpsec_allinstances(conn, iddata, idparameters)
-                for result in all_performance:
-                    instance_type = result[0]
-                    interpsec = result[1]
-                    stddev_interpsec = result[2]
-
-                    # prices = instance_operations.get_current_spot_price_allaz(ec2, instance_type)
-
-                    for az in all_zones:
-                        price = ops.get_current_spot_price(instance_type, az) + 0.09375
-                        costperinterp = float(interpsec / (price / 3600))
-                        costperinterp_stdev = float(stddev_interpsec / (price / 3600))
-                        costperinterp_positive = costperinterp + costperinterp_stdev
-                        costperinterp_negative = costperinterp - costperinterp_stdev
-                        tuple = (
-                        "inactive", instance_type, az, price, costperinterp, costperinterp_stdev, costperinterp_negative,
-                        costperinterp_positive, interpsec)
-
-                        if costperinterp_negative > target_ratio:
-                            if (instance_type != "p3.2xlarge"):
-                                candidates.append(tuple)
-
-                candidates.sort(key=operator.itemgetter(8), reverse=True)
-                logger.debug(candidates)
-
-                if (len(candidates) == 0):
-                    logger.error("IMPOSSIBLE TO RUN EXPERIMENT WITH THIS CONFIGURATION")
-                    in_budget += in_budget / 10
-                    logger.error("INCREASING BUDGET BY 10\% (TO " + str(in_budget) + " USD)")
-
-            k = 0
-            while len(list_running) < target_nodes:
-                for i in range(0,(int(target_nodes/5))):
-                    if (random.random() > failure_create):
-                        list_running.append(candidates[k])
-                    else:
-                        logger.debug("FAILED TO CREATE INSTANCE OF TYPE " + candidates[k][1])
-                        k = (k + 1) % len(candidates)
-
-                    if len(list_running) >= target_nodes:
-                        break
-                k = (k + 1) % len(candidates)
-
-        time.sleep(interval)
-        fake_ops.add_minutes(time_skip)
-        time_spent += time_skip
+    sim = simulator(logger, fake_ops, profile, jm_interpsec, target_tasks, budget, target_nodes,
+                    time_skip, failure_exec, all_zones, mode, boot_time, random, valid_count, excluded)
+    sim.run()
 
 if __name__ == "__main__":
     logger = getLogger(__name__)
     main()
-
@@ -32,11 +32,17 @@ import sys
 import time
 import boto3
 from datetime import datetime
-from datetime import timedelta
-import operator
-import threading
 from instance_operations import instance_operations
 import rds_operations
+import selection
+from cloudwatch_metrics import metrics_collector
+from monitoring import fleet_monitor
+from profile_cache import profile_cache
+from fleet_state import fleet_state
+from fleet_state import instance_record
+from instrumentation import instrumentation
+from decision_engine import decision_engine
+from decision_engine import MAX_LAPS
 
 # function getLogger
 #
@@ -78,6 +84,7 @@ def get_from_input(_string, input_dict):
 # \param target_nodes: number of instances that will be used
 # \param data_hash: data to be executed hash (needs to be stored in the database)
 # \param idparameters: database id with the parameters used in experiment
+# \param ops: instance_operations object used to get the spot prices
 #
 # This function will print the estimated Pareto given the stored performance and
 # current price for each instance. Note that the Job Manager instance selected
@@ -86,15 +93,16 @@ def get_from_input(_string, input_dict):
 #
 # Furthermore, we consider a performance penalty of 0.1% for each new instance
 # added.
-def pareto(target_nodes, data_hash, idparameters):
+def pareto(target_nodes, data_hash, idparameters, ops):
     all_zones = ['us-east-1a', 'us-east-1b', 'us-east-1c', 'us-east-1d', 'us-east-1e', 'us-east-1f']
 
     conn = rds_operations.rds_connect()
-    target_tasks = rds_operations.get_interpols(conn, idparameters, rds_operations.get_iddata(conn, data_hash))
     iddata = rds_operations.get_iddata(conn, data_hash)
+    target_tasks = rds_operations.get_interpols(conn, idparameters, iddata)
 
     all_performance = rds_operations.get_interpsec_allinstances(conn, iddata, idparameters)
-    ops = instance_operations(logger)
+    # Fetch the prices of every instance type at once
+    ops.prefetch_spot_prices([result[0] for result in all_performance])
 
     jm_perf = 0
     for result in all_performance:
@@ -125,22 +133,302 @@ def pareto(target_nodes, data_hash, idparameters):
         price_to_pay = time_to_run * target_nodes * best_price / 3600 + time_to_run * 0.68 / 3600
         logger.info(string.format(instance_type,time_to_run,price_to_pay))
 
+# Availability zones where the instances can be launched
+ALL_ZONES = ['us-east-1a', 'us-east-1b', 'us-east-1c', 'us-east-1d', 'us-east-1e', 'us-east-1f']
+
+class job_manager:
+
+    # function __init__
+    # \param logger: logger to output information
+    # \param ops: instance_operations object (or any object with the same
+    # methods, see benchmark.py)
+    # \param cloudwatch: CloudWatch client
+    # \param conn: Database connection object
+    # \param data_hash: dataset hash stored in the database
+    # \param budget: budget in dollars to complete the execution
+    # \param target_nodes: maximum number of instances running
+    # \param interval: time between two iterations in minutes
+    # \param valid_count: number of iterations an instance may be below the
+    # target ratio before being terminated
+    # \param deadline: maximum time in seconds to gather the state of the
+    # running instances (half of the interval if None)
+    # \param monitor_workers: number of concurrent requests while gathering the
+    # state of the running instances
+    # \param launch_timeout: maximum time in seconds waiting for Spot requests
+    # \param instruments: instrumentation object (a new one if None)
+    # \param now: function that returns the current time (UTC), datetime.utcnow
+    # if None
+    # \param idparameters: id for the parameters
+    # \param excluded: instance types that are never launched
+    def __init__(self, logger, ops, cloudwatch, conn, data_hash, budget, target_nodes, interval, valid_count=1,
+                 deadline=None, monitor_workers=16, launch_timeout=30, instruments=None, now=None,
+                 idparameters=41, excluded=()):
+        if instruments is None:
+            instruments = instrumentation()
+        if now is None:
+            now = datetime.utcnow
+        if deadline is None:
+            deadline = interval * 60 / 2
+
+        self.logger = logger
+        self.ops = ops
+        self.target_nodes = target_nodes
+        self.interval = interval
+        self.valid_count = valid_count
+        self.deadline = deadline
+        self.launch_timeout = launch_timeout
+        self.instruments = instruments
+        self.now = now
+
+        iddata = rds_operations.get_iddata(conn, data_hash)
+        self.target_tasks = rds_operations.get_interpols(conn, idparameters, iddata)
+
+        # Performance of each instance type, kept in memory and updated with the
+        # measurements stored by the workers during the execution
+        self.profile = profile_cache(conn, iddata, idparameters)
+
+        self.spent_sofar = 0
+        self.tasks_sofar = 0
+
+        self.in_budget = budget
+        self._in_budget = budget
+        self.in_tasks = self.target_tasks
+
+        self.time_start = ops.get_jobmanager_init_time()
+        self.monitor = fleet_monitor(ops, metrics_collector(cloudwatch), logger, monitor_workers, instruments)
+
+        self.fleet = fleet_state()
+        self.engine = decision_engine(ALL_ZONES, target_nodes, valid_count, excluded)
+        self.wk_spent_sofar = 0
+        self.jm_spent_sofar = 0
+
+    # function update_costs
+    # Adds the cost of the Job Manager and of the running instances since the
+    # last iteration
+    def update_costs(self):
+        jm_diff = (self.now() - self.time_start)
+        self.jm_spent_sofar = jm_diff.total_seconds() * (0.68+0.09375) / 3600
+
+        for inst in self.fleet:
+            diff = self.now() - inst.cur_time
+            inst.cur_time = self.now()
+            self.wk_spent_sofar += float(inst.price) * diff.total_seconds() / 3600
+            inst.prev_valid = inst.valid
+            self.fleet.set_valid(inst, 0)
+
+    # function monitor_fleet
+    # Verifies running instances (all requests are made concurrently and
+    # the instances whose information missed the deadline are stale)
+    def monitor_fleet(self):
+        fleet = self.fleet
+        for inst_state in self.monitor.gather(self.interval, self.deadline):
+            instance_id = inst_state["instance_id"]
+            instance_type = inst_state["instance_type"]
+            instance_az = inst_state["instance_az"]
+
+            if inst_state["stale"]:
+                # Keep the previous information, new instances are only
+                # added in the next iteration
+                inst = fleet.get(instance_id)
+                if inst is not None:
+                    fleet.set_valid(inst, inst.prev_valid)
+                    inst.stale = True
+                continue
+
+            init_time = inst_state["init_time"]
+            price = inst_state["price"] + 0.09375
+
+            # Time series of each metric, most recent datapoint first
+            result = inst_state["metrics"].get('perf_sec', [])
+            tasks_completed = inst_state["metrics"].get('tasks_completed', [])
+            result_stdev = inst_state["metrics"].get('perf_sec_stdev', [])
+
+            if tasks_completed:
+                if (tasks_completed[0][1]) > self.tasks_sofar:
+                    self.tasks_sofar = tasks_completed[0][1]
+
+            inst = fleet.get(instance_id)
+            if inst is None:
+                if result and result_stdev:
+                    performance_negative = float(result[0][1]) - float(result_stdev[0][1])
+                else:
+                    performance_negative = -1
+
+                fleet.add(instance_record(instance_id, instance_type, instance_az, price, performance_negative,
+                                          init_time, self.valid_count))
+            else:
+                fleet.set_valid(inst, inst.prev_valid)
+                inst.stale = False
+
+                if result and result_stdev:
+                    inst.price = price
+                    inst.performance_negative = float(result[0][1]) - float(result_stdev[0][1])
+
+    # function log_progress
+    # \param budget: money left to spend
+    # \param target_ratio: tasks left per dollar left
+    def log_progress(self, budget, target_ratio):
+        logger = self.logger
+        logger.info('TIMENOW = {}'.format(self.now()))
+        logger.info('TASKS PROCESSED SO FAR = {}/{}'.format(self.tasks_sofar, self.in_tasks))
+        logger.info('MONEY SPENT SO FAR = {}/{} (user requested = {})'.format(self.spent_sofar, self.in_budget,
+                                                                              self._in_budget))
+        logger.info('MONEY LEFT TO SPEND = {} (user requested = {}) | TARGET RATIO = {}'.format(budget, self._in_budget,
+                                                                                               target_ratio))
+        logger.info('NUMBER OF INSTANCES RUNNING = {}/{}'.format(len(self.fleet), self.target_nodes))
+        logger.info('CSV\t{}\t{}'.format(((self.now() - self.time_start).total_seconds()), self.spent_sofar))
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("INSTANCES RUNNING")
+            for inst in self.fleet:
+                logger.debug(inst)
+
+    # function verify_fleet
+    # \param target_ratio: tasks left per dollar left
+    #
+    # Updates the validity counters (see decision_engine.verify) and
+    # terminates the instances whose counter reached zero.
+    def verify_fleet(self, target_ratio):
+        fleet = self.fleet
+        valid, terminate = self.engine.verify(fleet, target_ratio)
+        for inst, counter in valid:
+            if counter < inst.valid:
+                self.logger.debug("DECREASING COUNTER FOR INST " + inst.instance_id + "(" + inst.instance_type + "), NOW: " + str(counter))
+            fleet.set_valid(inst, counter)
+
+        for inst in terminate:
+            self.logger.debug('REMOVING INST ' + inst.instance_id)
+            with self.instruments.span("terminations"):
+                self.ops.terminateInstance(inst.instance_id)
+
+        fleet.remove_invalid()
+
+    # function select_candidates
+    # \return candidates (instance_record), best first
+    #
+    # If no instance type fits the budget left, the budget is increased by
+    # 10% until one does (see decision_engine.select).
+    def select_candidates(self):
+        with self.instruments.span("profile"):
+            self.profile.refresh()
+            all_performance = self.profile.rows()
+        profile = selection.profile_arrays(all_performance)
+        with self.instruments.span("prices"):
+            self.ops.prefetch_spot_prices(profile[0])
+            prices = selection.price_matrix(self.ops, profile[0], ALL_ZONES)
+
+        selection_start = time.monotonic()
+        candidates, in_budget, increases = self.engine.select(self.fleet.at, profile, prices, self.target_tasks,
+                                                              self.in_budget, self.spent_sofar)
+        self.instruments.add_span("selection", time.monotonic() - selection_start)
+
+        if (len(candidates) == 0):
+            self.logger.error("NO SPOT PRICE FOR ANY INSTANCE TYPE")
+        if (increases > 0):
+            self.logger.error("IMPOSSIBLE TO RUN EXPERIMENT WITH THIS CONFIGURATION")
+            self.logger.error("INCREASING BUDGET BY 10\% " + str(increases) + " TIME(S) (TO " + str(in_budget) + " USD)")
+        self.in_budget = in_budget
+
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("CANDIDATES")
+            for inst in candidates:
+                self.logger.debug(inst)
+
+        return candidates
+
+    # function launch
+    # \param candidates: candidates returned by select_candidates
+    #
+    # Launches the missing instances in waves (see decision_engine.plan_wave),
+    # all the requests of a wave at once.
+    def launch(self, candidates):
+        fleet = self.fleet
+        target_nodes = self.target_nodes
+
+        position = 0
+        counter = 0
+        while len(fleet) < target_nodes and counter < MAX_LAPS and len(candidates) > 0:
+            requests, position, laps = self.engine.plan_wave(candidates, target_nodes - len(fleet), position)
+            counter += laps
+
+            with self.instruments.span("launches"):
+                created = self.ops.createSpotInstances(requests, self.launch_timeout)
+            for instance_id, instance_type, az, price in created:
+                init_time = self.now().replace(microsecond=0)
+                fleet.add(instance_record(instance_id, instance_type, az, price, -1, init_time, self.valid_count))
+
+    # function tick
+    # \return whether there are tasks left (False when the execution ended)
+    #
+    # One iteration of the control loop: computes how much was spent and how
+    # many tasks were completed, terminates the instances that are constantly
+    # going over budget and launches new ones up to target_nodes.
+    def tick(self):
+        self.instruments.start_tick()
+
+        self.update_costs()
+        self.monitor_fleet()
+
+        self.spent_sofar = self.wk_spent_sofar + self.jm_spent_sofar
+
+        self.target_tasks = self.in_tasks - self.tasks_sofar
+        budget = self.in_budget - self.spent_sofar
+
+        target_ratio = self.engine.target_ratio(self.target_tasks, self.in_budget, self.spent_sofar)
+
+        self.log_progress(budget, target_ratio)
+
+        if (self.target_tasks <= 0):
+            return False
+
+        self.verify_fleet(target_ratio)
+
+        if (len(self.fleet) < self.target_nodes):
+            self.launch(self.select_candidates())
+
+        self.instruments.end_tick(self.logger, self.interval*60)
+        return True
+
+    # function run
+    # \param sleep: function that waits a number of seconds, time.sleep if None
+    # \param metrics_file: file where the instrumentation metrics are written
+    # after every iteration, None to not write them
+    def run(self, sleep=None, metrics_file=None):
+        if sleep is None:
+            sleep = time.sleep
+        while self.tick():
+            if metrics_file is not None:
+                self.instruments.write_file(metrics_file)
+
+            sleep(self.interval*60)
+
 # function main
 #
 # \param (command line input) interval : time to wait for the next iteration in minutes
 # \param (command line input) budget : budget in dollars to complete the execution
 # \param (command line input) data_hash : dataset hash stored in the database
 # \param (command line input) nodes : maximum number of instances running
+# \param (command line input) price_ttl : time in seconds that spot prices are cached (default 60)
+# \param (command line input) deadline : maximum time in seconds to gather the state of the running instances
+# (default half of the interval)
+# \param (command line input) monitor_workers : number of concurrent requests while gathering the state of the
+# running instances (default 16)
+# \param (command line input) launch_timeout : maximum time in seconds waiting for Spot requests (default 30)
+# \param (command line input) metrics_port : port of the HTTP endpoint with the instrumentation metrics (Prometheus
+# text format, see instrumentation.py), disabled if empty
+# \param (command line input) metrics_file : file where the instrumentation metrics are written after every
+# iteration, disabled if empty
+# \param (command line input) exclude : comma separated instance types that are never launched (e.g. p3.2xlarge)
 # (id parameters is set as default to 41, can be changed in code)
 #
 # Before the iterations loop, this function sets the input parameters and
 # initializes the database connection, getting the number dataset and how many
 # tasks need to be completed.
 #
-# The most important part is after the initialization, in which the program
-# computes how much was spent (considering a Job Manager of type c5.4xlarge
-# and a 20GB 1000IOPS disk) and how many tasks were completed. With those
-# values, it verifies if any instance is constantly going over budget,
+# The most important part is the iterations loop (job_manager.tick), in which
+# the program computes how much was spent (considering a Job Manager of type
+# c5.4xlarge and a 20GB 1000IOPS disk) and how many tasks were completed. With
+# those values, it verifies if any instance is constantly going over budget,
 # killing the ones that are and replacing them with instances that are not.
 #
 # If the experiment cannot continue due to budget constraints, then the budget
@@ -166,238 +454,53 @@ def main():
     if (valid_count == -1):
         valid_count = 1
 
-    all_zones = ['us-east-1a', 'us-east-1b', 'us-east-1c', 'us-east-1d', 'us-east-1e', 'us-east-1f']
-
-    idparameters = 41
+    price_ttl = float(get_from_input("price_ttl", input_dict))
+    if (price_ttl == -1):
+        price_ttl = 60
 
-    conn = rds_operations.rds_connect()
-    target_tasks = rds_operations.get_interpols(conn, idparameters, rds_operations.get_iddata(conn, data_hash))
-    iddata = rds_operations.get_iddata(conn, data_hash)
+    deadline = float(get_from_input("deadline", input_dict))
+    if (deadline == -1):
+        deadline = interval * 60 / 2
 
-    spent_sofar = 0
-    tasks_sofar = 0
+    monitor_workers = int(get_from_input("monitor_workers", input_dict))
+    if (monitor_workers == -1):
+        monitor_workers = 16
 
-    in_budget = budget
-    _in_budget = in_budget
-    in_tasks = target_tasks
+    launch_timeout = float(get_from_input("launch_timeout", input_dict))
+    if (launch_timeout == -1):
+        launch_timeout = 30
 
-    pareto(target_nodes, data_hash, idparameters)
+    metrics_port = int(get_from_input("metrics_port", input_dict))
+    metrics_file = get_from_input("metrics_file", input_dict)
+    if (metrics_file == -1):
+        metrics_file = None
 
-    tasks_str = 'TASKS PROCESSED SO FAR = {}/{}'
-    money_str = 'MONEY SPENT SO FAR = {}/{} (user requested = {})'
-    money_left_str = 'MONEY LEFT TO SPEND = {} (user requested = {}) | TARGET RATIO = {}'
-    instances_str = 'NUMBER OF INSTANCES RUNNING = {}/{}'
-    simulated_time = 'TIMENOW = {}'
+    excluded = get_from_input("exclude", input_dict)
+    if (excluded == -1):
+        excluded = ""
+    excluded = [instance_type for instance_type in excluded.split(",") if instance_type]
 
-    ops = instance_operations(logger)
-    time_start = ops.get_jobmanager_init_time()
-
-    ec2 = boto3.client('ec2', region_name='us-east-1')
-    cloudwatch = boto3.client('cloudwatch')
-
-    log_to_csv = 'CSV\t{}\t{}'
-
-    time_spent = 0
-
-    run_dict = {}
-    wk_spent_sofar = 0
-    jm_spent_sofar = 0
-    ec2_res = boto3.resource('ec2', region_name='us-east-1')
-    #time.sleep(180)
-    while target_tasks > 0:
-        # Update cost
-        jm_diff = (datetime.utcnow() - time_start)
-        jm_spent_sofar = jm_diff.total_seconds() * (0.68+0.09375) / 3600
-
-        for key,inst in run_dict.items():
-            diff = datetime.utcnow() - inst["cur_time"]
-            inst["cur_time"] = datetime.utcnow()
-            wk_spent_sofar += float(inst["price"]) * diff.total_seconds() / 3600
-            inst["prev_valid"] = inst["valid"]
-            inst["valid"] = 0
-
-        # Verifies running instances
-        instance_reservations = ops.get_instance_reservations()
-        for instance in instance_reservations['Reservations']:
-            instance_id = instance['Instances'][0]['InstanceId']
-            instance_type = instance['Instances'][0]['InstanceType']
-            instance_az = instance['Instances'][0]['Placement']['AvailabilityZone']
-
-            ec2_instance = ec2_res.Instance(instance_id)
-            init_time = datetime.strptime(ec2_instance.launch_time.strftime("%Y-%m-%dT%H:%M:%S"), "%Y-%m-%dT%H:%M:%S")
-
-            result = cloudwatch.get_metric_statistics(Namespace='Performance',
-                                                      MetricName='perf_sec',
-                                                      StartTime=(datetime.today() - timedelta(minutes=2*interval)),
-                                                      Dimensions=[{'Name': 'Instance Id', 'Value': instance_id},
-                                                                  {'Name': 'Type', 'Value': instance_type}],
-                                                      EndTime=datetime.today(),
-                                                      Period=60,
-                                                      Statistics=['Average'])
-
-            tasks_completed = cloudwatch.get_metric_statistics(Namespace='Performance',
-                                                      MetricName='tasks_completed',
-                                                      StartTime=(datetime.today() - timedelta(minutes=2*interval)),
-                                                      Dimensions=[{'Name': 'Instance Id', 'Value': instance_id},
-                                                                  {'Name': 'Type', 'Value': instance_type}],
-                                                      EndTime=datetime.today(),
-                                                      Period=60,
-                                                      Statistics=['Maximum'])
-
-            result_stdev = cloudwatch.get_metric_statistics(Namespace='Performance',
-                                                            MetricName='perf_sec_stdev',
-                                                            StartTime=(datetime.today() - timedelta(minutes=2*interval)),
-                                                            Dimensions=[{'Name': 'Instance Id', 'Value': instance_id},
-                                                                        {'Name': 'Type', 'Value': instance_type}],
-                                                            EndTime=datetime.today(),
-                                                            Period=60,
-                                                            Statistics=['Average'])
-
-            if tasks_completed['Datapoints']:
-                if (tasks_completed['Datapoints'][0]['Maximum']) > tasks_sofar:
-                    tasks_sofar = tasks_completed['Datapoints'][0]['Maximum']
-
-            if not instance_id in run_dict:
-                if result['Datapoints'] and result_stdev['Datapoints']:
-                    price = ops.get_current_spot_price(instance_type, instance_az) + 0.09375
-                    performance_negative = float(result['Datapoints'][0]['Average']) - float(
-                        result_stdev['Datapoints'][0]['Average'])
-
-                    instance_dict = {"instance_id":instance_id,
-                                     "instance_type":instance_type,
-                                     "instance_az":instance_az,
-                                     "price":price,
-                                     "performance_negative":performance_negative,
-                                     "init_time":init_time,
-                                     "cur_time": init_time,
-                                     "valid":valid_count,
-                                     "prev_valid": valid_count}
-
-                    run_dict[instance_id] = instance_dict
-                else:
-                    price = ops.get_current_spot_price(instance_type, instance_az) + 0.09375
-                    instance_dict = {"instance_id": instance_id,
-                                     "instance_type": instance_type,
-                                     "instance_az": instance_az,
-                                     "price": price,
-                                     "performance_negative": -1,
-                                     "init_time": init_time,
-                                     "cur_time": init_time,
-                                     "valid": valid_count,
-                                     "prev_valid":valid_count}
-                    run_dict[instance_id] = instance_dict
-            else:
-                instance_dict = run_dict[instance_id]
-                instance_dict["valid"] = instance_dict["prev_valid"]
-
-                if result['Datapoints'] and result_stdev['Datapoints']:
-                    instance_dict["price"] = ops.get_current_spot_price(instance_type, instance_az) + 0.09375
-                    instance_dict["performance_negative"] = float(result['Datapoints'][0]['Average']) - float(result_stdev['Datapoints'][0]['Average'])
-
-        spent_sofar = wk_spent_sofar + jm_spent_sofar
-
-        target_tasks = in_tasks - tasks_sofar
-        budget = in_budget - spent_sofar
-
-        target_ratio = target_tasks / budget
+    idparameters = 41
 
-        logger.info(simulated_time.format(datetime.now()))
-        logger.info(tasks_str.format(tasks_sofar, in_tasks))
-        logger.info(money_str.format(spent_sofar, in_budget, _in_budget))
-        logger.info(money_left_str.format(budget, _in_budget, target_ratio))
-        logger.info(instances_str.format(len(run_dict.keys()), target_nodes))
-        logger.info(log_to_csv.format(((datetime.utcnow() - time_start).total_seconds()),spent_sofar))
+    # Time of each phase of the iterations and number of AWS and database
+    # requests (the AWS clients must be created after attach_boto3)
+    instruments = instrumentation()
+    instruments.attach_boto3()
+    instruments.attach_database()
+    if (metrics_port != -1):
+        instruments.serve(metrics_port)
 
-        logger.debug("INSTANCES RUNNING")
-        for key,inst in run_dict.items():
-            logger.debug(inst)
+    conn = rds_operations.rds_connect()
 
-        if (target_tasks <= 0):
-            break
+    ops = instance_operations(logger, price_ttl)
 
-        for key,inst in run_dict.items():
-            if (inst["performance_negative"]/(inst["price"]/3600) < target_ratio or inst["performance_negative"] == -1):
-                inst["valid"] -= 1
-                logger.debug("DECREASING COUNTER FOR INST " + inst["instance_id"] + "(" + inst["instance_type"] + "), NOW: " + str(inst["valid"]))
-            else:
-                inst["valid"] = min(inst["valid"] + 1, valid_count)
-
-            if (inst["valid"] <= 0):
-                logger.debug('REMOVING INST ' + inst["instance_id"])
-                ops.terminateInstance(inst["instance_id"])
-
-
-        for key in list(run_dict.keys()):
-            if run_dict[key]["valid"] <= 0:
-                del run_dict[key]
-
-        if (len(list(run_dict.keys())) < target_nodes):
-            candidates = []
-
-            while len(candidates) == 0:
-                budget = in_budget - spent_sofar
-                target_ratio = target_tasks / budget
-                all_performance = rds_operations.get_interpsec_allinstances(conn, iddata, idparameters)
-
-                for result in all_performance:
-                    instance_type = result[0]
-                    interpsec = result[1]
-                    stddev_interpsec = result[2]
-
-                    prices = ops.get_current_spot_price_allaz(instance_type)
-
-                    for az in prices:
-                        price = prices[az] + 0.09375
-                        costperinterp = float(interpsec / (price / 3600))
-                        costperinterp_stdev = float(stddev_interpsec / (price / 3600))
-                        costperinterp_negative = costperinterp - costperinterp_stdev
-
-                        instance_dict = {"instance_id": "inactive",
-                                         "instance_type": instance_type,
-                                         "instance_az": az,
-                                         "price": price,
-                                         "performance_negative": interpsec,
-                                         }
-
-                        if costperinterp_negative > target_ratio:
-                            temp = [inst for inst in run_dict.values() if inst['instance_type'] == instance_type and inst['instance_az'] == az]
-                            if (len(temp) == 0):
-                                candidates.append(instance_dict)
-                            else:
-                                for inst in temp:
-                                    if (inst not in candidates):
-                                        candidates.append(inst)
-
-                candidates.sort(key=operator.itemgetter('performance_negative'), reverse=True)
-
-                if (len(candidates) == 0):
-                    logger.error("IMPOSSIBLE TO RUN EXPERIMENT WITH THIS CONFIGURATION")
-                    in_budget += in_budget / 10
-                    logger.error("INCREASING BUDGET BY 10\% (TO " + str(in_budget) + " USD)")
-
-            logger.debug("CANDIDATES")
-            for inst in candidates:
-                logger.debug(inst)
+    pareto(target_nodes, data_hash, idparameters, ops)
 
-            k = 0
-            counter = 0
-            while len(run_dict.keys()) < target_nodes and counter < 5:
-                threads = []
-                num_threads = min(target_nodes - len(run_dict.keys()), int(target_nodes/5))
-                # Replace instances
-                for i in range(0, num_threads):
-                    thr = threading.Thread(target=ops.createSpotInstanceThreads, args=(candidates[k]['instance_type'], candidates[k]['instance_az'], candidates[k]['price'],valid_count,run_dict))
-                    thr.start()
-                    threads.append(thr)
-
-                for thr in threads:
-                    thr.join()
-
-                k = (k + 1) % len(candidates)
-                if k == 0:
-                    counter += 1
-
-        time.sleep(interval*60)
+    cloudwatch = boto3.client('cloudwatch')
+    manager = job_manager(logger, ops, cloudwatch, conn, data_hash, budget, target_nodes, interval, valid_count,
+                          deadline, monitor_workers, launch_timeout, instruments, idparameters=idparameters,
+                          excluded=excluded)
+    manager.run(metrics_file=metrics_file)
 
 if __name__ == "__main__":
     logger = getLogger(__name__)
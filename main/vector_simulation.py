@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2019 Nicholas Torres Okita <nicholas.okita@ggaunicamp.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+# This file contains a vectorized version of the fixed step simulation
+# (simulation.simulator in the "step" mode). Instead of one replica with a
+# list of running instances, R replicas with N instance slots each are kept in
+# NumPy arrays (instance type, availability zone, interpsec and alive mask) and
+# every iteration of the control loop (failures, performance oscillation,
+# money spent, removal of instances over budget and creation of new ones) is
+# executed for all replicas at once.
+#
+# All replicas share the simulated clock, so the prices are looked up once per
+# iteration. The random numbers come from a single seeded numpy Generator,
+# therefore the results are reproducible (but are not the same trajectories
+# as the replicas of monte_carlo.py, which draw numbers in another order).
+#
+# The policy is a vectorized approximation of decision_engine.py with
+# valid_count 1: instances are created one attempt at a time (a failed
+# creation moves to the next candidate) instead of in waves of Spot requests,
+# and running instances are not counted among the candidates. As in
+# decision_engine.plan_wave, the candidates of a replica are gone through at
+# most MAX_LAPS times per iteration, so a replica whose creations keep failing
+# waits for the next iteration with fewer instances.
+
+import numpy as np
+import selection
+from decision_engine import MAX_LAPS
+
+class vector_simulator:
+
+    # function __init__
+    # \param provider: pseudo_instance_operations object (prices and clock)
+    # \param profile: (instance types, interpsec, stddev) as returned by
+    # selection.profile_arrays
+    # \param jm_interpsec: performance row of the Job Manager instance type
+    # \param in_tasks: number of tasks to be executed
+    # \param in_budget: budget in dollars to complete the execution
+    # \param target_nodes: number of instances running (slots per replica)
+    # \param time_skip: time between two iterations of the control loop in minutes
+    # \param failure_create: failure rate when creating an instance
+    # \param failure_exec: failure rate (per iteration) while instance is running
+    # \param zones: list of availability zones
+    # \param replicas: number of replicas
+    # \param rng: numpy Generator (for example np.random.default_rng(seed))
+    # \param excluded: instance types that are never launched
+    def __init__(self, provider, profile, jm_interpsec, in_tasks, in_budget, target_nodes, time_skip,
+                 failure_create, failure_exec, zones, replicas, rng, excluded=()):
+        self.provider = provider
+        self.instance_types, self.interpsec, self.stddev_interpsec = profile
+        self.allowed = np.array([instance_type not in excluded for instance_type in self.instance_types], dtype=bool)
+        self.jm_interpsec = (float(jm_interpsec[1]), float(jm_interpsec[2] or 0))
+        self.in_tasks = in_tasks
+        self.target_nodes = target_nodes
+        self.time_skip = time_skip
+        self.failure_create = failure_create
+        self.failure_exec = failure_exec
+        self.zones = zones
+        self.replicas = replicas
+        self.rng = rng
+        self.time_now = 0
+
+        shape = (replicas, target_nodes)
+        self.type_idx = np.zeros(shape, dtype=np.int64)
+        self.az_idx = np.zeros(shape, dtype=np.int64)
+        self.rate = np.zeros(shape, dtype=np.float64)
+        self.alive = np.zeros(shape, dtype=bool)
+
+        self.tasks = np.zeros(replicas, dtype=np.float64)
+        self.wk_spent = np.zeros(replicas, dtype=np.float64)
+        self.jm_spent = np.zeros(replicas, dtype=np.float64)
+        self.budget = np.full(replicas, float(in_budget))
+        self.active = np.ones(replicas, dtype=bool)
+        self.time_done = np.zeros(replicas, dtype=np.float64)
+
+    # function set_time
+    # \param now: simulated time in minutes
+    # Moves the clock of the provider to the simulated time
+    def set_time(self, now):
+        self.provider.add_minutes(now - self.time_now)
+        self.time_now = now
+
+    # function candidates
+    # \param prices: matrix (types x zones) with the spot prices
+    # \return (type_idx, az_idx, costperinterp_negative) of every pair that
+    # can be selected, best performance first (the same order as
+    # selection.score_candidates)
+    def candidates(self, prices):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            valid = np.isfinite(prices) & (prices > 0) & self.allowed[:, None]
+            price = prices + selection.DISK_COST
+            negative = (self.interpsec[:, None] - self.stddev_interpsec[:, None]) / (price / 3600)
+
+        type_idx, az_idx = np.nonzero(valid)
+        order = np.argsort(-self.interpsec[type_idx], kind="stable")
+        type_idx = type_idx[order]
+        az_idx = az_idx[order]
+
+        return type_idx, az_idx, negative[type_idx, az_idx]
+
+    # function create_instances
+    # \param prices: matrix (types x zones) with the spot prices
+    # \param need: boolean vector with the replicas missing instances
+    #
+    # For every replica missing instances, filters the candidates by its own
+    # target ratio (increasing its budget by 10% until there is at least one)
+    # and creates instances from the best candidate to the worst, as
+    # simulation.simulator.create_instances: a failed creation moves to the
+    # next candidate, and so does every wave of target_nodes/5 attempts. One
+    # creation attempt of every replica is made per array operation, until it
+    # has target_nodes instances or went through its candidates MAX_LAPS
+    # times.
+    def create_instances(self, prices, need):
+        cand_type, cand_az, cand_negative = self.candidates(prices)
+        if len(cand_type) == 0:
+            raise ValueError("NO INSTANCE TYPE HAS A PRICE AT THE SIMULATED TIME")
+
+        spent = self.wk_spent + self.jm_spent
+        while True:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                target_ratio = (self.in_tasks - self.tasks) / (self.budget - spent)
+            selected = cand_negative[None, :] > target_ratio[:, None]
+            count = selected.sum(axis=1)
+            empty = need & (count == 0)
+            if not empty.any():
+                break
+            self.budget[empty] += self.budget[empty] / 10
+
+        # Positions of the selected candidates of each replica first, keeping
+        # their order, so the k-th candidate of replica r is order[r, k]
+        order = np.argsort(~selected, axis=1, kind="stable")
+        k = np.zeros(self.replicas, dtype=np.int64)
+        attempts = np.zeros(self.replicas, dtype=np.int64)
+        wave = max(1, int(self.target_nodes/5))
+
+        while need.any():
+            rows = np.nonzero(need)[0]
+            cand = order[rows, k[rows] % count[rows]]
+            created = self.rng.random(len(rows)) > self.failure_create
+
+            rows_created = rows[created]
+            cand_created = cand[created]
+            slots = np.argmin(self.alive[rows_created], axis=1)
+            self.alive[rows_created, slots] = True
+            self.type_idx[rows_created, slots] = cand_type[cand_created]
+            self.az_idx[rows_created, slots] = cand_az[cand_created]
+            self.rate[rows_created, slots] = self.interpsec[cand_type[cand_created]]
+
+            k[rows[~created]] += 1
+            attempts[rows] += 1
+            k[rows[attempts[rows] % wave == 0]] += 1
+
+            need = need & (self.alive.sum(axis=1) < self.target_nodes)
+            need[rows] &= k[rows] // count[rows] < MAX_LAPS
+
+    # function tick
+    # \param now: simulated time in minutes
+    #
+    # One iteration of the control loop for every replica that did not finish
+    # yet, equivalent to simulation.simulator.step_tick. Every instance may
+    # fail independently (the original loop skips the instance after one that
+    # failed).
+    def tick(self, now):
+        self.set_time(now)
+        time_skip = self.time_skip
+
+        prices = selection.price_matrix(self.provider, self.instance_types, self.zones)
+        running_prices = np.where(np.isnan(prices), -1, prices) + selection.DISK_COST
+
+        live = self.alive & self.active[:, None]
+        price = running_prices[self.type_idx, self.az_idx]
+        self.wk_spent += np.where(live, price, 0).sum(axis=1) * time_skip / 60
+
+        negative_bias = (live.sum(axis=1) - 1) / 1000
+        failed = live & (self.rng.random(live.shape) < self.failure_exec)
+        noise = self.rng.uniform(0.9 - negative_bias[:, None], 1.1 - negative_bias[:, None], live.shape)
+        self.tasks += np.where(live & ~failed, self.rate * noise, 0).sum(axis=1) * time_skip * 60
+        self.alive &= ~failed
+
+        jm_low = self.jm_interpsec[0] - self.jm_interpsec[1]
+        jm_high = self.jm_interpsec[0] + self.jm_interpsec[1]
+        jm_rate = self.rng.uniform(jm_low, jm_high, self.replicas)
+        self.tasks += np.where(self.active, jm_rate, 0) * time_skip * 60
+        self.jm_spent += np.where(self.active, 0.68 * time_skip / 60, 0)
+
+        spent = self.wk_spent + self.jm_spent
+        target_tasks = self.in_tasks - self.tasks
+
+        done = self.active & (target_tasks <= 0)
+        self.time_done[done] = now
+        self.active &= ~done
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            target_ratio = target_tasks / (self.budget - spent)
+            over_budget = self.rate / (price / 3600) < target_ratio[:, None]
+        self.alive &= ~(over_budget & self.active[:, None])
+
+        need = self.active & (self.alive.sum(axis=1) < self.target_nodes)
+        if need.any():
+            self.create_instances(prices, need)
+
+    # function run
+    # \param until: optional limit of simulated time in minutes
+    # \return dictionary of arrays, one element per replica: time (simulated
+    # minutes), spent (dollars), tasks, budget (final budget, after the
+    # increases) and finished, as monte_carlo.run
+    def run(self, until=None):
+        now = 0
+        while self.active.any() and (until is None or now <= until):
+            self.tick(now)
+            now += self.time_skip
+
+        self.time_done[self.active] = self.time_now
+
+        return {"time": self.time_done.copy(),
+                "spent": self.wk_spent + self.jm_spent,
+                "tasks": self.tasks.copy(),
+                "budget": self.budget.copy(),
+                "finished": ~self.active}
+
+# function run
+# \param scenario: dictionary as created by monte_carlo.make_scenario (only
+# the "step" mode with valid_count 1 is simulated)
+# \param replicas: number of replicas
+# \param seed: seed of the numpy Generator (None for a random one)
+# \param series: prices already loaded by pseudo_instance_operations.load_prices
+# \return dictionary of arrays, as vector_simulator.run
+def run(scenario, replicas, seed=None, series=None):
+    from pseudo_instance_operations import pseudo_instance_operations
+
+    if scenario["valid_count"] != 1:
+        raise ValueError("THE VECTOR SIMULATION ONLY SUPPORTS VALID_COUNT 1")
+
+    provider = pseudo_instance_operations(scenario["price_file"], series=series)
+    sim = vector_simulator(provider, scenario["profile"], scenario["jm_interpsec"], scenario["target_tasks"],
+                           scenario["budget"], scenario["nodes"], scenario["time_skip"], scenario["failure_create"],
+                           scenario["failure_exec"], scenario["zones"], replicas, np.random.default_rng(seed),
+                           scenario["excluded"])
+
+    return sim.run(scenario["max_time"])
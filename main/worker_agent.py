@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2019 Nicholas Torres Okita <nicholas.okita@ggaunicamp.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+# This file contains the worker agent, which produces the performance metrics
+# read by the Job Manager (see README.md and cloudwatch_metrics.py):
+#
+# - perf_sec: mean number of interpolations per second in the last
+# stats_window seconds
+# - perf_sec_stdev: standard deviation of the same samples
+# - tasks_completed: number of tasks completed
+#
+# The agent runs on each worker. Every sample seconds it reads the progress
+# of the program from a file, written by the program, with the number of
+# interpolations done by the worker and (optionally) the number of tasks
+# completed, both cumulative. The interpolations per second between two
+# readings are a sample. The mean and standard deviation of the samples
+# inside the window are updated as samples arrive and leave (Welford's
+# algorithm), so nothing is recomputed over the whole window.
+#
+# Every period seconds the three metrics are sent together in a single
+# put_metric_data request. Once per stats_window seconds, the mean of the
+# window (samples that were not stored before) is also stored as a performance
+# measurement (interpsec) for future executions, through the measurement
+# collector when rds_config.collector_url is set (see measurement_collector.py)
+# and directly in the database otherwise. Storing every report would make the
+# table grow with every minute of every worker and give long executions much
+# more weight in the statistics of each instance type than short ones:
+#
+# python worker_agent.py progress=progress.txt aph=... apm=... window=... np=... gens=... data_hash=... period=60
+
+import collections
+import logging
+import math
+import sys
+import time
+import boto3
+import requests
+import measurement_collector
+import rds_config
+import rds_operations
+
+# Namespace of the metrics (the one read by cloudwatch_metrics.py)
+NAMESPACE = 'Performance'
+
+# Default time in seconds between two readings of the progress
+SAMPLE_INTERVAL = 5
+
+# Default time in seconds between two reports
+PERIOD = 60
+
+# Default length in seconds of the window of the statistics
+STATS_WINDOW = 300
+
+# function get_metadata
+# \param name: name of the instance metadata (e.g. instance-id)
+# \return String containing the metadata of the instance
+def get_metadata(name):
+    response = requests.get('http://169.254.169.254/latest/meta-data/' + name)
+    return str(response.text)
+
+class window_statistics:
+
+    # function __init__
+    # \param window: length of the window in seconds
+    def __init__(self, window):
+        self.window = window
+        self.samples = collections.deque()
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    # function add
+    # \param timestamp: time of the sample in seconds
+    # \param value: sample
+    def add(self, timestamp, value):
+        self.samples.append((timestamp, value))
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    # function expire
+    # \param now: current time in seconds
+    # Removes the samples older than the window
+    def expire(self, now):
+        while self.samples and self.samples[0][0] < now - self.window:
+            timestamp, value = self.samples.popleft()
+            self.count -= 1
+            if self.count == 0:
+                self.mean = 0.0
+                self.m2 = 0.0
+            else:
+                delta = value - self.mean
+                self.mean -= delta / self.count
+                self.m2 -= delta * (value - self.mean)
+
+    # function stddev
+    # \return population standard deviation of the samples in the window
+    def stddev(self):
+        if self.count == 0:
+            return 0.0
+        return math.sqrt(max(self.m2, 0) / self.count)
+
+class worker_agent:
+
+    # function __init__
+    # \param logger: logger object
+    # \param cloudwatch: CloudWatch client
+    # \param instance_id: id of the worker instance
+    # \param instance_type: type of the worker instance
+    # \param stats_window: length in seconds of the window of the statistics
+    # \param report_interpsec: function called with the mean of each window
+    # (stores it as a performance measurement), None to not store them
+    def __init__(self, logger, cloudwatch, instance_id, instance_type, stats_window=STATS_WINDOW,
+                 report_interpsec=None):
+        self.logger = logger
+        self.cloudwatch = cloudwatch
+        self.instance_id = instance_id
+        self.instance_type = instance_type
+        self.stats = window_statistics(stats_window)
+        self.report_interpsec = report_interpsec
+        # Time of the first reading whose samples were not stored yet
+        self.window_start = None
+        self.last = None
+        self.tasks_completed = 0
+
+    # function sample
+    # \param interpolations: interpolations done by the worker so far
+    # \param tasks_completed: tasks completed so far
+    # \param now: time of the reading in seconds (time.time() if None)
+    def sample(self, interpolations, tasks_completed, now=None):
+        if now is None:
+            now = time.time()
+
+        if self.last is not None and now > self.last[0] and interpolations >= self.last[1]:
+            self.stats.add(now, (interpolations - self.last[1]) / (now - self.last[0]))
+        if self.window_start is None:
+            self.window_start = now
+        self.last = (now, interpolations)
+        self.tasks_completed = max(self.tasks_completed, tasks_completed)
+        self.stats.expire(now)
+
+    # function metric_data
+    # \return MetricData of the put_metric_data request (perf_sec and
+    # perf_sec_stdev are only sent if there are samples in the window)
+    def metric_data(self):
+        dimensions = [{'Name': 'Instance Id', 'Value': self.instance_id},
+                      {'Name': 'Type', 'Value': self.instance_type}]
+        data = [{'MetricName': 'tasks_completed', 'Dimensions': dimensions, 'Value': float(self.tasks_completed)}]
+        if self.stats.count > 0:
+            data.append({'MetricName': 'perf_sec', 'Dimensions': dimensions, 'Value': self.stats.mean})
+            data.append({'MetricName': 'perf_sec_stdev', 'Dimensions': dimensions, 'Value': self.stats.stddev()})
+
+        return data
+
+    # function publish
+    # \param now: current time in seconds (time.time() if None)
+    #
+    # Sends the metrics in a single put_metric_data request and, if a whole
+    # window passed since the last measurement stored, stores the mean as a
+    # performance measurement. Errors are logged and the next report is sent
+    # normally.
+    def publish(self, now=None):
+        if now is None:
+            now = time.time()
+        self.stats.expire(now)
+
+        try:
+            self.cloudwatch.put_metric_data(Namespace=NAMESPACE, MetricData=self.metric_data())
+        except Exception as e:
+            self.logger.error("COULD NOT PUBLISH METRICS (" + str(e) + ")")
+
+        if self.report_interpsec is not None and self.window_start is not None and \
+                now - self.window_start >= self.stats.window and self.stats.count > 0 and self.stats.mean > 0:
+            self.window_start = now
+            try:
+                self.report_interpsec(self.stats.mean)
+            except Exception as e:
+                self.logger.error("COULD NOT STORE PERFORMANCE (" + str(e) + ")")
+
+# function read_progress
+# \param filename: progress file, with the interpolations done and
+# (optionally) the tasks completed separated by white space
+# \return (interpolations, tasks_completed), None if the file could not be
+# read
+def read_progress(filename):
+    try:
+        with open(filename) as progress_f:
+            values = [float(value) for value in progress_f.read().split()]
+    except (IOError, OSError, ValueError):
+        return None
+    if len(values) == 0:
+        return None
+
+    return values[0], values[1] if len(values) > 1 else values[0]
+
+# function interpsec_reporter
+# \param aph: aperture in half offsets
+# \param apm: aperture in midpoints
+# \param window: time window
+# \param np: Number of members in population
+# \param gens: Number of generations
+# \param data_hash: Data md5sum
+# \param instance_type: type of the worker instance
+# \return function that stores a performance measurement of the experiment
+def interpsec_reporter(aph, apm, window, np, gens, data_hash, instance_type):
+    record = {"aph": aph, "apm": apm, "window": window, "np": np, "gens": gens, "data_hash": data_hash,
+              "instance_type": instance_type}
+    ids = {}
+
+    def report(interpsec):
+        if rds_config.collector_url != "":
+            measurement_collector.send(rds_config.collector_url, "interpsec", dict(record, interpsec=interpsec),
+                                       rds_config.collector_spool)
+            return
+
+        conn = rds_operations.rds_connect()
+        if "idexperiment" not in ids:
+            idparameters = rds_operations.get_idparameters(conn, aph, apm, window, np, gens)
+            iddata = rds_operations.get_iddata(conn, data_hash)
+            ids["idexperiment"] = rds_operations.get_idexperiment(conn, iddata, idparameters, instance_type)
+        rds_operations.insert_interpsec(conn, ids["idexperiment"], interpsec)
+
+    return report
+
+# function get_from_input
+#
+# \param _string: String to be searched from input
+# \param input_dict: Input dictionary of pairs key=value
+# \return Value stored for _string or -1 if it does not exist
+def get_from_input(_string, input_dict):
+    if _string in input_dict:
+        return input_dict[_string]
+    else:
+        return -1
+
+# function main
+# \param (command line input) progress : file with the progress of the program (interpolations done and tasks
+# completed)
+# \param (command line input) aph, apm, window, np, gens, data_hash : configuration of the experiment, used to
+# store the performance measurements (if data_hash is not given they are not stored)
+# \param (command line input) sample : time in seconds between two readings of the progress (default 5)
+# \param (command line input) period : time in seconds between two reports (default 60)
+# \param (command line input) stats_window : length in seconds of the window of the statistics (default 300)
+def main():
+    input_dict = {}
+    for cur in sys.argv:
+        if '=' in cur:
+            key, val = cur.split('=')
+            input_dict.update({key: val})
+
+    progress = get_from_input("progress", input_dict)
+
+    sample = float(get_from_input("sample", input_dict))
+    if (sample == -1):
+        sample = SAMPLE_INTERVAL
+
+    period = float(get_from_input("period", input_dict))
+    if (period == -1):
+        period = PERIOD
+
+    stats_window = float(get_from_input("stats_window", input_dict))
+    if (stats_window == -1):
+        stats_window = STATS_WINDOW
+
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(levelname)-8s %(message)s")
+    logger = logging.getLogger(__name__)
+
+    instance_id = get_metadata('instance-id')
+    instance_type = get_metadata('instance-type')
+
+    report_interpsec = None
+    data_hash = get_from_input("data_hash", input_dict)
+    if (data_hash != -1):
+        report_interpsec = interpsec_reporter(float(input_dict["aph"]), float(input_dict["apm"]),
+                                              float(input_dict["window"]), int(input_dict["np"]),
+                                              int(input_dict["gens"]), data_hash, instance_type)
+
+    agent = worker_agent(logger, boto3.client('cloudwatch'), instance_id, instance_type, stats_window,
+                         report_interpsec)
+
+    next_report = time.time() + period
+    try:
+        while True:
+            values = read_progress(progress)
+            if values is not None:
+                agent.sample(*values)
+            if time.time() >= next_report:
+                agent.publish()
+                next_report += period
+            time.sleep(sample)
+    except KeyboardInterrupt:
+        agent.publish()
+
+if __name__ == "__main__":
+    main()